@@ -0,0 +1,360 @@
+"""
+the collection benchmark of the collector against the dummy modbus servers
+
+    python -m benchmarks.collector --schedules 100 --interval 1 \
+        --duration 30 --output results.json
+    python -m benchmarks.collector --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import subprocess
+import multiprocessing
+from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from benchmarks.devices import DeviceProcess, FRAMERS
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# all the 30 registers of the dummy servers
+SCRIPT = '''def main():
+    return read_holding_registers('-a 40001 -c 30')
+'''
+TEMPLATE = [
+    dict(key=f'data{i:02}', note=None, type=t, scale=None)
+    for i, t in enumerate((
+        'B64_STRING', 'B32_STRING', 'B16_STRING', 'B8_STRING', 'B8_STRING',
+        'B64_UINT', 'B64_INT', 'B32_UINT', 'B32_INT', 'B16_UINT', 'B16_INT',
+        'B8_UINT', 'B8_INT', 'B64_FLOAT', 'B32_FLOAT', 'B16_FLOAT'), 1)
+]
+ENGINES = ('thread', 'asyncio')
+# the results compared with the baseline and if the higher is the better
+COMPARED = (
+    ('samples_per_sec', True),
+    ('latency_ms.p50', False),
+    ('latency_ms.p99', False),
+    ('missed', False),
+    ('skipped', False),
+    ('errors', False),
+    ('cpu_percent', False),
+    ('rss_mb', False),
+)
+
+
+###############################################################################
+def make_schedules(count, addresses, comm, interval):
+    """
+    the schedules spread over the addresses of the devices
+    """
+    schedules = list()
+    for i in range(count):
+        host, port = addresses[i % len(addresses)]
+        schedules.append(dict(
+            schedule_name=f'bench-{comm}-{i:04}',
+            description='benchmark',
+            comm=dict(type=comm, setting=dict(host=host, port=port)),
+            trigger=dict(type='interval', setting=dict(seconds=interval)),
+            default_template='bench',
+            templates=dict(bench=dict(code=SCRIPT, template=TEMPLATE))))
+    return schedules
+
+
+###############################################################################
+def percentiles(values, points=(50, 90, 99)):
+    if not values:
+        return dict.fromkeys([f'p{p}' for p in points] + ['max'])
+    values = sorted(values)
+    result = {f'p{p}': values[min(len(values) - 1,
+                                  int(p / 100 * len(values)))]
+              for p in points}
+    result['max'] = values[-1]
+    return result
+
+
+###############################################################################
+def rss_mb():
+    """
+    the resident memory of this process now. the peak if it is not known
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+
+###############################################################################
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes on the others
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+###############################################################################
+class Recorder:
+    """
+    the listener of the scheduler counting the runs in the measured window.
+    the latency of a run is from the time it is scheduled to its end
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.recording = False
+        self.latencies = list()
+        self.errors = 0
+        self.missed = 0
+        self.skipped = 0
+
+    # =========================================================================
+    def __call__(self, event):
+        if not self.recording:
+            return
+        finished = time.time()
+        with self._lock:
+            if event.code == EVENT_JOB_MISSED:
+                self.missed += 1
+            elif event.code == EVENT_JOB_MAX_INSTANCES:
+                self.skipped += 1
+            elif event.code == EVENT_JOB_ERROR:
+                self.errors += 1
+            else:
+                self.latencies.append(
+                    finished - event.scheduled_run_time.timestamp())
+
+
+###############################################################################
+def make_collector(engine, max_connections, coalesce_window):
+    if engine == 'asyncio':
+        from restful_modbus_api.async_manager import AsyncCollector
+        collector = AsyncCollector()
+    else:
+        from restful_modbus_api.manager import Collector
+        collector = Collector()
+    collector.connection_pool.max_connections = max_connections
+    collector.request_coalescer.window = coalesce_window
+    return collector
+
+
+###############################################################################
+def run_case(comm, engine, addresses, options):
+    """
+    the collection of the schedules of one comm type by one engine
+    :return: the result of the case
+    """
+    collector = make_collector(engine, options['max_connections'],
+                               options['coalesce_window'])
+    recorder = Recorder()
+    collector.scheduler.add_listener(
+        recorder, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED
+        | EVENT_JOB_MAX_INSTANCES)
+    schedules = make_schedules(options['schedules'], addresses, comm,
+                               options['interval'])
+    try:
+        collector.add_job_schedules(schedules)
+        time.sleep(options['warmup'])
+
+        recorder.recording = True
+        started, cpu_started = time.perf_counter(), time.process_time()
+        time.sleep(options['duration'])
+        recorder.recording = False
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        memory = rss_mb()
+        # not to stop the runs in the middle
+        collector.scheduler.pause()
+        for schedule in schedules:
+            collector.wait_until(schedule['schedule_name'], 5)
+    finally:
+        collector.shutdown()
+
+    latencies = [x * 1000 for x in recorder.latencies]
+    return dict(
+        comm=comm, engine=engine,
+        schedules=options['schedules'], devices=len(addresses),
+        interval=options['interval'], duration=elapsed,
+        samples=len(latencies),
+        samples_per_sec=len(latencies) / elapsed,
+        expected_per_sec=options['schedules'] / options['interval'],
+        latency_ms=percentiles(latencies),
+        missed=recorder.missed, skipped=recorder.skipped,
+        errors=recorder.errors,
+        cpu_percent=cpu / elapsed * 100,
+        rss_mb=memory, peak_rss_mb=peak_rss_mb())
+
+
+###############################################################################
+def _run_case(comm, engine, addresses, options, connection):
+    try:
+        connection.send(run_case(comm, engine, addresses, options))
+    except Exception as e:
+        connection.send(dict(comm=comm, engine=engine, failed=repr(e)))
+
+
+###############################################################################
+def run_isolated(comm, engine, addresses, options):
+    """
+    run_case in a new process, so the memory and the threads of a case
+    are not left to the next one
+    """
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    process = context.Process(target=_run_case,
+                              args=(comm, engine, addresses, options, child))
+    process.start()
+    try:
+        return parent.recv()
+    finally:
+        process.join()
+
+
+###############################################################################
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+###############################################################################
+def run(comms=tuple(FRAMERS), engines=ENGINES, devices=1, isolated=True,
+        **options):
+    """
+    :return: the results of every comm type by every engine with the
+    environment they are measured in
+    """
+    results = list()
+    with DeviceProcess(comms, devices) as device_process:
+        for comm in comms:
+            for engine in engines:
+                addresses = device_process.addresses[comm]
+                case = run_isolated if isolated else run_case
+                results.append(case(comm, engine, addresses, options))
+    return dict(
+        commit=git_commit(), created=time.time(),
+        python=platform.python_version(), platform=platform.platform(),
+        cpus=os.cpu_count(), options=dict(options, devices=devices),
+        results=results)
+
+
+###############################################################################
+def lookup(result, path):
+    for key in path.split('.'):
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+###############################################################################
+def compare(baseline, current):
+    """
+    :return: [(comm, engine, metric, baseline, current, change %,
+    regressed), ...] of the cases in both
+    """
+    cases = {(r['comm'], r['engine']): r for r in baseline['results']}
+    rows = list()
+    for result in current['results']:
+        old = cases.get((result['comm'], result['engine']))
+        if old is None or 'failed' in old or 'failed' in result:
+            continue
+        for metric, higher_is_better in COMPARED:
+            before, after = lookup(old, metric), lookup(result, metric)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before * 100 if before else None
+            regressed = after < before if higher_is_better \
+                else after > before
+            rows.append((result['comm'], result['engine'], metric, before,
+                         after, change, regressed))
+    return rows
+
+
+###############################################################################
+def print_results(results, out=sys.stdout):
+    for r in results['results']:
+        if 'failed' in r:
+            print(f'{r["comm"]:>12} {r["engine"]:>8}  failed: {r["failed"]}',
+                  file=out)
+            continue
+        latency = r['latency_ms']
+        print(f'{r["comm"]:>12} {r["engine"]:>8}  '
+              f'{r["samples_per_sec"]:8.1f}/s of {r["expected_per_sec"]:.1f}'
+              f'  p50 {latency["p50"] or 0:7.1f}ms'
+              f'  p99 {latency["p99"] or 0:7.1f}ms'
+              f'  missed {r["missed"]} skipped {r["skipped"]}'
+              f' errors {r["errors"]}'
+              f'  cpu {r["cpu_percent"]:5.1f}%  rss {r["rss_mb"]:.1f}MB',
+              file=out)
+
+
+###############################################################################
+def print_comparison(rows, out=sys.stdout):
+    for comm, engine, metric, before, after, change, regressed in rows:
+        change = 'n/a' if change is None else f'{change:+.1f}%'
+        mark = ' !' if regressed else ''
+        print(f'{comm:>12} {engine:>8} {metric:>16} {before:10.2f} -> '
+              f'{after:10.2f} {change:>8}{mark}', file=out)
+
+
+###############################################################################
+def argument_parser():
+    parser = argparse.ArgumentParser('benchmarks.collector')
+    parser.add_argument('-n', '--schedules', type=int, default=50,
+                        help='number of the schedules of each case')
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        help='seconds between the runs of a schedule')
+    parser.add_argument('-d', '--duration', type=float, default=10.0,
+                        help='seconds measured of each case')
+    parser.add_argument('--warmup', type=float, default=2.0,
+                        help='seconds not measured before each case')
+    parser.add_argument('--devices', type=int, default=1,
+                        help='number of the dummy servers of each comm type')
+    parser.add_argument('--comm', choices=tuple(FRAMERS), action='append',
+                        help='comm types measured. all if not given')
+    parser.add_argument('--engine', choices=ENGINES, action='append',
+                        help='engines measured. all if not given')
+    parser.add_argument('--max-connections', type=int, default=4)
+    parser.add_argument('--coalesce-window', type=float, default=0.0,
+                        help='0 measures every schedule reading its device')
+    parser.add_argument('-o', '--output', type=str,
+                        help='json file the results are written to')
+    parser.add_argument('-b', '--baseline', type=str,
+                        help='json file of the results compared with')
+    return parser
+
+
+###############################################################################
+def main(argv=None):
+    argspec = argument_parser().parse_args(argv)
+    results = run(
+        comms=tuple(argspec.comm or FRAMERS),
+        engines=tuple(argspec.engine or ENGINES),
+        devices=argspec.devices, schedules=argspec.schedules,
+        interval=argspec.interval, duration=argspec.duration,
+        warmup=argspec.warmup, max_connections=argspec.max_connections,
+        coalesce_window=argspec.coalesce_window)
+    print_results(results)
+    if argspec.output:
+        with open(argspec.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if argspec.baseline:
+        with open(argspec.baseline, 'r') as f:
+            baseline = json.load(f)
+        print(f'\ncompared with {argspec.baseline} '
+              f'({baseline.get("commit")})')
+        print_comparison(compare(baseline, results))
+    return results
+
+
+if __name__ == '__main__':
+    main()
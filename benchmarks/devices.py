@@ -0,0 +1,120 @@
+import os
+import ast
+import importlib
+import threading
+import multiprocessing
+from pymodbus.server.sync import ModbusTcpServer
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+from pymodbus.datastore import ModbusSequentialDataBlock
+from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
+
+# the framers of the comm types of the schedules
+FRAMERS = {
+    'tcp': ModbusSocketFramer,
+    'rtu-over-tcp': ModbusRtuFramer,
+}
+DUMMY_SERVER = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'dummy-modbus-server', '__init__.py')
+
+
+###############################################################################
+def load_register_data(path=DUMMY_SERVER):
+    """
+    the `register_data` of the bundled dummy server without importing it.
+    the dummy server needs twisted
+    """
+    with open(path, 'r') as f:
+        tree = ast.parse(f.read(), path)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                getattr(t, 'id', None) == 'register_data'
+                for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f'register_data is not in {path}')
+
+
+###############################################################################
+def device_farm():
+    """
+    the dummy-modbus-device-farm module
+    """
+    return importlib.import_module('dummy-modbus-device-farm')
+
+
+###############################################################################
+def make_context(register_data):
+    """
+    the data store laid out as the dummy servers do
+    """
+    store = ModbusSlaveContext(
+        di=ModbusSequentialDataBlock(10001, [0] * 256),
+        co=ModbusSequentialDataBlock(1, [0] * 256),
+        hr=ModbusSequentialDataBlock(40001, list(register_data)),
+        ir=ModbusSequentialDataBlock(30001, list(register_data)),
+        zero_mode=True)
+    return ModbusServerContext(slaves=store, single=True)
+
+
+###############################################################################
+def start_servers(comm, count, register_data, host='127.0.0.1'):
+    """
+    the in-process equivalents of the dummy servers on the ephemeral ports
+    :return: the servers
+    """
+    servers = list()
+    for _ in range(count):
+        server = ModbusTcpServer(make_context(register_data),
+                                 framer=FRAMERS[comm], address=(host, 0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    return servers
+
+
+###############################################################################
+def _serve(comms, count, connection):
+    register_data = load_register_data()
+    addresses = dict()
+    for comm in comms:
+        addresses[comm] = [s.server_address
+                           for s in start_servers(comm, count, register_data)]
+    connection.send(addresses)
+    # until the parent closes its end
+    try:
+        connection.recv()
+    except EOFError:
+        pass
+
+
+###############################################################################
+class DeviceProcess:
+    """
+    the dummy servers in their own process, so the cpu and the memory of
+    the benchmarked process are of the collector alone
+    """
+    def __init__(self, comms=('tcp', ), count=1):
+        context = multiprocessing.get_context('spawn')
+        self._connection, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(tuple(comms), count, child),
+            name='dummy-devices', daemon=True)
+        self.addresses = None
+        self.comms = tuple(comms)
+        self.count = count
+
+    # =========================================================================
+    def __enter__(self):
+        self.process.start()
+        self.addresses = self._connection.recv()
+        return self
+
+    # =========================================================================
+    def __exit__(self, *exc):
+        self._connection.close()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+__all__ = ['DeviceProcess', 'start_servers', 'load_register_data',
+           'device_farm', 'FRAMERS']
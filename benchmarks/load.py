@@ -0,0 +1,477 @@
+"""
+the load test of the rest api with the concurrent readers
+
+    python -m benchmarks.load --clients 200 --duration 30 \
+        --mix data=10,last=4,list=2,run=1,write=1 --output load.json
+    python -m benchmarks.load --url http://localhost:5000 --clients 50
+
+without --url the api is served with the simulated devices in another
+process. the latency of the collection is compared with and without the
+load of the api by /api/v1/metrics
+"""
+import re
+import sys
+import json
+import time
+import socket
+import random
+import argparse
+import platform
+import threading
+import http.client
+import multiprocessing
+import urllib.parse
+from collections import defaultdict
+from benchmarks.collector import percentiles, git_commit, make_collector
+from benchmarks.devices import device_farm
+
+# the method and the path of the operations. {name} is a schedule
+OPERATIONS = {
+    'list': ('GET', '/api/v1/schedules'),
+    'data': ('GET', '/api/v1/schedules/{name}/data'),
+    'last': ('GET', '/api/v1/schedules/{name}/data?last_fetch=1'),
+    'run': ('POST', '/api/v1/schedules/{name}/templates/farm/on-demand-run'),
+    'write': ('POST',
+              '/api/v1/schedules/{name}/templates/write/on-demand-run'),
+    'patch': ('PATCH', '/api/v1/schedules/{name}'),
+}
+DEFAULT_MIX = 'data=10,last=4,list=2,run=1,write=1'
+METRIC_LINE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+METRIC_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+###############################################################################
+def parse_mix(text):
+    """
+    :param text: 'data=10,list=2'
+    :return: {'data': 10.0, 'list': 2.0}
+    """
+    mix = dict()
+    for item in filter(None, text.split(',')):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(
+                f'{name} is not one of {", ".join(OPERATIONS)}')
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError('no operation has a weight')
+    return mix
+
+
+###############################################################################
+def make_body(operation, interval):
+    if operation in ('run', 'write'):
+        return json.dumps(dict(arguments=dict()))
+    if operation == 'patch':
+        # the same trigger again, so the collection is not changed
+        return json.dumps(dict(type='interval',
+                               setting=dict(seconds=interval)))
+    return None
+
+
+###############################################################################
+class Client(threading.Thread):
+    """
+    a reader sending the operations of the mix one after another
+    """
+    def __init__(self, index, url, schedules, mix, interval, stop,
+                 think=0.0, timeout=30.0, seed=None):
+        threading.Thread.__init__(self, name=f'client-{index}', daemon=True)
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.prefix = parsed.path.rstrip('/')
+        self.schedules = schedules
+        self.operations = list(mix)
+        self.weights = [mix[k] for k in self.operations]
+        self.interval = interval
+        self.stop = stop
+        self.think = think
+        self.timeout = timeout
+        self.random = random.Random(None if seed is None else seed + index)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    # =========================================================================
+    def run(self):
+        connection = http.client.HTTPConnection(
+            self.host, self.port, timeout=self.timeout)
+        while not self.stop.is_set():
+            operation = self.random.choices(self.operations, self.weights)[0]
+            method, path = OPERATIONS[operation]
+            path = self.prefix + path.format(
+                name=urllib.parse.quote(self.random.choice(self.schedules)))
+            body = make_body(operation, self.interval)
+            headers = {'Content-Type': 'application/json'} if body else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 400:
+                    self.errors[operation][str(response.status)] += 1
+                else:
+                    self.latencies[operation].append(
+                        time.perf_counter() - started)
+            except (OSError, http.client.HTTPException) as e:
+                self.errors[operation][type(e).__name__] += 1
+                connection.close()
+            if self.think:
+                time.sleep(self.think)
+        connection.close()
+
+
+###############################################################################
+def get_metrics(url):
+    """
+    :return: {(name, labels), value} of /api/v1/metrics. None if the
+    metrics are turned off
+    """
+    parsed = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parsed.hostname,
+                                            parsed.port or 80, timeout=30)
+    try:
+        connection.request('GET', parsed.path.rstrip('/') + '/api/v1/metrics')
+        response = connection.getresponse()
+        text = response.read().decode('utf-8')
+    finally:
+        connection.close()
+    if response.status != 200:
+        return None
+    metrics = dict()
+    for line in text.splitlines():
+        found = METRIC_LINE.match(line)
+        if not found:
+            continue
+        name, labels, value = found.groups()
+        labels = tuple(sorted(METRIC_LABEL.findall(labels or '')))
+        metrics[(name, labels)] = float(value)
+    return metrics
+
+
+###############################################################################
+def collection_stats(before, after, elapsed):
+    """
+    the collection between the two scrapes of the metrics. the percentiles
+    are the upper bounds of the histogram buckets
+    """
+    if before is None or after is None:
+        return None
+    deltas = defaultdict(float)
+    for key, value in after.items():
+        deltas[key] = value - before.get(key, 0.0)
+
+    phases = defaultdict(lambda: dict(buckets=defaultdict(float), sum=0.0,
+                                      count=0.0))
+    runs, events = defaultdict(float), defaultdict(float)
+    for (name, labels), value in deltas.items():
+        labels = dict(labels)
+        if name == 'restful_modbus_phase_seconds_bucket':
+            bound = labels['le']
+            bound = float('inf') if bound == '+Inf' else float(bound)
+            phases[labels['phase']]['buckets'][bound] += value
+        elif name == 'restful_modbus_phase_seconds_sum':
+            phases[labels['phase']]['sum'] += value
+        elif name == 'restful_modbus_phase_seconds_count':
+            phases[labels['phase']]['count'] += value
+        elif name == 'restful_modbus_runs_total':
+            runs[labels['result']] += value
+        elif name == 'restful_modbus_scheduler_events_total':
+            events[labels['event']] += value
+
+    result = dict(runs_per_sec=sum(runs.values()) / elapsed,
+                  failures=runs['failure'], missed=events['missed'],
+                  skipped=events['skipped'], phases=dict())
+    for phase, histogram in phases.items():
+        count = histogram['count']
+        stats = dict(count=count,
+                     mean_ms=histogram['sum'] / count * 1000 if count
+                     else None)
+        for point in (50, 99):
+            stats[f'p{point}_ms'] = None
+            for bound, cumulative in sorted(histogram['buckets'].items()):
+                if count and cumulative >= count * point / 100:
+                    stats[f'p{point}_ms'] = bound * 1000
+                    break
+        result['phases'][phase] = stats
+    means = [p['mean_ms'] for p in result['phases'].values() if p['mean_ms']]
+    result['run_mean_ms'] = sum(means) if means else None
+    return result
+
+
+###############################################################################
+def endpoint_stats(clients, elapsed):
+    latencies = defaultdict(list)
+    errors = defaultdict(lambda: defaultdict(int))
+    for client in clients:
+        for operation, values in client.latencies.items():
+            latencies[operation].extend(values)
+        for operation, kinds in client.errors.items():
+            for kind, count in kinds.items():
+                errors[operation][kind] += count
+    stats = dict()
+    for operation in sorted(set(latencies) | set(errors)):
+        ok = len(latencies[operation])
+        failed = sum(errors[operation].values())
+        stats[operation] = dict(
+            requests=ok + failed, throughput=ok / elapsed,
+            errors=dict(errors[operation]),
+            error_rate=failed / (ok + failed),
+            latency_ms=percentiles([x * 1000 for x in latencies[operation]]))
+    return stats
+
+
+###############################################################################
+def run_load(url, schedules, mix, clients=50, duration=10.0, interval=1.0,
+             think=0.0, seed=None):
+    """
+    :return: (the stats by the operations, the seconds measured)
+    """
+    stop = threading.Event()
+    threads = [Client(i, url, schedules, mix, interval, stop, think,
+                      seed=seed) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return endpoint_stats(threads, elapsed), elapsed
+
+
+###############################################################################
+def measure(url, schedules, mix, clients=50, duration=10.0, idle=5.0,
+            interval=1.0, think=0.0, seed=None):
+    """
+    the collection without the load of the api for idle seconds and then
+    the api and the collection under the load for duration seconds
+    """
+    collection = dict()
+    if idle:
+        before, started = get_metrics(url), time.perf_counter()
+        time.sleep(idle)
+        collection['idle'] = collection_stats(
+            before, get_metrics(url), time.perf_counter() - started)
+    before = get_metrics(url)
+    endpoints, elapsed = run_load(url, schedules, mix, clients, duration,
+                                  interval, think, seed)
+    collection['loaded'] = collection_stats(before, get_metrics(url), elapsed)
+    return dict(endpoints=endpoints, collection=collection, duration=elapsed)
+
+
+###############################################################################
+def _serve(options, connection):
+    """
+    the api of a collector polling the device farm on an ephemeral port
+    """
+    from werkzeug.serving import make_server
+    from restful_modbus_api.app import create_app
+    from restful_modbus_api.server import (
+        start_collector_server, start_workers, stop_workers)
+    farm = device_farm()
+    devices = farm.DeviceFarm(farm.make_devices(
+        options['devices'], units=options['units'],
+        latency=options['latency'], jitter=options['jitter']), seed=1)
+    devices.start()
+    collector = make_collector(options['engine'], options['max_connections'],
+                               options['coalesce_window'])
+    schedules = farm.make_schedules(devices, options['interval'])
+    collector.add_job_schedules(schedules)
+    # every schedule has the data before the load
+    for schedule in schedules:
+        collector.request_data(schedule['schedule_name'])
+
+    listener = socket.create_server(('127.0.0.1', 0), backlog=1024)
+    processes, server = list(), None
+    if options['workers']:
+        address, authkey = start_collector_server(collector)
+        processes = start_workers(address, authkey, listener,
+                                  options['workers'])
+    else:
+        server = make_server('127.0.0.1', 0, create_app(collector),
+                             threaded=True, fd=listener.fileno())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    connection.send((listener.getsockname()[1],
+                     [s['schedule_name'] for s in schedules]))
+    try:
+        # until the parent closes its end
+        connection.recv()
+    except EOFError:
+        pass
+    finally:
+        if server is not None:
+            server.shutdown()
+        stop_workers(processes)
+        listener.close()
+        collector.shutdown()
+        devices.stop()
+
+
+###############################################################################
+class AppProcess:
+    """
+    the api with the simulated devices in its own process, so the load
+    generator does not take the cpu of the api
+    """
+    def __init__(self, devices=20, units=1, latency=0.01, jitter=0.005,
+                 interval=1.0, engine='thread', workers=0, max_connections=4,
+                 coalesce_window=0.0):
+        self.options = dict(
+            devices=devices, units=units, latency=latency, jitter=jitter,
+            interval=interval, engine=engine, workers=workers,
+            max_connections=max_connections,
+            coalesce_window=coalesce_window)
+        context = multiprocessing.get_context('spawn')
+        self._connection, child = context.Pipe()
+        # not a daemon, which can not start the api workers
+        self.process = context.Process(target=_serve,
+                                       args=(self.options, child),
+                                       name='load-test-app')
+        self.url = None
+        self.schedules = None
+
+    # =========================================================================
+    def __enter__(self):
+        self.process.start()
+        port, self.schedules = self._connection.recv()
+        self.url = f'http://127.0.0.1:{port}'
+        wait_ready(self.url)
+        return self
+
+    # =========================================================================
+    def __exit__(self, *exc):
+        self._connection.close()
+        self.process.join(30)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+###############################################################################
+def wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while True:
+        try:
+            get_metrics(url)
+            return
+        except OSError:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+###############################################################################
+def get_schedules(url):
+    parsed = urllib.parse.urlsplit(url)
+    connection = http.client.HTTPConnection(parsed.hostname,
+                                            parsed.port or 80, timeout=30)
+    try:
+        connection.request('GET', parsed.path.rstrip('/')
+                           + '/api/v1/schedules')
+        schedules = json.loads(connection.getresponse().read())
+    finally:
+        connection.close()
+    return [s['schedule_name'] for s in schedules]
+
+
+###############################################################################
+def print_results(results, out=sys.stdout):
+    print(f'{"operation":<8} {"requests":>9} {"req/s":>9} {"errors":>8} '
+          f'{"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8} {"max ms":>8}',
+          file=out)
+    for operation, r in results['endpoints'].items():
+        latency = {k: v or 0 for k, v in r['latency_ms'].items()}
+        print(f'{operation:<8} {r["requests"]:9d} {r["throughput"]:9.1f} '
+              f'{r["error_rate"] * 100:7.2f}% {latency["p50"]:8.1f} '
+              f'{latency["p90"]:8.1f} {latency["p99"]:8.1f} '
+              f'{latency["max"]:8.1f}', file=out)
+    for phase, stats in results['collection'].items():
+        if stats is None:
+            print(f'collection {phase}: the metrics are turned off',
+                  file=out)
+            continue
+        print(f'collection {phase}: {stats["runs_per_sec"]:.1f} runs/s, '
+              f'run mean {stats["run_mean_ms"] or 0:.1f}ms, '
+              f'failures {stats["failures"]:.0f}, '
+              f'missed {stats["missed"]:.0f}, '
+              f'skipped {stats["skipped"]:.0f}', file=out)
+        for name, p in sorted(stats['phases'].items()):
+            if p['count']:
+                print(f'    {name:<8} mean {p["mean_ms"]:8.2f}ms  '
+                      f'p50 <= {p["p50_ms"]}ms  p99 <= {p["p99_ms"]}ms',
+                      file=out)
+
+
+###############################################################################
+def argument_parser():
+    parser = argparse.ArgumentParser('benchmarks.load')
+    parser.add_argument('--url', type=str,
+                        help='url of a live api. the api is started with '
+                             'the simulated devices if not given')
+    parser.add_argument('-c', '--clients', type=int, default=50,
+                        help='number of the concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=10.0,
+                        help='seconds of the load')
+    parser.add_argument('--idle', type=float, default=5.0,
+                        help='seconds the collection is measured without '
+                             'the load before it. 0 skips it')
+    parser.add_argument('-m', '--mix', type=parse_mix,
+                        default=parse_mix(DEFAULT_MIX),
+                        help=f'weights of the operations of '
+                             f'{", ".join(OPERATIONS)}. {DEFAULT_MIX} '
+                             f'by default')
+    parser.add_argument('--think', type=float, default=0.0,
+                        help='seconds a client waits between the requests')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--devices', type=int, default=20)
+    parser.add_argument('--units', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds the devices take to respond')
+    parser.add_argument('--jitter', type=float, default=0.005)
+    parser.add_argument('-i', '--interval', type=float, default=1.0,
+                        help='seconds between the runs of a schedule')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'),
+                        default='thread')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='number of the api worker processes. 0 serves '
+                             'the api in the collector process')
+    parser.add_argument('--max-connections', type=int, default=4)
+    parser.add_argument('--coalesce-window', type=float, default=0.0)
+    parser.add_argument('-o', '--output', type=str,
+                        help='json file the results are written to')
+    return parser
+
+
+###############################################################################
+def main(argv=None):
+    argspec = argument_parser().parse_args(argv)
+    options = dict(mix=argspec.mix, clients=argspec.clients,
+                   duration=argspec.duration, idle=argspec.idle,
+                   interval=argspec.interval, think=argspec.think,
+                   seed=argspec.seed)
+    if argspec.url:
+        results = measure(argspec.url, get_schedules(argspec.url), **options)
+        app = dict(url=argspec.url)
+    else:
+        with AppProcess(
+                argspec.devices, argspec.units, argspec.latency,
+                argspec.jitter, argspec.interval, argspec.engine,
+                argspec.workers, argspec.max_connections,
+                argspec.coalesce_window) as app_process:
+            results = measure(app_process.url, app_process.schedules,
+                              **options)
+            app = app_process.options
+    results.update(commit=git_commit(), created=time.time(),
+                   python=platform.python_version(),
+                   platform=platform.platform(), app=app,
+                   options=options)
+    print_results(results)
+    if argspec.output:
+        with open(argspec.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""
+the microbenchmarks of the hot paths of decoding, command parsing and
+serialization
+
+    python -m benchmarks.micro --output micro.json
+    python -m benchmarks.micro --baseline micro.json --threshold 0.2
+"""
+import gc
+import re
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from flask import Flask, jsonify
+from restful_modbus_api import serializer
+from restful_modbus_api.modbus_handler import (
+    DataType, ModbusClient, chunks, make_record, space, expand_bits,
+    get_json_data_with_template, decode_with_records, parse_command,
+    _argument_parser)
+from benchmarks.collector import TEMPLATE, git_commit
+from benchmarks.devices import load_register_data
+
+# the commands of every sub command as the scripts call them
+COMMANDS = (
+    ('read_coils', '-a 1 -c 16'),
+    ('read_discrete_inputs', '-a 10001 -c 16'),
+    ('read_holding_register', '-a 40001 -c 30 -i 1'),
+    ('read_input_register', '-a 30001 -c 30'),
+    ('write_single_coil', '3 1'),
+    ('write_single_register', '40001 --b16int -3'),
+    ('write_multiple_coils', '3 01101100'),
+    ('write_multiple_registers',
+     '40001 --b16uint 3 --string AB --b32float 1.5'),
+)
+# the samples of a typical history response
+HISTORY_SIZE = 100
+
+
+###############################################################################
+class Case:
+    __slots__ = ('name', 'function')
+
+    def __init__(self, name, function):
+        self.name = name
+        self.function = function
+
+
+###############################################################################
+def _register_bytes():
+    return b''.join(r.to_bytes(2, 'big') for r in load_register_data())
+
+
+###############################################################################
+def decode_cases():
+    timestamp = time.time()
+    for data_type in DataType:
+        length = data_type.value['length']
+        template = [dict(key='data01', note=None, type=data_type.name,
+                         scale=None)]
+        # printable bytes, so the strings and BIT1_BOOLEAN decode
+        data = bytes(range(0x41, 0x41 + length))
+        yield Case(f'decode.{data_type.name}',
+                   lambda d=data, t=template: get_json_data_with_template(
+                       d, t, timestamp))
+    data = _register_bytes()
+    yield Case('decode.dummy_server',
+               lambda: get_json_data_with_template(data, TEMPLATE, timestamp))
+    yield Case('decode.dummy_server.value',
+               lambda: get_json_data_with_template(
+                   data, TEMPLATE, timestamp, attrs=('value', )))
+    yield Case('decode.dummy_server.records',
+               lambda: decode_with_records(data, TEMPLATE, timestamp))
+
+
+###############################################################################
+def record_cases():
+    data = _register_bytes()
+    sizes = [DataType[t['type']].value['length'] for t in TEMPLATE]
+    records = list(chunks(data, sizes))
+    yield Case('chunks', lambda: list(chunks(data, sizes)))
+    yield Case('make_record', lambda: [make_record(i, records, t)
+                                       for i, t in enumerate(TEMPLATE)])
+    hex_value = data[:8].hex()
+    yield Case('space', lambda: space(hex_value, 4))
+
+
+###############################################################################
+def command_cases():
+    parser = _argument_parser()
+    for sub_command, command in COMMANDS:
+        args = f'{sub_command} {command}'.split()
+        yield Case(f'parse_args.{sub_command}',
+                   lambda a=args: parser.parse_args(a))
+    sub_command, command = COMMANDS[2]
+    yield Case('parse_command.cached',
+               lambda: parse_command(sub_command, command))
+
+
+###############################################################################
+def bits_cases():
+    for coils in (16, 2000):
+        data = bytes(range(256)) * (coils // 8 // 256) \
+            + bytes(range(coils // 8 % 256))
+        read = ModbusClient.bit8_boolean(lambda d=data: d)
+        yield Case(f'bit8_boolean.{coils}', read)
+        yield Case(f'expand_bits.{coils}', lambda d=data: expand_bits(d))
+
+
+###############################################################################
+def serialize_cases():
+    data = _register_bytes()
+    timestamp = time.time()
+    samples = [get_json_data_with_template(data, TEMPLATE, timestamp + i)
+               for i in range(HISTORY_SIZE)]
+    app = Flask(__name__)
+
+    def jsonify_history():
+        with app.app_context():
+            return jsonify(samples).get_data()
+    yield Case(f'jsonify.history.{HISTORY_SIZE}', jsonify_history)
+
+    def jsonify_sample():
+        with app.app_context():
+            return jsonify(samples[0]).get_data()
+    yield Case('jsonify.sample', jsonify_sample)
+    # the responses joined from the cached fragments
+    fragments = [serializer.dumps(s) for s in samples]
+    yield Case('serializer.dumps.sample', lambda: serializer.dumps(samples[0]))
+    yield Case(f'serializer.join.history.{HISTORY_SIZE}',
+               lambda: serializer.join(fragments))
+
+
+###############################################################################
+def all_cases():
+    for cases in (decode_cases, record_cases, command_cases, bits_cases,
+                  serialize_cases):
+        yield from cases()
+
+
+###############################################################################
+def time_case(case, min_time=0.2, repeat=5):
+    """
+    :return: the nanoseconds of a call, the fastest of the repeats
+    """
+    function = case.function
+    number = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter_ns() - started
+        if elapsed >= min_time * 1e9 / repeat or number >= 1 << 24:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        started = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter_ns() - started) / number)
+    return best, number
+
+
+###############################################################################
+def trace_case(case, number=100):
+    """
+    :return: (the bytes allocated at the peak of a call, the memory blocks
+    a call leaves allocated). python counts no allocations, so the peak is
+    of the memory a call holds at once
+    """
+    function = case.function
+    function()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    for _ in range(number):
+        function()
+    gc.collect()
+    return peak - before, (sys.getallocatedblocks() - blocks) / number
+
+
+###############################################################################
+def run(pattern=None, min_time=0.2, repeat=5):
+    """
+    :param pattern: the regular expression of the names of the cases run
+    """
+    results = dict()
+    for case in all_cases():
+        if pattern and not re.search(pattern, case.name):
+            continue
+        ns, number = time_case(case, min_time, repeat)
+        peak, blocks = trace_case(case)
+        results[case.name] = dict(ns_per_op=ns, ops=number,
+                                  peak_bytes=peak, blocks_per_op=blocks)
+    return dict(commit=git_commit(), created=time.time(),
+                python=platform.python_version(),
+                platform=platform.platform(), results=results)
+
+
+###############################################################################
+def regressions(baseline, current, threshold=0.2):
+    """
+    :param threshold: the ratio of the slowdown allowed
+    :return: [(name, baseline ns, current ns, ratio), ...] of the cases
+    slower than the threshold
+    """
+    slower = list()
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old or not old['ns_per_op']:
+            continue
+        ratio = result['ns_per_op'] / old['ns_per_op']
+        if ratio > 1 + threshold:
+            slower.append((name, old['ns_per_op'], result['ns_per_op'],
+                           ratio))
+    return slower
+
+
+###############################################################################
+def print_results(results, baseline=None, out=sys.stdout):
+    print(f'{"case":<40} {"ns/op":>12} {"peak B":>9} {"blocks/op":>10}'
+          + (f' {"change":>8}' if baseline else ''), file=out)
+    for name, r in results['results'].items():
+        line = f'{name:<40} {r["ns_per_op"]:12.1f} {r["peak_bytes"]:9d} ' \
+               f'{r["blocks_per_op"]:10.2f}'
+        old = baseline and baseline['results'].get(name)
+        if old:
+            line += f' {(r["ns_per_op"] / old["ns_per_op"] - 1) * 100:+7.1f}%'
+        print(line, file=out)
+
+
+###############################################################################
+def argument_parser():
+    parser = argparse.ArgumentParser('benchmarks.micro')
+    parser.add_argument('-k', '--filter', type=str,
+                        help='regular expression of the names of the cases')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds measured of each case')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', type=str,
+                        help='json file the results are written to')
+    parser.add_argument('-b', '--baseline', type=str,
+                        help='json file of the results compared with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='ratio of the slowdown failing the comparison '
+                             'with the baseline')
+    return parser
+
+
+###############################################################################
+def main(argv=None):
+    argspec = argument_parser().parse_args(argv)
+    results = run(argspec.filter, argspec.min_time, argspec.repeat)
+    baseline = None
+    if argspec.baseline:
+        with open(argspec.baseline, 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if argspec.output:
+        with open(argspec.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline is None:
+        return 0
+    slower = regressions(baseline, results, argspec.threshold)
+    for name, before, after, ratio in slower:
+        print(f'** Regression: {name} {before:.1f}ns -> {after:.1f}ns '
+              f'(x{ratio:.2f})')
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
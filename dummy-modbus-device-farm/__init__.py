@@ -0,0 +1,476 @@
+import math
+import time
+import random
+import struct
+import asyncio
+import argparse
+import threading
+from pymodbus.factory import ServerDecoder
+from pymodbus.pdu import ExceptionResponse, ModbusExceptions
+from pymodbus.utilities import computeCRC
+from pymodbus.exceptions import NoSuchSlaveException
+from pymodbus.datastore import ModbusSequentialDataBlock
+from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
+
+register_data = [
+    0x7765, 0x6c63, 0x6f6d, 0x6521,  # 64bit string welcome!
+    0x4142, 0x4344,  # 32bit string ABCD
+    0x4546,  # 16bit string EF
+    0x4748,  # 8bit string G H
+    0xab54, 0xa98c, 0xeb1f, 0x0ad2,  # 64bit unsigned int
+    0xeedd, 0xef0b, 0x8216, 0x7eeb,  # 64bit int
+    0x4996, 0x02d2,  # 32bit unsigned integer
+    0xb669, 0xfd2e,  # 32bit integer
+    0x3039,  # 16bit unsigned integer
+    0xcfc7,  # 16bit integer
+    0x7b85,  # 8bit unsigned integer, integer
+    0x419d, 0x6f34, 0x540c, 0xa458,  # 64bit float
+    0x4b3c, 0x614e,  # 32bit float
+    0x64d2,  # 16bit float
+]
+# the template of register_data for the schedules
+template = [
+    dict(key=f'data{i:02}', note=note, type=data_type, scale=None)
+    for i, (data_type, note) in enumerate((
+        ('B64_STRING', '64bit string'), ('B32_STRING', '32bit string'),
+        ('B16_STRING', '16bit string'), ('B8_STRING', '8bit string'),
+        ('B8_STRING', '8bit string'), ('B64_UINT', '64bit unsigned int'),
+        ('B64_INT', '64bit int'), ('B32_UINT', '32bit unsigned int'),
+        ('B32_INT', '32bit int'), ('B16_UINT', '16bit unsigned int'),
+        ('B16_INT', '16bit int'), ('B8_UINT', '8bit unsigned int'),
+        ('B8_INT', '8bit int'), ('B64_FLOAT', '64bit float'),
+        ('B32_FLOAT', '32bit float'), ('B16_FLOAT', '16bit float')), 1)
+]
+# the live registers follow register_data. the first one counts the updates
+# and the others are sine waves of the period
+LIVE_ADDRESS = 40001 + len(register_data)
+MBAP = struct.Struct('>HHHB')
+DECODER = ServerDecoder()
+
+
+###############################################################################
+class Behavior:
+    """
+    how a device answers
+    :param latency: seconds before a response
+    :param jitter: seconds added to or taken from the latency at random
+    :param drop_rate: ratio of the requests closing the connection
+    :param silent_rate: ratio of the requests never answered
+    :param exception_rate: ratio of the requests answered with
+    exception_code
+    :param max_connections: connections accepted at once. 0 for no limit
+    """
+    def __init__(self, latency=0.0, jitter=0.0, drop_rate=0.0,
+                 silent_rate=0.0, exception_rate=0.0,
+                 exception_code=ModbusExceptions.SlaveFailure,
+                 max_connections=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.silent_rate = silent_rate
+        self.exception_rate = exception_rate
+        self.exception_code = exception_code
+        self.max_connections = max_connections
+
+    # =========================================================================
+    def delay(self, rng):
+        if not self.jitter:
+            return self.latency
+        return max(self.latency + rng.uniform(-self.jitter, self.jitter), 0.0)
+
+    # =========================================================================
+    def fault(self, rng):
+        """
+        :return: 'drop', 'silent', 'exception' or None
+        """
+        if not (self.drop_rate or self.silent_rate or self.exception_rate):
+            return None
+        value = rng.random()
+        for fault, rate in (('drop', self.drop_rate),
+                            ('silent', self.silent_rate),
+                            ('exception', self.exception_rate)):
+            if value < rate:
+                return fault
+            value -= rate
+        return None
+
+
+###############################################################################
+class SlaveContext(ModbusSlaveContext):
+    """
+    ModbusSlaveContext without the blocks of 65536 values it builds even if
+    all the blocks are given. they take most of the time starting thousands
+    of units
+    """
+    def __init__(self, di, co, hr, ir, zero_mode=True):
+        self.store = dict(d=di, c=co, h=hr, i=ir)
+        self.zero_mode = zero_mode
+
+
+###############################################################################
+def make_store(live_registers):
+    values = list(register_data) + [0] * live_registers
+    return SlaveContext(
+        di=ModbusSequentialDataBlock(10001, [0] * 256),
+        co=ModbusSequentialDataBlock(1, [0] * 256),
+        hr=ModbusSequentialDataBlock(40001, values),
+        ir=ModbusSequentialDataBlock(30001, list(values)),
+        zero_mode=True)
+
+
+###############################################################################
+class Device:
+    """
+    a modbus tcp or rtu over tcp device on a port with one store per unit id
+    """
+    FRAMERS = ('tcp', 'rtu-over-tcp')
+
+    def __init__(self, index, port=0, framer='tcp', units=(1, ),
+                 behavior=None, live_registers=10):
+        if framer not in Device.FRAMERS:
+            raise ValueError(f"'{framer}' is not supported.")
+        self.index = index
+        self.port = port
+        self.framer = framer
+        self.units = tuple(units)
+        self.behavior = behavior or Behavior()
+        self.live_registers = live_registers
+        self.context = ModbusServerContext(
+            slaves={u: make_store(live_registers) for u in self.units},
+            single=False)
+        self.server = None
+        self.connections = 0
+        self.stats = dict.fromkeys(
+            ('requests', 'responses', 'exceptions', 'drops', 'silent',
+             'refused'), 0)
+
+    # =========================================================================
+    def update(self, tick, now, period):
+        if not self.live_registers:
+            return
+        for unit in self.units:
+            values = [tick & 0xffff]
+            for i in range(1, self.live_registers):
+                phase = (self.index * 7 + unit * 3 + i) / self.live_registers
+                values.append(int(32767.5 + 32767.5 * math.sin(
+                    2 * math.pi * (now / period + phase))))
+            store = self.context[unit]
+            store.setValues(3, LIVE_ADDRESS, values)
+            store.setValues(4, LIVE_ADDRESS - 10000, values)
+
+    # =========================================================================
+    def respond(self, unit, pdu, fault):
+        """
+        :return: the response pdu. None if the unit is not in the device
+        """
+        self.stats['requests'] += 1
+        request = DECODER.decode(pdu)
+        if fault == 'exception':
+            response = ExceptionResponse(request.function_code,
+                                         self.behavior.exception_code)
+        else:
+            try:
+                response = request.execute(self.context[unit])
+            except NoSuchSlaveException:
+                return None
+        if response.function_code > 0x80:
+            self.stats['exceptions'] += 1
+        self.stats['responses'] += 1
+        return struct.pack('B', response.function_code) + response.encode()
+
+
+###############################################################################
+async def read_tcp_frame(reader):
+    """
+    :return: (transaction id, unit id, pdu)
+    """
+    header = await reader.readexactly(MBAP.size)
+    tid, _, length, unit = MBAP.unpack(header)
+    return tid, unit, await reader.readexactly(length - 1)
+
+
+###############################################################################
+async def read_rtu_frame(reader):
+    """
+    :return: (None, unit id, pdu). the crc is not checked
+    """
+    head = await reader.readexactly(2)
+    unit, function_code = head
+    if function_code in (0x01, 0x02, 0x03, 0x04, 0x05, 0x06):
+        body = await reader.readexactly(6)
+    elif function_code in (0x0f, 0x10):
+        body = await reader.readexactly(5)
+        body += await reader.readexactly(body[4] + 2)
+    else:
+        # the length of the others is not known. what is sent is taken
+        body = await reader.read(256)
+    return None, unit, head[1:] + body[:-2]
+
+
+###############################################################################
+def frame(framer, tid, unit, pdu):
+    if framer == 'tcp':
+        return MBAP.pack(tid, 0, len(pdu) + 1, unit) + pdu
+    message = struct.pack('B', unit) + pdu
+    return message + struct.pack('>H', computeCRC(message))
+
+
+###############################################################################
+class DeviceFarm:
+    """
+    many simulated devices on one asyncio event loop of a thread
+
+        with DeviceFarm([Device(i) for i in range(1000)]) as farm:
+            farm.addresses
+    """
+    def __init__(self, devices, host='127.0.0.1', update_interval=1.0,
+                 period=60.0, seed=None):
+        self.devices = list(devices)
+        self.host = host
+        self.update_interval = update_interval
+        self.period = period
+        self.random = random.Random(seed)
+        self.loop = None
+        self._thread = None
+        self._updater = None
+        # the writers of the connections by their tasks
+        self._connections = dict()
+
+    # =========================================================================
+    @property
+    def addresses(self):
+        """
+        :return: [(host, port, framer, units), ...] of the devices
+        """
+        return [(self.host, d.port, d.framer, d.units) for d in self.devices]
+
+    # =========================================================================
+    def stats(self):
+        total = dict.fromkeys(self.devices[0].stats, 0) if self.devices \
+            else dict()
+        for device in self.devices:
+            for k, v in device.stats.items():
+                total[k] += v
+        return total
+
+    # =========================================================================
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name='device-farm', daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+        return self
+
+    # =========================================================================
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+        self.loop = None
+
+    # =========================================================================
+    def __enter__(self):
+        return self.start()
+
+    # =========================================================================
+    def __exit__(self, *exc):
+        self.stop()
+
+    # =========================================================================
+    async def _start(self):
+        for device in self.devices:
+            device.server = await asyncio.start_server(
+                lambda r, w, d=device: self.serve(d, r, w),
+                self.host, device.port, backlog=128)
+            device.port = device.server.sockets[0].getsockname()[1]
+            device.update(0, time.time(), self.period)
+        if self.update_interval:
+            self._updater = asyncio.ensure_future(self._update())
+
+    # =========================================================================
+    async def _stop(self):
+        if self._updater is not None:
+            self._updater.cancel()
+        for device in self.devices:
+            device.server.close()
+        # the connections end reading the closed streams
+        for writer in self._connections.values():
+            writer.close()
+        if self._connections:
+            _, pending = await asyncio.wait(list(self._connections),
+                                            timeout=1)
+            for task in pending:
+                task.cancel()
+        for device in self.devices:
+            await device.server.wait_closed()
+
+    # =========================================================================
+    async def _update(self):
+        tick = 0
+        while True:
+            await asyncio.sleep(self.update_interval)
+            tick += 1
+            now = time.time()
+            for device in self.devices:
+                device.update(tick, now, self.period)
+
+    # =========================================================================
+    async def serve(self, device, reader, writer):
+        behavior = device.behavior
+        if behavior.max_connections and \
+                device.connections >= behavior.max_connections:
+            device.stats['refused'] += 1
+            writer.close()
+            return
+        device.connections += 1
+        self._connections[asyncio.current_task()] = writer
+        read_frame = read_tcp_frame if device.framer == 'tcp' \
+            else read_rtu_frame
+        try:
+            while True:
+                tid, unit, pdu = await read_frame(reader)
+                fault = behavior.fault(self.random)
+                delay = behavior.delay(self.random)
+                if delay:
+                    await asyncio.sleep(delay)
+                if fault == 'drop':
+                    device.stats['drops'] += 1
+                    break
+                if fault == 'silent':
+                    device.stats['silent'] += 1
+                    continue
+                response = device.respond(unit, pdu, fault)
+                if response is None:
+                    # no such unit behind the gateway
+                    response = struct.pack(
+                        'BB', pdu[0] | 0x80,
+                        ModbusExceptions.GatewayNoResponse)
+                writer.write(frame(device.framer, tid, unit, response))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            device.connections -= 1
+            self._connections.pop(asyncio.current_task(), None)
+            writer.close()
+
+
+###############################################################################
+def make_devices(count, port=0, framer='tcp', units=1, start=0,
+                 live_registers=10, **behavior):
+    """
+    :param port: the port of the first device. the others follow it.
+    0 for the ephemeral ports
+    :param units: the number of the unit ids from 1 or the unit ids
+    :param start: the index of the first device
+    """
+    if isinstance(units, int):
+        units = range(1, units + 1)
+    return [Device(start + i, port and port + i, framer, units,
+                   Behavior(**behavior), live_registers)
+            for i in range(count)]
+
+
+###############################################################################
+def load_farm(config, host='127.0.0.1'):
+    """
+    :param config: {'host': ..., 'update_interval': ..., 'period': ...,
+    'seed': ..., 'devices': [{'count': 100, 'port': 15020, 'framer': 'tcp',
+    'units': 4, 'latency': 0.05, ...}, ...]}
+    """
+    devices = list()
+    for group in config.get('devices', ()):
+        devices.extend(make_devices(start=len(devices), **group))
+    return DeviceFarm(devices, host=config.get('host', host),
+                      update_interval=config.get('update_interval', 1.0),
+                      period=config.get('period', 60.0),
+                      seed=config.get('seed'))
+
+
+###############################################################################
+def make_schedules(farm, interval=1, host=None, prefix='farm'):
+    """
+    the schedules of the collector polling every unit of the farm
+    :param host: the host the collector connects to. the host of the farm
+    if None
+    """
+    host = host or farm.host
+    schedules = list()
+    for device in farm.devices:
+        for unit in device.units:
+            schedules.append(dict(
+                schedule_name=f'{prefix}-{device.index:04}-{unit}',
+                description=f'{device.framer} device {device.index} '
+                            f'unit {unit}',
+                comm=dict(type=device.framer,
+                          setting=dict(host=host, port=device.port)),
+                trigger=dict(type='interval', setting=dict(seconds=interval)),
+                default_template='farm',
+                templates=dict(
+                    farm=dict(
+                        code=f"def main():\n"
+                             f"    return read_holding_registers("
+                             f"'-a 40001 -c {len(register_data)} "
+                             f"-i {unit}')\n",
+                        template=template),
+                    # the on-demand write of the counter of the live
+                    # registers
+                    write=dict(
+                        code=f"def main():\n"
+                             f"    write_single_register("
+                             f"'{LIVE_ADDRESS} --b16uint 0 -i {unit}')\n"
+                             f"    return read_holding_registers("
+                             f"'-a {LIVE_ADDRESS} -c 1 -i {unit}')\n",
+                        template=[dict(key='counter', note='live counter',
+                                       type='B16_UINT', scale=None)]))))
+    return schedules
+
+
+###############################################################################
+def arg_parser():
+    parser = argparse.ArgumentParser('dummy-modbus-device-farm')
+    parser.add_argument('-a', '--address', type=str, default='0.0.0.0')
+    parser.add_argument('-p', '--port', type=int, default=15020,
+                        help='port of the first device. 0 for the '
+                             'ephemeral ports')
+    parser.add_argument('-n', '--devices', type=int, default=10)
+    parser.add_argument('--framer', choices=Device.FRAMERS, default='tcp')
+    parser.add_argument('-u', '--units', type=int, default=1,
+                        help='number of the unit ids of each device from 1')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds before a response')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='seconds added to or taken from the latency')
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help='ratio of the requests closing the connection')
+    parser.add_argument('--silent-rate', type=float, default=0.0,
+                        help='ratio of the requests never answered')
+    parser.add_argument('--exception-rate', type=float, default=0.0,
+                        help='ratio of the requests answered with an '
+                             'exception')
+    parser.add_argument('--exception-code', type=int,
+                        default=ModbusExceptions.SlaveFailure)
+    parser.add_argument('--max-connections', type=int, default=0,
+                        help='connections a device accepts at once. '
+                             '0 for no limit')
+    parser.add_argument('--live-registers', type=int, default=10,
+                        help=f'number of the registers from {LIVE_ADDRESS} '
+                             f'changing over time')
+    parser.add_argument('--update-interval', type=float, default=1.0,
+                        help='seconds between the changes of the live '
+                             'registers')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('-c', '--config', type=str,
+                        help='yaml file of the device groups. the options '
+                             'of the devices are ignored')
+    parser.add_argument('-s', '--schedules', type=str,
+                        help='yaml file the schedules polling every unit '
+                             'are written to')
+    parser.add_argument('--schedule-interval', type=float, default=1.0)
+    parser.add_argument('--schedule-host', type=str, default='localhost',
+                        help='host of the farm in the schedules')
+    return parser
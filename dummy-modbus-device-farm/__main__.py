@@ -0,0 +1,57 @@
+import time
+import yaml
+from . import arg_parser, load_farm, make_devices, make_schedules, DeviceFarm
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def raise_open_files_limit():
+    # a socket for every device and every connection
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def main():
+    args = arg_parser().parse_args()
+    raise_open_files_limit()
+    if args.config:
+        with open(args.config, 'r') as f:
+            farm = load_farm(yaml.safe_load(f), args.address)
+    else:
+        farm = DeviceFarm(
+            make_devices(
+                args.devices, args.port, args.framer, args.units,
+                live_registers=args.live_registers, latency=args.latency,
+                jitter=args.jitter, drop_rate=args.drop_rate,
+                silent_rate=args.silent_rate,
+                exception_rate=args.exception_rate,
+                exception_code=args.exception_code,
+                max_connections=args.max_connections),
+            host=args.address, update_interval=args.update_interval,
+            seed=args.seed)
+
+    with farm:
+        for host, port, framer, units in farm.addresses:
+            print(f'{framer:>12} {host}:{port} units {list(units)}')
+        if args.schedules:
+            with open(args.schedules, 'w') as f:
+                yaml.safe_dump(make_schedules(
+                    farm, args.schedule_interval, args.schedule_host), f,
+                    sort_keys=False)
+            print(f'The schedules are written to {args.schedules}')
+        try:
+            while True:
+                time.sleep(10)
+                print(farm.stats())
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import sys
+import signal
 import argparse
 import yaml
-from restful_modbus_api.app import app
-from restful_modbus_api.app import collector
+from restful_modbus_api.app import create_app
+from restful_modbus_api.manager import Collector
 
 
 def argument_parser():
@@ -11,24 +13,109 @@ def argument_parser():
     parser.add_argument('-p', '--port', type=int, default=5000,
                         help='port')
     parser.add_argument('-d', '--debug', action='store_true')
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='number of the api worker processes sharing '
+                             'the address. 0 runs the development server '
+                             'in this process')
+    parser.add_argument('--backlog', type=int, default=128,
+                        help='number of the connections waiting to be '
+                             'accepted by the api workers')
+    parser.add_argument('--ipc-socket', type=str,
+                        help='unix socket path between the collector and the '
+                             'api workers. a temporary one if not given')
     parser.add_argument('-t', '--template_file', type=str, action='append')
+    parser.add_argument('--max-connections', type=int, default=4,
+                        help='maximum number of connections per modbus device')
+    parser.add_argument('--read-gap', type=int, default=0,
+                        help='number of registers allowed between the reads '
+                             'merged into one request. -1 turns it off')
+    parser.add_argument('--coalesce-window', type=float, default=0.5,
+                        help='seconds the schedules polling the same device '
+                             'share a read. 0 turns it off')
+    parser.add_argument('--engine', choices=('thread', 'asyncio'),
+                        default='thread',
+                        help='thread: a thread per running schedule, '
+                             'asyncio: every schedule on one event loop')
+    history = parser.add_mutually_exclusive_group()
+    history.add_argument('--history-path', type=str,
+                         help='directory keeping the collected data on the '
+                              'disk. in memory if not given')
+    history.add_argument('--history-database', type=str,
+                         help='SQLite database file keeping the collected '
+                              'data. in memory if not given')
+    parser.add_argument('--no-metrics', action='store_true',
+                        help='turn off the performance counters of '
+                             '/api/v1/metrics')
+    parser.add_argument('--profile-rate', type=float, default=0,
+                        help='ratio of the schedule runs profiled for '
+                             '/api/v1/debug/profile. 0 turns it off')
+    parser.add_argument('--profile-window', type=int, default=100,
+                        help='number of the latest profiled runs kept per '
+                             'schedule')
+    parser.add_argument('--retention-hours', type=float,
+                        help='hours the collected data is kept on the disk. '
+                             'only with --history-path')
+    parser.add_argument('--retention-mb', type=float,
+                        help='megabytes of the collected data kept on the '
+                             'disk per schedule. only with --history-path')
     return parser
 
 
 def main():
     parser = argument_parser()
     argspec = parser.parse_args()
+    if not argspec.history_path and (argspec.retention_hours is not None
+                                     or argspec.retention_mb is not None):
+        parser.error('--retention-hours and --retention-mb need '
+                     '--history-path')
+
+    history = None
+    if argspec.history_path:
+        from restful_modbus_api.segment_store import SegmentStore
+        history = SegmentStore(
+            argspec.history_path,
+            retention_seconds=argspec.retention_hours
+            and argspec.retention_hours * 3600,
+            retention_bytes=argspec.retention_mb
+            and int(argspec.retention_mb * 1024 * 1024))
+    elif argspec.history_database:
+        from restful_modbus_api.database import SQLiteStore
+        history = SQLiteStore(argspec.history_database)
+
+    if argspec.engine == 'asyncio':
+        from restful_modbus_api.async_manager import AsyncCollector
+        engine = AsyncCollector(history=history)
+    else:
+        engine = Collector(history=history)
+    engine.connection_pool.max_connections = argspec.max_connections
+    engine.read_planner.max_gap = argspec.read_gap
+    engine.request_coalescer.window = argspec.coalesce_window
+    engine.metrics.enabled = not argspec.no_metrics
+    engine.profiler.sample_rate = argspec.profile_rate
+    engine.profiler.window = argspec.profile_window
 
     if argspec.template_file:
         print(argspec.template_file)
         for t in argspec.template_file:
             with open(t, 'r') as f:
                 schedules = yaml.safe_load(f)
-            collector.add_job_schedules(schedules)
+            engine.add_job_schedules(schedules)
+
+    if argspec.workers > 0:
+        from restful_modbus_api.server import serve
+        serve(engine, argspec.address, argspec.port, argspec.workers,
+              backlog=argspec.backlog, ipc_address=argspec.ipc_socket)
+        return
 
-    app.run(host=argspec.address,
-            port=argspec.port,
-            debug=argspec.debug)
+    app = create_app(engine)
+    # SIGTERM stops the server as Ctrl-C does, so the history is closed
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        app.run(host=argspec.address,
+                port=argspec.port,
+                debug=argspec.debug)
+    finally:
+        engine.shutdown()
 
 
 if __name__ == '__main__':
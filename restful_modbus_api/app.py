@@ -16,13 +16,33 @@ with open(file) as f:
     logging_handler = yaml.safe_load(f)
 logging.config.dictConfig(logging_handler)
 
-collector = Collector()
-
-app = Flask(__name__)
-app.register_blueprint(api_v1, url_prefix='/api/v1')
-# app.register_blueprint(module_schedule, url_prefix='/schedules')
-# app.register_blueprint(module_base, url_prefix='/')
-api_v1.gv['collector'] = collector
-api_v1.gv['app'] = app
+
+###############################################################################
+def create_app(collector=None):
+    """
+    :param collector: the collector or the proxy of the collector running
+    in another process. a new collector if None
+    """
+    if collector is None:
+        collector = Collector()
+    app = Flask(__name__)
+    app.register_blueprint(api_v1, url_prefix='/api/v1')
+    # app.register_blueprint(module_schedule, url_prefix='/schedules')
+    # app.register_blueprint(module_base, url_prefix='/')
+    api_v1.gv['collector'] = collector
+    api_v1.gv['app'] = app
+    return app
+
+
+###############################################################################
+def __getattr__(name):
+    # the app and the collector are made when they are used first, so the api
+    # workers importing this module do not start their own schedulers
+    if name not in ('app', 'collector'):
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    global app, collector
+    collector = Collector()
+    app = create_app(collector)
+    return globals()[name]
 
 
@@ -0,0 +1,206 @@
+import ast
+import asyncio
+import functools
+import logging
+import textwrap
+import threading
+import time
+import types
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from restful_modbus_api.manager import CONTEXT, Collector, ScriptCache
+from restful_modbus_api.modbus_handler.asynchronous import AsyncConnectionPool
+from restful_modbus_api.modbus_handler.planner import AsyncPlannedClient
+from restful_modbus_api.modbus_handler.coalescer import AsyncCoalescingClient
+from restful_modbus_api.metrics import AsyncTimedClient
+from restful_modbus_api.profiler import AsyncProfilingClient
+
+MODBUS_FUNCTIONS = (
+    'read_input_registers',
+    'read_holding_registers',
+    'read_discrete_inputs',
+    'read_coils',
+    'write_single_coil',
+    'write_multiple_coils',
+    'write_single_register',
+    'write_multiple_registers',
+)
+
+
+###############################################################################
+class AwaitModbusCalls(ast.NodeTransformer):
+    """
+    turn the functions of the script into coroutines and await the calls of
+    the modbus functions and of the functions defined in the script.
+    the functions must be called by their names. lambda and generator
+    expressions can not call the modbus functions.
+    """
+    def __init__(self, tree):
+        self.names = set(MODBUS_FUNCTIONS)
+        self.names.update(node.name for node in ast.walk(tree)
+                          if isinstance(node, ast.FunctionDef))
+
+    # =========================================================================
+    def visit_FunctionDef(self, node):
+        self.generic_visit(node)
+        fields = {f: getattr(node, f) for f in node._fields}
+        return ast.copy_location(ast.AsyncFunctionDef(**fields), node)
+
+    # =========================================================================
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if isinstance(func, ast.Name) and func.id in self.names:
+            return ast.copy_location(ast.Await(value=node), node)
+        if isinstance(func, ast.Attribute) \
+                and isinstance(func.value, ast.Name) \
+                and func.value.id == 'client' \
+                and func.attr in MODBUS_FUNCTIONS:
+            return ast.copy_location(ast.Await(value=node), node)
+        return node
+
+
+###############################################################################
+class AsyncCollector(Collector):
+    """
+    the collector running every schedule on one asyncio event loop.
+    the modbus transactions do not block a thread, so one process can poll
+    thousands of devices at once.
+    """
+    def __init__(self, connection_pool=None, read_planner=None,
+                 request_coalescer=None, history=None):
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self.loop.run_forever, name='collector-event-loop',
+            daemon=True)
+        self._loop_thread.start()
+
+        Collector.__init__(
+            self, connection_pool=connection_pool or AsyncConnectionPool(),
+            read_planner=read_planner,
+            request_coalescer=request_coalescer, history=history)
+        self.script_cache = ScriptCache(
+            builder=AsyncCollector.get_python_module,
+            planner=self.read_planner)
+
+    # =========================================================================
+    def create_scheduler(self):
+        return AsyncIOScheduler(event_loop=self.loop, timezone="Asia/Seoul")
+
+    # =========================================================================
+    def start_scheduler(self):
+        # the asyncio scheduler is not thread-safe. it is started in the loop
+        async def start():
+            self.scheduler.start()
+        self.run_in_loop(start())
+
+    # =========================================================================
+    @property
+    def job_function(self):
+        return self.request_data_async
+
+    # =========================================================================
+    def run_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # =========================================================================
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+        self.loop.call_soon_threadsafe(self.connection_pool.close)
+        if self.loop.is_running():
+            # the samples being stored are in the history before it closes
+            self.run_in_loop(self.loop.shutdown_default_executor())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.history.close()
+
+    # =========================================================================
+    @staticmethod
+    def get_python_module(code, name):
+        code = CONTEXT.format(code=textwrap.indent(code, ' ' * 4))
+        tree = ast.parse(code, f'<{name}>')
+        tree = ast.fix_missing_locations(AwaitModbusCalls(tree).visit(tree))
+        compiled = compile(tree, f'<{name}>', 'exec')
+        module = types.ModuleType(name)
+        exec(compiled, module.__dict__)
+        return module, code, compiled
+
+    # =========================================================================
+    async def execute_script_async(self, schedule_name, template_name,
+                                   **kwargs):
+        profile = self.profiler.start()
+        data, template = await self.run_script_async(
+            schedule_name, template_name, kwargs, profile=profile)
+        return self.decode(schedule_name, data, template, profile=profile)
+
+    # =========================================================================
+    async def run_script_async(self, schedule_name, template_name, kwargs,
+                               coalesce=False, profile=None):
+        prepared = time.perf_counter()
+        comm, script, template = self.prepare_script(
+            schedule_name, template_name)
+        if profile is not None:
+            profile.source = script.source
+            profile.add('prepare', time.perf_counter() - prepared)
+        setting = comm['setting']
+        endpoint = (setting['host'], setting['port'], comm['type'])
+        try:
+            logging.debug(f'{schedule_name}::{template_name} - '
+                          f'Executing the script')
+            started = time.perf_counter()
+            async with self.connection_pool.connection(*endpoint) as client:
+                connected = time.perf_counter()
+                if coalesce and self.request_coalescer.window > 0:
+                    client = AsyncCoalescingClient(
+                        client, self.request_coalescer, endpoint,
+                        schedule_name)
+                if script.plan:
+                    client = AsyncPlannedClient(client, script.plan)
+                timed = None
+                if self.metrics.enabled:
+                    client = timed = AsyncTimedClient(client)
+                if profile is not None:
+                    client = AsyncProfilingClient(client, profile)
+                data = await script.run(client, kwargs)
+                self.observe_run(schedule_name, started, connected, timed,
+                                 profile)
+        except Exception as e:
+            code = Collector.insert_number_each_line(script.source)
+            logging.error(f'{e}\ncode: \n{code}')
+            raise
+        return data, template
+
+    # =========================================================================
+    def execute_script(self, schedule_name, template_name, **kwargs):
+        return self.run_in_loop(self.execute_script_async(
+            schedule_name, template_name, **kwargs))
+
+    # =========================================================================
+    async def request_data_async(self, name):
+        st = time.time()
+        template_name = self.get_default_template(name)
+        if template_name is None:
+            return
+
+        with self.job_tracker.track(name):
+            succeeded = False
+            profile = self.profiler.start()
+            try:
+                data, template = await self.run_script_async(
+                    name, template_name, dict(), coalesce=True,
+                    profile=profile)
+                # the stores may write to the disk. the loop keeps polling
+                result = await self.loop.run_in_executor(
+                    None, functools.partial(
+                        self.store_data, name, template_name, data,
+                        template, st, profile))
+                succeeded = True
+            finally:
+                if self.metrics.enabled:
+                    self.metrics.count_run(name, succeeded)
+            return result
+
+    # =========================================================================
+    def request_data(self, name):
+        return self.run_in_loop(self.request_data_async(name))
+
+
+__all__ = ['AsyncCollector', ]
@@ -0,0 +1,124 @@
+import json
+import threading
+import collections
+
+from restful_modbus_api import serializer
+
+
+###############################################################################
+class Subscriber:
+    """
+    the bounded queue of the messages for one client. a slow client loses
+    the oldest messages and the number of them is counted.
+    """
+    def __init__(self, schedules=None, size=100):
+        self.schedules = set(schedules) if schedules else None
+        self.messages = collections.deque(maxlen=size)
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    # =========================================================================
+    def wants(self, name):
+        return self.schedules is None or name in self.schedules
+
+    # =========================================================================
+    def put(self, message):
+        with self.condition:
+            if len(self.messages) == self.messages.maxlen:
+                self.dropped += 1
+            self.messages.append(message)
+            self.condition.notify()
+
+    # =========================================================================
+    def close(self):
+        """
+        the broker forgets the closed subscriber at the next message
+        """
+        self.closed = True
+
+    # =========================================================================
+    def get(self, timeout=None):
+        """
+        :return: the oldest message. None if nothing in timeout seconds
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.messages, timeout):
+                return None
+            return self.messages.popleft()
+
+
+###############################################################################
+class SampleBroker:
+    """
+    push the collected samples to the subscribers. a sample is serialized
+    once into a server-sent event and the same bytes are shared by all of
+    the subscribers.
+    """
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = list()
+        self.published = 0
+
+    # =========================================================================
+    def subscribe(self, schedules=None):
+        subscriber = Subscriber(schedules, self.queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    # =========================================================================
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    # =========================================================================
+    def _live(self):
+        if any(s.closed for s in self._subscribers):
+            self._subscribers = [s for s in self._subscribers if not s.closed]
+        return self._subscribers
+
+    # =========================================================================
+    def has_subscribers(self, name):
+        with self._lock:
+            return any(s.wants(name) for s in self._live())
+
+    # =========================================================================
+    @staticmethod
+    def make_event(name, sample):
+        """
+        :param sample: the sample or the json bytes of it
+        """
+        if not isinstance(sample, bytes):
+            sample = serializer.dumps(sample)
+        return b'event: sample\ndata: {"sample":' + sample \
+            + b',"schedule":' + json.dumps(name).encode('utf-8') + b'}\n\n'
+
+    # =========================================================================
+    def publish(self, name, make_sample):
+        """
+        :param make_sample: a function returning the sample or the json
+        bytes of it. it is called only when someone subscribes to the
+        schedule
+        """
+        with self._lock:
+            subscribers = [s for s in self._live() if s.wants(name)]
+        if not subscribers:
+            return
+        event = SampleBroker.make_event(name, make_sample())
+        for subscriber in subscribers:
+            subscriber.put(event)
+        self.published += 1
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            subscribers = self._live()
+            return dict(subscribers=len(subscribers),
+                        published=self.published,
+                        dropped=sum(s.dropped for s in subscribers))
+
+
+__all__ = ['SampleBroker', 'Subscriber']
@@ -0,0 +1,267 @@
+import math
+import struct
+
+from restful_modbus_api.modbus_handler import get_template_decoder
+
+# the numpy type and the little endian struct format of the integer fields
+INTEGERS = {
+    'B': ('|u1', 'B'), 'b': ('|i1', 'b'), 'H': ('<u2', 'H'),
+    'h': ('<i2', 'h'), 'I': ('<u4', 'I'), 'i': ('<i4', 'i'),
+    'Q': ('<u8', 'Q'), 'q': ('<i8', 'q'),
+}
+NPY_MAGIC = b'\x93NUMPY'
+INT64_MIN, UINT64_MAX = -(1 << 63), (1 << 64) - 1
+
+
+###############################################################################
+def record(data, template, timestamp, seq):
+    """
+    the render function of the history stores keeping the records as they are
+    """
+    return data, template, timestamp, seq
+
+
+###############################################################################
+class Field:
+    __slots__ = ('key', 'type', 'index', 'scale', 'descr', 'code',
+                 'missing')
+
+    def __init__(self, key, type_name, index, code, scale, scalable):
+        self.key = key
+        self.type = type_name
+        self.index = index
+        self.scale = scale if scalable else None
+        if type_name == 'BIT1_BOOLEAN':
+            self.descr, self.code, self.missing = '|b1', '?', False
+        elif code.endswith('s'):
+            self.descr, self.code, self.missing = f'|S{code[:-1]}', code, b''
+        elif code in 'efd' or scalable and not isinstance(scale, int):
+            self.descr, self.code, self.missing = '<f8', 'd', math.nan
+        elif scalable:
+            # an integer scaled by an integer may not fit in its own type.
+            # to_npy takes floats if it does not fit in 64 bits either
+            self.descr, self.code, self.missing = '<i8', 'q', 0
+        else:
+            self.descr, self.code = INTEGERS[code]
+            self.missing = 0
+
+    # =========================================================================
+    def value(self, raw):
+        if self.code == '?':
+            # the hex string of the byte is read as a decimal number
+            return bool(int(f'{raw:02x}'))
+        if self.scale is not None:
+            return raw * self.scale
+        return raw
+
+
+###############################################################################
+def _fields(template):
+    decoder = get_template_decoder(template)
+    if decoder is None:
+        return None, dict()
+    fields = dict()
+    for index, (field, code) in enumerate(zip(decoder.fields, decoder.codes)):
+        key, name, scale, scalable = field[0], field[1], field[6], field[7]
+        fields[key] = Field(key, name, index, code, scale, scalable)
+    return decoder, fields
+
+
+###############################################################################
+class Columns:
+    """
+    the samples as one column per field key with the timestamp and sequence
+    number columns. the columns are of the fields of the newest template.
+    the value of a field missing in a sample, because the data is short or
+    of another template, is `missing` of the field.
+    strings are kept as their bytes
+    """
+    def __init__(self, records, keys=None):
+        """
+        :param records: [(data, template, timestamp, seq), ...] the newest
+        first as the history stores render them with `record`
+        :param keys: the keys of the fields kept. all if None
+        """
+        self.timestamps = list()
+        self.sequences = list()
+        self.fields = list()
+        self.values = dict()
+        if not records:
+            return
+        _, fields = _fields(records[0][1])
+        self.fields = [field for field in fields.values()
+                       if keys is None or field.key in keys]
+        self.values = {field.key: list() for field in self.fields}
+
+        templates = dict()
+        for data, template, timestamp, seq in records:
+            self.timestamps.append(timestamp)
+            self.sequences.append(seq)
+            if id(template) not in templates:
+                templates[id(template)] = _fields(template)
+            decoder, own = templates[id(template)]
+            raws = None
+            if decoder is not None and len(data) >= decoder.size:
+                raws = decoder.struct.unpack_from(data)
+            for field in self.fields:
+                found = own.get(field.key)
+                if raws is None or found is None or found.type != field.type:
+                    value = None
+                else:
+                    value = found.value(raws[found.index])
+                self.values[field.key].append(value)
+
+    # =========================================================================
+    def __len__(self):
+        return len(self.timestamps)
+
+
+###############################################################################
+def _pack_msgpack(value, out):
+    if value is None:
+        out.append(b'\xc0')
+    elif value is True:
+        out.append(b'\xc3')
+    elif value is False:
+        out.append(b'\xc2')
+    elif isinstance(value, int) and not INT64_MIN <= value <= UINT64_MAX:
+        out.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(struct.pack('B', value))
+        elif -0x20 <= value < 0:
+            out.append(struct.pack('b', value))
+        elif value >= 0:
+            for limit, head, fmt in ((0xff, 0xcc, 'B'), (0xffff, 0xcd, 'H'),
+                                     (0xffffffff, 0xce, 'I')):
+                if value <= limit:
+                    out.append(struct.pack('>B' + fmt, head, value))
+                    break
+            else:
+                out.append(struct.pack('>BQ', 0xcf, value))
+        else:
+            for limit, head, fmt in ((0x80, 0xd0, 'b'), (0x8000, 0xd1, 'h'),
+                                     (0x80000000, 0xd2, 'i')):
+                if value >= -limit:
+                    out.append(struct.pack('>B' + fmt, head, value))
+                    break
+            else:
+                out.append(struct.pack('>Bq', 0xd3, value))
+    elif isinstance(value, float):
+        out.append(struct.pack('>Bd', 0xcb, value))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        _pack_head(len(data), 0xa0, 0x20, (0xd9, 0xda, 0xdb), out)
+        out.append(data)
+    elif isinstance(value, (bytes, bytearray)):
+        _pack_head(len(value), None, 0, (0xc4, 0xc5, 0xc6), out)
+        out.append(bytes(value))
+    elif isinstance(value, (list, tuple)):
+        _pack_head(len(value), 0x90, 0x10, (None, 0xdc, 0xdd), out)
+        for v in value:
+            _pack_msgpack(v, out)
+    elif isinstance(value, dict):
+        _pack_head(len(value), 0x80, 0x10, (None, 0xde, 0xdf), out)
+        for k, v in value.items():
+            _pack_msgpack(k, out)
+            _pack_msgpack(v, out)
+    else:
+        raise TypeError(f'{type(value).__name__} is not for MessagePack')
+
+
+###############################################################################
+def _pack_head(length, fixed, fixed_limit, heads, out):
+    if fixed is not None and length < fixed_limit:
+        out.append(struct.pack('B', fixed | length))
+        return
+    for head, fmt, limit in zip(heads, 'BHI', (0xff, 0xffff, 0xffffffff)):
+        if head is not None and length <= limit:
+            out.append(struct.pack('>B' + fmt, head, length))
+            return
+    raise ValueError(f'{length} items are too many for MessagePack')
+
+
+###############################################################################
+def packb(value):
+    """
+    the MessagePack bytes of the value of None, bool, int, float, str,
+    bytes, list, tuple and dict
+    """
+    out = list()
+    _pack_msgpack(value, out)
+    return b''.join(out)
+
+
+###############################################################################
+def to_msgpack(records, keys=None):
+    """
+    the columns in MessagePack as
+    {"timestamp": [...], "seq": [...], "data": {"data01": [...], ...}}.
+    the missing values are nil and the strings are decoded
+    """
+    columns = Columns(records, keys)
+    data = dict()
+    for field in columns.fields:
+        values = columns.values[field.key]
+        if field.code.endswith('s'):
+            values = [v.decode('utf-8', 'replace') if v is not None else v
+                      for v in values]
+        data[field.key] = values
+    return packb(dict(timestamp=columns.timestamps, seq=columns.sequences,
+                      data=data))
+
+
+###############################################################################
+def _npy_type(field, values):
+    """
+    :return: (numpy type, struct format, missing value) of the column. the
+    scaled integers out of 64 bits are floats
+    """
+    if field.code == 'q' and any(
+            v is not None and not INT64_MIN <= v < -INT64_MIN
+            for v in values):
+        return '<f8', 'd', math.nan
+    return field.descr, field.code, field.missing
+
+
+###############################################################################
+def to_npy(records, keys=None):
+    """
+    the columns in one NumPy .npy structured array with the fields
+    timestamp, seq and the field keys. numpy.load(...)['data01'] is a column
+    """
+    columns = Columns(records, keys)
+    types = [_npy_type(field, columns.values[field.key])
+             for field in columns.fields]
+    descr = [('timestamp', '<f8'), ('seq', '<i8')]
+    descr.extend((field.key, descr)
+                 for field, (descr, _, _) in zip(columns.fields, types))
+    header = repr(dict(descr=descr, fortran_order=False,
+                       shape=(len(columns), )))
+    version, length = b'\x01\x00', '<H'
+    if len(header) + 11 > 0xffff:
+        version, length = b'\x02\x00', '<I'
+    prefix = len(NPY_MAGIC) + 2 + struct.calcsize(length)
+    header += ' ' * (-(prefix + len(header) + 1) % 64) + '\n'
+
+    row = struct.Struct('<dq' + ''.join(code for _, code, _ in types))
+    body = bytearray(row.size * len(columns))
+    values = [[missing if v is None else v
+               for v in columns.values[field.key]]
+              for field, (_, _, missing) in zip(columns.fields, types)]
+    for index, items in enumerate(zip(columns.timestamps, columns.sequences,
+                                      *values)):
+        row.pack_into(body, index * row.size, *items)
+    return NPY_MAGIC + version + struct.pack(length, len(header)) \
+        + header.encode('latin1') + bytes(body)
+
+
+# the encoders of the records by the media types
+ENCODERS = {
+    'application/msgpack': to_msgpack,
+    'application/x-msgpack': to_msgpack,
+    'application/x-npy': to_npy,
+}
+
+
+__all__ = ['Columns', 'ENCODERS', 'packb', 'record', 'to_msgpack', 'to_npy']
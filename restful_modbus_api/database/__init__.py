@@ -0,0 +1,337 @@
+import os
+import time
+import queue
+import logging
+import sqlite3
+import threading
+import collections
+
+from restful_modbus_api.history import make_sample, DEFAULT_DEPTH
+from restful_modbus_api.database import model
+from restful_modbus_api.database.model import Sample
+
+# the marker of the samples of a schedule to remove in the queue
+_REMOVE = object()
+_STOP = object()
+
+
+###############################################################################
+class SQLiteStore:
+    """
+    the collected samples of the schedules kept in a SQLite database.
+    the samples are queued and written by a background writer in batched
+    transactions, so the collecting never waits for the disk. the queries
+    take the queued samples from the memory until they are written.
+    the queue drops the new samples when it is full. a batch failing to be
+    written is tried again retries times, then its samples are dropped.
+    """
+    def __init__(self, path, batch_size=500, flush_interval=1.0,
+                 queue_size=10000, depth=DEFAULT_DEPTH, retries=3):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.depth = depth
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._depths = dict()
+        # the newest sample of each schedule for last_fetch
+        self._last = dict()
+        self._newest = dict()
+        self._sequences = dict()
+        self._pending = collections.defaultdict(collections.deque)
+        self._template_ids = dict()
+
+        connection = self._connect()
+        with connection:
+            for statement in model.SCHEMA:
+                connection.execute(statement)
+        # read once, so the collecting never queries the database
+        self._sequences.update(
+            connection.execute(model.SELECT_LAST_SEQS).fetchall())
+        self._writer = threading.Thread(
+            target=self._write_forever, name='sqlite-writer', daemon=True)
+        self._writer.start()
+
+    # =========================================================================
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    # =========================================================================
+    def _write_forever(self):
+        connection = self._connect()
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and item is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(connection, batch)
+            finally:
+                self._written(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            if _STOP in batch:
+                connection.close()
+                return
+
+    # =========================================================================
+    def _write_batch(self, connection, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                self._write(connection, batch)
+                return
+            except sqlite3.Error as e:
+                # the templates inserted in the transaction are rolled back
+                self._template_ids.clear()
+                logging.error(f'Failed to write {len(batch)} samples '
+                              f'({attempt + 1}/{self.retries + 1}): {e}')
+            if attempt < self.retries:
+                time.sleep(self.flush_interval)
+        lost = sum(isinstance(item, Sample) for item in batch)
+        with self._lock:
+            self.dropped += lost
+        logging.error(f'Dropped {lost} samples not written to the database.')
+
+    # =========================================================================
+    def _write(self, connection, batch):
+        with connection:
+            rows = list()
+            for item in batch:
+                if item is _STOP:
+                    continue
+                if isinstance(item, tuple) and item[0] is _REMOVE:
+                    connection.executemany(model.INSERT_SAMPLE, rows)
+                    rows.clear()
+                    connection.execute(model.DELETE_SAMPLES, (item[1], ))
+                    continue
+                rows.append((item.schedule, item.seq, item.timestamp,
+                             self._template_id(connection, item.template),
+                             item.data))
+            connection.executemany(model.INSERT_SAMPLE, rows)
+
+    # =========================================================================
+    def _written(self, batch):
+        with self._lock:
+            for item in batch:
+                if not isinstance(item, Sample):
+                    continue
+                pending = self._pending.get(item.schedule)
+                if pending and pending[0] is item:
+                    pending.popleft()
+                    if not pending:
+                        del self._pending[item.schedule]
+
+    # =========================================================================
+    def _template_id(self, connection, template):
+        text = model.dump_template(template)
+        template_id = self._template_ids.get(text)
+        if template_id is None:
+            connection.execute(model.INSERT_TEMPLATE, (text, ))
+            template_id, = connection.execute(
+                model.SELECT_TEMPLATE_ID, (text, )).fetchone()
+            self._template_ids[text] = template_id
+        return template_id
+
+    # =========================================================================
+    def flush(self):
+        """
+        wait until the queued samples are written
+        """
+        self._queue.join()
+
+    # =========================================================================
+    def configure(self, name, depth=None):
+        """
+        :param depth: the number of the samples returned by get_all
+        """
+        depth = self.depth if depth is None else int(depth)
+        if depth < 1:
+            raise ValueError(f'{name}: the history depth must be positive')
+        with self._lock:
+            self._depths[name] = depth
+
+    # =========================================================================
+    def append(self, name, template, data, timestamp):
+        """
+        :return: the sequence number of the sample. None if it is dropped
+        """
+        data = bytes(memoryview(data))
+        with self._lock:
+            sample = Sample(name, self._sequences.get(name, 0) + 1,
+                            timestamp, template, data)
+            try:
+                self._queue.put_nowait(sample)
+            except queue.Full:
+                self.dropped += 1
+                logging.warning(f'{name} - The database queue is full. '
+                                f'Dropped the sample.')
+                return None
+            self._sequences[name] = sample.seq
+            self._pending[name].append(sample)
+            self._last[name] = [sample]
+            self._newest[name] = sample
+            return sample.seq
+
+    # =========================================================================
+    def last_seq(self, name):
+        """
+        :return: the sequence number of the newest sample. 0 if nothing
+        """
+        with self._lock:
+            return self._sequences.get(name, 0)
+
+    # =========================================================================
+    def query(self, name, since=None, until=None, limit=None, after=None,
+              render=None):
+        """
+        :param since: seconds since the epoch. the samples at or after it
+        :param until: seconds since the epoch. the samples at or before it
+        :param limit: the number of the newest samples
+        :param after: sequence number. the samples after it
+        :param render: the function making the view of a sample from
+        (data, template, timestamp, seq). make_sample if None
+        :return: the views of the samples, the newest first
+        :raise KeyError: nothing is collected for the schedule
+        """
+        with self._lock:
+            if name not in self._sequences:
+                raise KeyError(name)
+            pending = [s for s in reversed(self._pending.get(name, ()))
+                       if (since is None or s.timestamp >= since)
+                       and (until is None or s.timestamp <= until)
+                       and (after is None or s.seq > after)]
+        if limit is not None:
+            pending = pending[:limit]
+        samples = {s.seq: s for s in pending}
+        if limit is None or len(pending) < limit:
+            # the pending samples may be written before the select. they
+            # are merged by the sequence numbers
+            rows = self._connect().execute(model.SELECT_SAMPLES, (
+                name,
+                float('-inf') if since is None else since,
+                float('inf') if until is None else until,
+                -1 if after is None else after,
+                -1 if limit is None else limit + len(pending))).fetchall()
+            templates = dict()
+            for seq, timestamp, data, text in rows:
+                if seq in samples:
+                    continue
+                if text not in templates:
+                    templates[text] = model.load_template(text)
+                samples[seq] = Sample(name, seq, timestamp, templates[text],
+                                      data)
+        newest = sorted(samples, reverse=True)[:limit]
+        render = render or make_sample
+        return [render(samples[seq].data, samples[seq].template,
+                       samples[seq].timestamp, seq) for seq in newest]
+
+    # =========================================================================
+    def get_all(self, name, render=None):
+        with self._lock:
+            depth = self._depths.get(name, self.depth)
+        return self.query(name, limit=depth, render=render)
+
+    # =========================================================================
+    def pop_last(self, name, render=None):
+        with self._lock:
+            if name not in self._sequences:
+                raise KeyError(name)
+            last = self._last.get(name)
+            sample = last.pop() if last else None
+        if sample is None:
+            return None
+        return (render or make_sample)(
+            sample.data, sample.template, sample.timestamp, sample.seq)
+
+    # =========================================================================
+    def snapshot(self, names, render=None):
+        """
+        the newest samples of the schedules at the same moment.
+        the schedules not collected since the start are read from the
+        database. it does not change the last fetch
+        :return: {name: the view of the newest sample or None}
+        """
+        render = render or make_sample
+        with self._lock:
+            newest = {name: self._newest.get(name) for name in names}
+        result = dict()
+        for name, sample in newest.items():
+            if sample is not None:
+                result[name] = render(sample.data, sample.template,
+                                      sample.timestamp, sample.seq)
+                continue
+            try:
+                result[name] = (self.query(
+                    name, limit=1, render=render) or [None])[0]
+            except KeyError:
+                result[name] = None
+        return result
+
+    # =========================================================================
+    def remove(self, name):
+        """
+        :return: if anything is kept for the schedule
+        """
+        with self._lock:
+            found = name in self._sequences
+            try:
+                self._queue.put_nowait((_REMOVE, name))
+            except queue.Full:
+                # the sequence numbers go on, not to collide with the
+                # samples left in the database
+                logging.warning(f'{name} - The database queue is full. '
+                                f'The samples are not removed.')
+                return found
+            self._depths.pop(name, None)
+            self._sequences.pop(name, None)
+            self._pending.pop(name, None)
+            self._newest.pop(name, None)
+            self._last.pop(name, None)
+            return found
+
+    # =========================================================================
+    def stats(self):
+        """
+        the bytes of the samples waiting for the writer and of the database
+        """
+        with self._lock:
+            pending = [s for q in self._pending.values() for s in q]
+        disk = 0
+        for suffix in ('', '-wal'):
+            try:
+                disk += os.path.getsize(self.path + suffix)
+            except OSError:
+                pass
+        return dict(memory_bytes=sum(len(s.data) for s in pending),
+                    disk_bytes=disk, queued=len(pending),
+                    dropped=self.dropped)
+
+    # =========================================================================
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    # =========================================================================
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._sequences
+
+
+__all__ = ['SQLiteStore', ]
@@ -0,0 +1,51 @@
+import json
+import collections
+
+# the templates are kept once and referred by the samples
+SCHEMA = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'CREATE TABLE IF NOT EXISTS templates ('
+    ' id INTEGER PRIMARY KEY,'
+    ' template TEXT NOT NULL UNIQUE)',
+    'CREATE TABLE IF NOT EXISTS samples ('
+    ' id INTEGER PRIMARY KEY,'
+    ' schedule TEXT NOT NULL,'
+    ' seq INTEGER NOT NULL,'
+    ' ts REAL NOT NULL,'
+    ' template_id INTEGER NOT NULL REFERENCES templates (id),'
+    ' data BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS samples_schedule_ts ON samples (schedule, ts)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS samples_schedule_seq'
+    ' ON samples (schedule, seq)',
+)
+
+INSERT_TEMPLATE = 'INSERT OR IGNORE INTO templates (template) VALUES (?)'
+SELECT_TEMPLATE_ID = 'SELECT id FROM templates WHERE template = ?'
+INSERT_SAMPLE = (
+    'INSERT INTO samples (schedule, seq, ts, template_id, data)'
+    ' VALUES (?, ?, ?, ?, ?)')
+DELETE_SAMPLES = 'DELETE FROM samples WHERE schedule = ?'
+SELECT_LAST_SEQS = 'SELECT schedule, MAX(seq) FROM samples GROUP BY schedule'
+SELECT_SAMPLES = (
+    'SELECT samples.seq, samples.ts, samples.data, templates.template'
+    ' FROM samples JOIN templates ON templates.id = samples.template_id'
+    ' WHERE samples.schedule = ? AND samples.ts >= ? AND samples.ts <= ?'
+    ' AND samples.seq > ?'
+    ' ORDER BY samples.seq DESC LIMIT ?')
+
+Sample = collections.namedtuple(
+    'Sample', ('schedule', 'seq', 'timestamp', 'template', 'data'))
+
+
+###############################################################################
+def dump_template(template):
+    return json.dumps(template, sort_keys=True)
+
+
+###############################################################################
+def load_template(text):
+    return json.loads(text)
+
+
+__all__ = ['SCHEMA', 'Sample', 'dump_template', 'load_template']
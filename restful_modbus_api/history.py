@@ -0,0 +1,340 @@
+import array
+import threading
+
+from restful_modbus_api.modbus_handler import (
+    get_json_data_with_template, get_template_decoder, TemplateDecoder)
+
+DEFAULT_DEPTH = 60
+
+# the array typecodes of the numeric struct format characters
+ARRAY_TYPECODES = {
+    'B': 'B', 'b': 'b', 'H': 'H', 'h': 'h', 'I': 'L', 'i': 'l',
+    'Q': 'Q', 'q': 'q', 'e': 'd', 'f': 'd', 'd': 'd',
+}
+
+
+###############################################################################
+def make_sample(data, template, timestamp=None, seq=None):
+    """
+    the json view of the collected data
+    :param data: the bytes returned by the script
+    :param template: the template of the script
+    :param timestamp: the collected time in seconds since the epoch
+    :param seq: the sequence number of the sample in the schedule
+    """
+    result = get_json_data_with_template(data, template, timestamp)
+    result['hex'] = data.hex(' ')
+    if seq is not None:
+        result['seq'] = seq
+    return result
+
+
+###############################################################################
+class Projection:
+    """
+    the parts of the json view of the samples which the client wants.
+    only those parts are computed. the hex string of the whole data is in
+    the full view only
+    """
+    def __init__(self, fields=None, attrs=None, compact=False):
+        """
+        :param fields: ['data01', 'data02'] the keys of the data. all if None
+        :param attrs: ['value'] the attributes of the data. all if None
+        :param compact: the data as {key: value} if True
+        :raise ValueError: an unknown attribute
+        """
+        if attrs is not None:
+            unknown = set(attrs) - set(TemplateDecoder.KEY)
+            if unknown:
+                raise ValueError(
+                    f'Unknown attributes: {", ".join(sorted(unknown))}')
+            attrs = tuple(attrs)
+        self.fields = None if fields is None else frozenset(fields)
+        self.attrs = ('value', ) if compact else attrs
+        self.compact = compact
+
+    # =========================================================================
+    @property
+    def full(self):
+        return self.fields is None and self.attrs is None
+
+    # =========================================================================
+    def __call__(self, data, template, timestamp=None, seq=None):
+        if self.full:
+            return make_sample(data, template, timestamp, seq)
+        result = get_json_data_with_template(
+            data, template, timestamp, self.fields, self.attrs)
+        if self.compact:
+            result['data'] = {key: record['value']
+                              for key, record in result['data'].items()}
+        if seq is not None:
+            result['seq'] = seq
+        return result
+
+
+###############################################################################
+class HistoryBuffer:
+    """
+    the preallocated ring buffer of the samples of one schedule.
+    the samples are kept as their fixed-width bytes with shared timestamp
+    and sequence number columns and one numeric column per field. the
+    template is kept once and the json view is built only when it is
+    requested.
+    the samples not of the width of the template are kept aside as they are.
+    """
+    def __init__(self, template, depth):
+        self.template = template
+        self.depth = depth
+        self.decoder = get_template_decoder(template)
+        self.width = self.decoder.size if self.decoder else 0
+        self.timestamps = array.array('d', bytes(8 * depth))
+        self.sequences = array.array('q', bytes(8 * depth))
+        self.records = bytearray(self.width * depth)
+        self.overflow = dict()
+        self.columns = dict()
+        self._numeric = list()
+        self._converted = list()
+        self.count = 0
+        self.fetched = True
+
+        if self.decoder is None:
+            return
+        for index, (field, code) in enumerate(
+                zip(self.decoder.fields, self.decoder.codes)):
+            key, convert = field[0], field[4]
+            if convert is not None:
+                self._converted.append((index, convert))
+            if code not in ARRAY_TYPECODES:
+                continue
+            column = array.array(ARRAY_TYPECODES[code])
+            column.frombytes(bytes(column.itemsize * depth))
+            self.columns[key] = column
+            self._numeric.append((index, column))
+
+    # =========================================================================
+    def append(self, data, timestamp, seq):
+        data = memoryview(data)
+        slot = self.count % self.depth
+        if self.width and len(data) == self.width:
+            values = self.decoder.struct.unpack_from(data)
+            # fail as the decoding of the json view does before storing it
+            for index, convert in self._converted:
+                convert(values[index])
+            start = slot * self.width
+            self.records[start:start + self.width] = data
+            self.overflow.pop(slot, None)
+            for index, column in self._numeric:
+                column[slot] = values[index]
+        else:
+            self.overflow[slot] = bytes(data)
+            for index, column in self._numeric:
+                column[slot] = 0
+        self.timestamps[slot] = timestamp
+        self.sequences[slot] = seq
+        self.count += 1
+        self.fetched = False
+
+    # =========================================================================
+    def slots(self):
+        """
+        the slots of the samples, the newest first
+        """
+        oldest = max(self.count - self.depth, 0)
+        return [i % self.depth for i in range(self.count - 1, oldest - 1, -1)]
+
+    # =========================================================================
+    def record(self, slot):
+        """
+        :return: (data, timestamp, seq) of the slot
+        """
+        if slot in self.overflow:
+            data = self.overflow[slot]
+        else:
+            start = slot * self.width
+            data = bytes(self.records[start:start + self.width])
+        return data, self.timestamps[slot], self.sequences[slot]
+
+    # =========================================================================
+    def column(self, key):
+        """
+        the numeric values of the field, the newest first
+        """
+        column = self.columns[key]
+        return [column[slot] for slot in self.slots()]
+
+    # =========================================================================
+    @property
+    def memory(self):
+        """
+        the bytes of the samples kept
+        """
+        arrays = [self.timestamps, self.sequences] \
+            + list(self.columns.values())
+        return len(self.records) + sum(map(len, self.overflow.values())) \
+            + sum(a.itemsize * len(a) for a in arrays)
+
+    # =========================================================================
+    def resized(self, depth):
+        buffer = HistoryBuffer(self.template, depth)
+        for slot in reversed(self.slots()):
+            buffer.append(*self.record(slot))
+        buffer.fetched = self.fetched
+        return buffer
+
+
+###############################################################################
+class HistoryStore:
+    """
+    the collected samples of the schedules kept in memory
+    """
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._buffers = dict()
+        self._depths = dict()
+        self._sequences = dict()
+
+    # =========================================================================
+    def configure(self, name, depth=None):
+        """
+        :param depth: the number of the samples kept for the schedule
+        """
+        depth = self.depth if depth is None else int(depth)
+        if depth < 1:
+            raise ValueError(f'{name}: the history depth must be positive')
+        with self._lock:
+            self._depths[name] = depth
+            buffer = self._buffers.get(name)
+            if buffer is not None and buffer.depth != depth:
+                self._buffers[name] = buffer.resized(depth)
+
+    # =========================================================================
+    def append(self, name, template, data, timestamp):
+        """
+        :return: the sequence number of the sample
+        """
+        with self._lock:
+            buffer = self._buffers.get(name)
+            if buffer is None or buffer.template != template:
+                buffer = HistoryBuffer(
+                    template, self._depths.get(name, self.depth))
+                self._buffers[name] = buffer
+            seq = self._sequences.get(name, 0) + 1
+            buffer.append(data, timestamp, seq)
+            self._sequences[name] = seq
+            return seq
+
+    # =========================================================================
+    def query(self, name, since=None, until=None, limit=None, after=None,
+              render=None):
+        """
+        :param since: seconds since the epoch. the samples at or after it
+        :param until: seconds since the epoch. the samples at or before it
+        :param limit: the number of the newest samples
+        :param after: sequence number. the samples after it
+        :param render: the function making the view of a sample from
+        (data, template, timestamp, seq). make_sample if None
+        :return: the views of the samples, the newest first
+        :raise KeyError: nothing is collected for the schedule
+        """
+        with self._lock:
+            buffer = self._buffers[name]
+            template = buffer.template
+            records = list()
+            for slot in buffer.slots():
+                if limit is not None and len(records) >= limit:
+                    break
+                if after is not None and buffer.sequences[slot] <= after:
+                    break
+                ts = buffer.timestamps[slot]
+                if since is not None and ts < since \
+                        or until is not None and ts > until:
+                    continue
+                records.append(buffer.record(slot))
+        render = render or make_sample
+        return [render(data, template, ts, seq)
+                for data, ts, seq in records]
+
+    # =========================================================================
+    def get_all(self, name, render=None):
+        """
+        :return: the views of the samples, the newest first
+        :raise KeyError: nothing is collected for the schedule
+        """
+        return self.query(name, render=render)
+
+    # =========================================================================
+    def pop_last(self, name, render=None):
+        """
+        :return: the view of the newest sample once, then None until
+        the next sample is collected
+        :raise KeyError: nothing is collected for the schedule
+        """
+        with self._lock:
+            buffer = self._buffers[name]
+            if buffer.fetched or not buffer.count:
+                return None
+            buffer.fetched = True
+            template = buffer.template
+            data, ts, seq = buffer.record(buffer.slots()[0])
+        return (render or make_sample)(data, template, ts, seq)
+
+    # =========================================================================
+    def snapshot(self, names, render=None):
+        """
+        the newest samples of the schedules at the same moment.
+        it does not change the last fetch
+        :return: {name: the view of the newest sample or None}
+        """
+        with self._lock:
+            records = dict()
+            for name in names:
+                buffer = self._buffers.get(name)
+                if buffer is None or not buffer.count:
+                    records[name] = None
+                    continue
+                records[name] = buffer.record(buffer.slots()[0]) \
+                    + (buffer.template, )
+        render = render or make_sample
+        result = dict()
+        for name, record in records.items():
+            if record is not None:
+                data, ts, seq, template = record
+                record = render(data, template, ts, seq)
+            result[name] = record
+        return result
+
+    # =========================================================================
+    def remove(self, name):
+        with self._lock:
+            self._depths.pop(name, None)
+            self._sequences.pop(name, None)
+            return self._buffers.pop(name, None) is not None
+
+    # =========================================================================
+    def last_seq(self, name):
+        """
+        :return: the sequence number of the newest sample. 0 if nothing
+        """
+        with self._lock:
+            return self._sequences.get(name, 0)
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            buffers = list(self._buffers.values())
+            return dict(memory_bytes=sum(b.memory for b in buffers),
+                        samples=sum(min(b.count, b.depth) for b in buffers))
+
+    # =========================================================================
+    def close(self):
+        pass
+
+    # =========================================================================
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._buffers
+
+
+__all__ = ['HistoryStore', 'HistoryBuffer', 'Projection', 'make_sample',
+           'DEFAULT_DEPTH']
@@ -1,31 +1,50 @@
 import logging
+import datetime
 import types
+import contextlib
 import operator
+import textwrap
+import threading
 import time
-from collections import deque
+import zlib
+from collections import Counter
 from apscheduler.schedulers.background import BackgroundScheduler
-from restful_modbus_api.modbus_handler import get_json_data_with_template
+from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED
+from apscheduler.events import EVENT_JOB_ERROR
+from restful_modbus_api.history import HistoryStore, Projection, make_sample
+from restful_modbus_api.broker import SampleBroker
+from restful_modbus_api.serializer import FragmentCache
+from restful_modbus_api import serializer, columnar
+from restful_modbus_api.metrics import Metrics, TimedClient, executor_stats
+from restful_modbus_api.profiler import Profiler, ProfilingClient
+from restful_modbus_api.modbus_handler.pool import ConnectionPool
+from restful_modbus_api.modbus_handler.planner import ReadPlanner, ReadPlan
+from restful_modbus_api.modbus_handler.planner import PlannedClient
+from restful_modbus_api.modbus_handler.coalescer import RequestCoalescer
+from restful_modbus_api.modbus_handler.coalescer import CoalescingClient
 
 CONTEXT = '''
-from restful_modbus_api.modbus_handler import ModbusClient
-
-def _main():
-    with ModbusClient('{comm[setting][host]}', {comm[setting][port]}, '{comm[type]}') as client:
-        read_input_registers = client.read_input_registers
-        read_holding_registers = client.read_holding_registers
-        read_discrete_inputs = client.read_discrete_inputs
-        read_coils = client.read_coils
-        write_single_coil = client.write_single_coil
-        write_multiple_coils = client.write_multiple_coils
-        write_single_register = client.write_single_register
-        write_multiple_registers = client.write_multiple_registers
-        
-        _arguments = {kwargs}
+def _main(client, kwargs):
+    read_input_registers = client.read_input_registers
+    read_holding_registers = client.read_holding_registers
+    read_discrete_inputs = client.read_discrete_inputs
+    read_coils = client.read_coils
+    write_single_coil = client.write_single_coil
+    write_multiple_coils = client.write_multiple_coils
+    write_single_register = client.write_single_register
+    write_multiple_registers = client.write_multiple_registers
+
+    _arguments = kwargs
 {code}
-        return main()    
+    return main()
 '''
 
 
+# the longest seconds a request waits for the new data
+MAX_WAIT = 60
+
+
 ###############################################################################
 class ExceptionResponse(Exception):
     pass
@@ -42,29 +61,203 @@ class ExceptionScheduleReduplicated(Exception):
 
 
 ###############################################################################
-class Collector:
+class ExceptionInvalidQuery(Exception):
+    pass
+
+
+###############################################################################
+class JobTracker:
+    """
+    the schedule jobs running now. waiting for the end of them wakes up as
+    soon as the last one ends, without polling.
+    a scheduled job is running from its submission to the executor, before
+    it starts, until it is executed, failed or missed
+    """
+    EVENTS = EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR \
+        | EVENT_JOB_MISSED
+
     def __init__(self):
+        self._condition = threading.Condition()
+        self._running = Counter()
+        # the runs submitted to the executor and not ended
+        self._submitted = Counter()
+
+    # =========================================================================
+    @contextlib.contextmanager
+    def track(self, name):
+        with self._condition:
+            self._running[name] += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._running[name] -= 1
+                if not self._running[name]:
+                    del self._running[name]
+                    self._condition.notify_all()
+
+    # =========================================================================
+    def on_scheduler_event(self, event):
+        """
+        the listener of the scheduler for EVENTS
+        """
+        with self._condition:
+            if event.code == EVENT_JOB_SUBMITTED:
+                self._submitted[event.job_id] += \
+                    len(event.scheduled_run_times)
+            else:
+                self._submitted[event.job_id] -= 1
+            # the end of a run may be dispatched before its submission
+            if not self._submitted[event.job_id]:
+                del self._submitted[event.job_id]
+                self._condition.notify_all()
+
+    # =========================================================================
+    def _is_running(self, name):
+        return name in self._running or self._submitted[name] > 0
+
+    # =========================================================================
+    def is_running(self, name):
+        with self._condition:
+            return self._is_running(name)
+
+    # =========================================================================
+    def wait_idle(self, name, timeout):
+        """
+        :return: False if the job is still running after timeout seconds
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._is_running(name), timeout)
+
+
+###############################################################################
+class CompiledScript:
+    __slots__ = ('code', 'source', 'compiled', 'module', 'plan')
+
+    def __init__(self, code, source, compiled, module, plan):
+        self.code = code
+        self.source = source
+        self.compiled = compiled
+        self.module = module
+        self.plan = plan
+
+    # =========================================================================
+    def run(self, client, kwargs):
+        return self.module._main(client, kwargs)
+
+
+###############################################################################
+class ScriptCache:
+    """
+    compiled schedule scripts keyed by schedule, template and comm setting.
+    the arguments are given when calling `_main` so the module can be reused
+    """
+    def __init__(self, builder=None, planner=None):
+        self.builder = builder or Collector.get_python_module
+        self.planner = planner
+        self._lock = threading.Lock()
+        self._scripts = dict()
+        self.hits = 0
+        self.misses = 0
+
+    # =========================================================================
+    @staticmethod
+    def make_key(schedule_name, template_name, comm):
+        setting = comm['setting']
+        return (schedule_name, template_name,
+                comm['type'], setting['host'], setting['port'])
+
+    # =========================================================================
+    def get(self, schedule_name, template_name, comm, code):
+        key = ScriptCache.make_key(schedule_name, template_name, comm)
+        with self._lock:
+            script = self._scripts.get(key)
+            if script is not None and script.code == code:
+                self.hits += 1
+                return script
+
+            self.misses += 1
+            module, source, compiled = self.builder(
+                code, f'{schedule_name}::{template_name}')
+            plan = self.planner.make_plan(code) if self.planner \
+                else ReadPlan(dict())
+            script = CompiledScript(code, source, compiled, module, plan)
+            self._scripts[key] = script
+            return script
+
+    # =========================================================================
+    def invalidate(self, schedule_name=None):
+        with self._lock:
+            if schedule_name is None:
+                self._scripts.clear()
+                return
+            for key in [k for k in self._scripts if k[0] == schedule_name]:
+                del self._scripts[key]
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits,
+                        misses=self.misses,
+                        size=len(self._scripts))
+
+
+###############################################################################
+class Collector:
+    def __init__(self, connection_pool=None, read_planner=None,
+                 request_coalescer=None, history=None):
         logging.info('Collector Starting ...')
 
         self.device_info = None
         self.job_order_queue = None
 
-        self.scheduler = BackgroundScheduler(timezone="Asia/Seoul")
-        self.scheduler.start()
+        self.metrics = Metrics()
+        self.profiler = Profiler()
+        self.scheduler = self.create_scheduler()
+        self.job_tracker = JobTracker()
+        self.scheduler.add_listener(self.metrics.on_scheduler_event,
+                                    EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES)
+        self.scheduler.add_listener(self.job_tracker.on_scheduler_event,
+                                    JobTracker.EVENTS)
+        self.start_scheduler()
 
         self.templates = dict()
+        self.read_planner = read_planner or ReadPlanner()
+        self.script_cache = ScriptCache(planner=self.read_planner)
+        self.connection_pool = connection_pool or ConnectionPool()
+        self.request_coalescer = request_coalescer or RequestCoalescer()
+        self.collected = threading.Condition()
+        self.broker = SampleBroker()
+        self.fragments = FragmentCache()
+        # changed whenever the data of the schedule changes without a new
+        # sample. a part of the etag
+        self.revisions = Counter()
+
+        self.history = history or HistoryStore()
+
+    # =========================================================================
+    def create_scheduler(self):
+        return BackgroundScheduler(timezone="Asia/Seoul")
 
-        self.data = dict()
-        self.data['__last_fetch'] = dict()
+    # =========================================================================
+    def start_scheduler(self):
+        self.scheduler.start()
+
+    # =========================================================================
+    @property
+    def job_function(self):
+        return self.request_data
+
+    # =========================================================================
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+        self.connection_pool.close()
+        self.history.close()
 
     # =========================================================================
-    def wait_until(self, name, timeout, period=0.25, *args, **kwargs):
-        must_end = time.time() + timeout
-        while time.time() < must_end:
-            if name not in self.scheduler._executors['default']._instances:
-                return True
-        time.sleep(period)
-        return False
+    def wait_until(self, name, timeout):
+        return self.job_tracker.wait_idle(name, timeout)
 
     # =========================================================================
     def add_job_schedules(self, schedule_templates: list):
@@ -79,6 +272,12 @@ class Collector:
                 logging.error(msg)
                 raise ExceptionScheduleReduplicated(msg)
 
+            self.script_cache.invalidate(schedule_name)
+            self.history.configure(
+                schedule_name, schedule_template.get('history_depth'))
+            self.fragments.configure(
+                schedule_name, schedule_template.get('history_depth'))
+            self.revisions[schedule_name] += 1
             self.templates[schedule_name] = schedule_template
             self._add_job_schedule(
                 schedule_name,
@@ -89,15 +288,12 @@ class Collector:
 
     # =========================================================================
     @staticmethod
-    def get_python_module(code, name, comm, kwargs):
-        def indent(text, amount, ch=' '):
-            import textwrap
-            return textwrap.indent(text, amount * ch)
-
-        code = CONTEXT.format(comm=comm, code=indent(code, 8), kwargs=kwargs)
+    def get_python_module(code, name):
+        code = CONTEXT.format(code=textwrap.indent(code, ' ' * 4))
+        compiled = compile(code, f'<{name}>', 'exec')
         module = types.ModuleType(name)
-        exec(code, module.__dict__)
-        return module, code
+        exec(compiled, module.__dict__)
+        return module, code, compiled
 
     # =========================================================================
     def crontab_add_second(self, crontab):
@@ -127,7 +323,7 @@ class Collector:
             del trigger_setting['crontab']
 
         arguments = dict(
-            func=self.request_data,
+            func=self.job_function,
             args=(key,),
             id=key,
             trigger=trigger_type)
@@ -146,18 +342,21 @@ class Collector:
             f'Removing the schedule "{schedule_name}" from scheduler.')
         self.scheduler.remove_job(schedule_name)
 
-        try:
-            logging.debug(f'Removing the collected data.')
-            del self.data[schedule_name]
-        except KeyError:
+        logging.debug(f'Removing the collected data.')
+        if not self.history.remove(schedule_name):
             logging.warning(
                 f'Failed to find the schedule name "{schedule_name}". '
                 f'It should be failing to collect data. '
                 f'please check the connection is ok.')
+        self.fragments.remove(schedule_name)
+        self.metrics.remove(schedule_name)
+        self.profiler.remove(schedule_name)
+        self.revisions[schedule_name] += 1
 
         logging.debug(f'Removing the template "{schedule_name}" '
                       f'from the template store.')
         del self.templates[schedule_name]
+        self.script_cache.invalidate(schedule_name)
         return
 
     # =========================================================================
@@ -189,7 +388,7 @@ class Collector:
         return '\n'.join(result)
 
     # =========================================================================
-    def execute_script(self, schedule_name, template_name, **kwargs):
+    def prepare_script(self, schedule_name, template_name):
         logging.debug(f'{schedule_name}::{template_name} - '
                       f'Preparing to execute the script.')
 
@@ -197,52 +396,212 @@ class Collector:
             'comm', 'templates')(self.templates[schedule_name])
         (code, template) = operator.itemgetter(
             'code', 'template')(templates[template_name])
-        module, code = Collector.get_python_module(
-            code, schedule_name, comm, kwargs)
+        script = self.script_cache.get(
+            schedule_name, template_name, comm, code)
+        return comm, script, template
+
+    # =========================================================================
+    def execute_script(self, schedule_name, template_name, **kwargs):
+        profile = self.profiler.start()
+        data, template = self.run_script(
+            schedule_name, template_name, kwargs, profile=profile)
+        return self.decode(schedule_name, data, template, profile=profile)
+
+    # =========================================================================
+    def decode(self, schedule_name, data, template, timestamp=None, seq=None,
+               profile=None):
+        """
+        the json view of the data timed for the metrics and the profile
+        """
+        started = time.perf_counter()
+        result = make_sample(data, template, timestamp, seq)
+        if self.metrics.enabled or profile is not None:
+            seconds = time.perf_counter() - started
+            if self.metrics.enabled:
+                self.metrics.observe(schedule_name, 'decode', seconds)
+            if profile is not None:
+                profile.add('decode', seconds)
+                self.profiler.record(schedule_name, profile)
+        return result
+
+    # =========================================================================
+    def run_script(self, schedule_name, template_name, kwargs,
+                   coalesce=False, profile=None):
+        """
+        :param coalesce: share the reads with the other schedules polling the
+        same device. only for the scheduled runs.
+        :param profile: the Profile of the run if it is sampled
+        :return: (the data returned by the script, the template)
+        """
+        prepared = time.perf_counter()
+        comm, script, template = self.prepare_script(
+            schedule_name, template_name)
+        if profile is not None:
+            profile.source = script.source
+            profile.add('prepare', time.perf_counter() - prepared)
+        setting = comm['setting']
+        endpoint = (setting['host'], setting['port'], comm['type'])
         try:
             logging.debug(f'{schedule_name}::{template_name} - '
                           f'Executing the script')
-            data = module._main()
+            started = time.perf_counter()
+            with self.connection_pool.connection(*endpoint) as client:
+                connected = time.perf_counter()
+                if coalesce and self.request_coalescer.window > 0:
+                    client = CoalescingClient(
+                        client, self.request_coalescer, endpoint,
+                        schedule_name)
+                if script.plan:
+                    client = PlannedClient(client, script.plan)
+                timed = None
+                if self.metrics.enabled:
+                    client = timed = TimedClient(client)
+                if profile is not None:
+                    client = ProfilingClient(client, profile)
+                data = script.run(client, kwargs)
+                self.observe_run(schedule_name, started, connected, timed,
+                                 profile)
         except Exception as e:
-            code = Collector.insert_number_each_line(code)
+            code = Collector.insert_number_each_line(script.source)
             logging.error(f'{e}\ncode: \n{code}')
             raise
-        result = get_json_data_with_template(data, template=template)
-        result['hex'] = data.hex(' ')
-        return result
+        return data, template
 
     # =========================================================================
-    def request_data(self, name):
-        st = time.time()
+    def get_default_template(self, name):
         if name not in self.templates:
             logging.warning(
                 f'{name} is not in the template store. '
                 f'add template of \'{name}\'')
-            return
+            return None
 
         if not self.templates[name]['default_template']:
             logging.warning(f'\'default template\' is not set for {name}')
-            return
+            return None
 
         if not self.templates[name]['templates']:
             logging.warning(
                 f'no template to run ... please add template first')
+        return self.templates[name]['default_template']
 
-        (comm, templates, template_name) = operator.itemgetter(
-            'comm', 'templates', 'default_template')(self.templates[name])
-
-        result = self.execute_script(name, template_name)
+    # =========================================================================
+    def observe_run(self, schedule_name, started, connected, timed=None,
+                    profile=None):
+        """
+        :param started: perf_counter() before taking the connection
+        :param connected: perf_counter() after taking the connection
+        :param timed: the TimedClient of the run for the metrics
+        :param profile: the Profile of the run if it is sampled
+        """
+        finished = time.perf_counter()
+        if timed is not None:
+            self.metrics.observe(schedule_name, 'connect', connected - started)
+            self.metrics.observe(schedule_name, 'io', timed.io)
+            self.metrics.observe(schedule_name, 'script',
+                                 max(finished - connected - timed.io, 0.0))
+        if profile is not None:
+            profile.add('connect', connected - started)
+            profile.add('script', max(
+                finished - connected - profile.phases['io'], 0.0))
 
-        if name not in self.data:
-            self.data[name] = deque(maxlen=60)
-        self.data['__last_fetch'][name] = [result]
-        self.data[name].append(result)
-        self.data[name].rotate()
-        latency_ms = int((time.time() - st) * 1000)
+    # =========================================================================
+    def store_data(self, name, template_name, data, template, started,
+                   profile=None):
+        """
+        :return: the json view of the stored sample
+        """
+        timestamp = time.time()
+        seq = self.history.append(name, template, data, timestamp)
+        result = self.decode(name, data, template, timestamp, seq, profile)
+        fragment = serializer.dumps(result)
+        if seq is not None:
+            self.fragments.put(name, seq, fragment)
+        with self.collected:
+            self.collected.notify_all()
+        self.broker.publish(name, lambda: fragment)
+        latency_ms = int((time.time() - started) * 1000)
         logging.info(f'{name}::{template_name} - Succeed to collect data. '
                      f'- {latency_ms}ms')
         return result
 
+    # =========================================================================
+    def request_data(self, name):
+        st = time.time()
+        template_name = self.get_default_template(name)
+        if template_name is None:
+            return
+
+        with self.job_tracker.track(name):
+            succeeded = False
+            profile = self.profiler.start()
+            try:
+                data, template = self.run_script(
+                    name, template_name, dict(), coalesce=True,
+                    profile=profile)
+                result = self.store_data(name, template_name, data,
+                                         template, st, profile)
+                succeeded = True
+            finally:
+                if self.metrics.enabled:
+                    self.metrics.count_run(name, succeeded)
+            return result
+
+    # =========================================================================
+    def get_profile(self, schedule_name):
+        """
+        :return: the timings of the phases and of the modbus calls by the
+        line of the script in the sampled runs
+        """
+        report = self.profiler.report(schedule_name)
+        if report is None:
+            raise NotFound(f'No run of {schedule_name} is profiled. '
+                           f'the sample rate is {self.profiler.sample_rate}')
+        return report
+
+    # =========================================================================
+    def get_metrics(self):
+        """
+        :return: the metrics in the prometheus text format. None if the
+        metrics are turned off
+        """
+        if not self.metrics.enabled:
+            return None
+        executor = executor_stats(self.scheduler)
+        pool = self.connection_pool.stats()
+        history = self.history.stats()
+        storage = [(dict(storage='memory'), history['memory_bytes'])]
+        if 'disk_bytes' in history:
+            storage.append((dict(storage='disk'), history['disk_bytes']))
+        gauges = [
+            ('restful_modbus_executor_jobs',
+             'Jobs running or waiting in the scheduler executor', 'gauge',
+             [(dict(state='running'), executor['running_jobs']),
+              (dict(state='queued'), executor.get('queue_depth', 0))]),
+            ('restful_modbus_executor_threads',
+             'Threads of the scheduler executor', 'gauge',
+             [(dict(state=k), executor[k]) for k in ('threads', 'max_threads')
+              if k in executor]),
+            ('restful_modbus_pool_connections_total',
+             'Connections of the pool by the event', 'counter',
+             [(dict(event=k), pool[k])
+              for k in ('created', 'reused', 'evicted')]),
+            ('restful_modbus_pool_connections',
+             'Connections of the pool by the endpoint', 'gauge',
+             [(dict(endpoint=f'{e["host"]}:{e["port"]}', state=k), e[k])
+              for e in pool['endpoints'] for k in ('idle', 'in_use')]),
+            ('restful_modbus_pool_failures',
+             'Consecutive connection failures by the endpoint', 'gauge',
+             [(dict(endpoint=f'{e["host"]}:{e["port"]}'), e['failures'])
+              for e in pool['endpoints']]),
+            ('restful_modbus_history_bytes',
+             'Bytes of the collected data kept by the history', 'gauge',
+             storage),
+            ('restful_modbus_fragment_cache_bytes',
+             'Bytes of the serialized samples cached', 'gauge',
+             [(None, self.fragments.stats()['bytes'])]),
+        ]
+        return self.metrics.render(gauges)
+
     # =========================================================================
     def get_schedule_jobs(self):
         jobs = self.scheduler.get_jobs()
@@ -299,31 +658,180 @@ class Collector:
         return self.templates[schedule_name]['templates'][template_name]
 
     # =========================================================================
-    def get_all_data(self, schedule_name):
+    def render(self, schedule_name):
+        """
+        the function making the json bytes of a sample of the schedule.
+        the bytes serialized when the sample was collected are used if cached
+        """
+        def render(data, template, timestamp, seq):
+            fragment = self.fragments.get(schedule_name, seq)
+            if fragment is None:
+                fragment = serializer.dumps(
+                    make_sample(data, template, timestamp, seq))
+            return fragment
+        return render
+
+    # =========================================================================
+    def make_etag(self, schedule_name, query=b''):
+        """
+        the entity tag of the data of the schedule. it changes when a sample
+        is collected or the schedule is changed
+        :param query: the query string of the request
+        """
+        return f'{schedule_name}-{self.revisions[schedule_name]}-' \
+               f'{self.history.last_seq(schedule_name)}-{zlib.crc32(query):x}'
+
+    # =========================================================================
+    @staticmethod
+    def make_projection(fields=None, attrs=None, compact=None):
+        """
+        :param fields: 'data01,data02' the keys of the data
+        :param attrs: 'value,raw' the attributes of the data
+        :param compact: '1' or 'true' for the data as {key: value}
+        :return: the Projection. None for the full view
+        """
+        compact = compact is not None \
+            and compact.lower() in ('', '1', 'true', 'yes')
+        if fields is None and attrs is None and not compact:
+            return None
+        try:
+            return Projection(
+                fields=fields.split(',') if fields is not None else None,
+                attrs=attrs.split(',') if attrs is not None else None,
+                compact=compact)
+        except ValueError as e:
+            raise ExceptionInvalidQuery(str(e))
+
+    # =========================================================================
+    def encode(self, schedule_name, fetch, encoding=None, projection=None):
+        """
+        :param fetch: the function getting the samples from the history with
+        the render function
+        :param encoding: None for the json views of the samples.
+        'application/json' for the json bytes joined from the cached samples.
+        or one of the columnar media types in columnar.ENCODERS
+        :param projection: the parts of the samples. all if None
+        """
+        if projection is not None and projection.full:
+            projection = None
+        if encoding is None:
+            return fetch(projection)
+        if encoding == 'application/json':
+            if projection is None:
+                return serializer.join(fetch(self.render(schedule_name)))
+            return serializer.join(fetch(
+                lambda *record: serializer.dumps(projection(*record))))
+        return columnar.ENCODERS[encoding](
+            fetch(columnar.record), projection and projection.fields)
+
+    # =========================================================================
+    def get_all_data(self, schedule_name, encoding=None, projection=None):
         """
         return all of collected data in the queue of the schedule job
         :param schedule_name:
+        :param encoding: the media type of the result. see encode
+        :param projection: the parts of the data. all if None
+        :return:
+        """
+        try:
+            return self.encode(
+                schedule_name,
+                lambda render: self.history.get_all(schedule_name, render),
+                encoding, projection)
+        except KeyError:
+            raise NotFound(
+                f'{schedule_name} is not in the data store for scheduler. or '
+                f'even It may not have started the first collecting yet.')
+
+    # =========================================================================
+    @staticmethod
+    def parse_datetime(value):
+        """
+        :param value: '2021-02-18 11:41:24' or '2021-02-18T11:41:24' in the
+        local time
+        :return: seconds since the epoch
+        """
+        try:
+            return datetime.datetime.fromisoformat(value).timestamp()
+        except ValueError:
+            raise ExceptionInvalidQuery(f'Invalid datetime: \'{value}\'')
+
+    # =========================================================================
+    @staticmethod
+    def parse_number(name, value, number_type=int):
+        try:
+            return number_type(value)
+        except ValueError:
+            raise ExceptionInvalidQuery(f'Invalid {name}: \'{value}\'')
+
+    # =========================================================================
+    def get_data(self, schedule_name, since=None, until=None, limit=None,
+                 wait=None, encoding=None, projection=None):
+        """
+        return the collected data of the schedule job in the range
+        :param since: '2021-02-18 11:41:24'. the data collected at or after.
+        or the sequence number like '120'. the data collected after
+        :param until: '2021-02-18 11:41:24'. the data collected at or before
+        :param limit: the number of the newest data
+        :param wait: seconds waiting for the data after the sequence number
+        when there is nothing yet
+        :param encoding: the media type of the result. see encode
+        :param projection: the parts of the data. all if None
         :return:
         """
-        if schedule_name not in self.data:
+        after = None
+        if since is not None and since.isdigit():
+            after, since = int(since), None
+        elif since is not None:
+            since = Collector.parse_datetime(since)
+        if until is not None:
+            until = Collector.parse_datetime(until)
+        if limit is not None:
+            limit = Collector.parse_number('limit', limit)
+        if wait is not None and after is not None:
+            wait = min(Collector.parse_number('wait', wait, float), MAX_WAIT)
+            with self.collected:
+                self.collected.wait_for(
+                    lambda: self.history.last_seq(schedule_name) > after,
+                    wait)
+        try:
+            return self.encode(
+                schedule_name,
+                lambda render: self.history.query(
+                    schedule_name, since, until, limit, after, render),
+                encoding, projection)
+        except KeyError:
             raise NotFound(
                 f'{schedule_name} is not in the data store for scheduler. or '
                 f'even It may not have started the first collecting yet.')
-        return list(self.data[schedule_name])
 
     # =========================================================================
-    def get_last_fetch_data(self, schedule_name):
+    def get_snapshot(self, schedule_names=None, projection=None):
+        """
+        the latest data of the schedules at the same moment. it does not
+        change the last fetch data
+        :param schedule_names: all of the schedules if None
+        :param projection: the parts of the data. all if None
+        :return: {schedule name: the latest data or None}
+        """
+        if schedule_names is None:
+            schedule_names = list(self.templates)
+        return self.history.snapshot(schedule_names, projection)
+
+    # =========================================================================
+    def get_last_fetch_data(self, schedule_name, projection=None):
         """
         return all of collected data in the queue of the schedule job
         :param schedule_name:
+        :param projection: the parts of the data. all if None
         :return:
         """
-        if schedule_name not in self.data['__last_fetch']:
+        try:
+            return self.history.pop_last(schedule_name, projection)
+        except KeyError:
             raise NotFound(
                 f'{schedule_name} is not in the data store for scheduler. or '
                 f'even It may not have started the first collecting yet.')
-        data = self.data['__last_fetch'][schedule_name]
-        return data.pop() if data else None
 
     # =========================================================================
     def execute_script_after_finishing(
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+from collections import Counter
+
+# the upper bounds of the histogram buckets in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0)
+# connect: taking a connection from the pool, io: the modbus transactions,
+# script: the script without the io, decode: the json view of the data
+PHASES = ('connect', 'io', 'script', 'decode')
+MODBUS_FUNCTIONS = (
+    'read_input_registers',
+    'read_holding_registers',
+    'read_discrete_inputs',
+    'read_coils',
+    'write_single_coil',
+    'write_multiple_coils',
+    'write_single_register',
+    'write_multiple_registers',
+)
+
+
+###############################################################################
+class Histogram:
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    # =========================================================================
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+###############################################################################
+class TimedClient:
+    """
+    the client adding the seconds of the modbus functions to `io`
+    """
+    def __init__(self, client):
+        self.client = client
+        self.io = 0.0
+
+    # =========================================================================
+    def __getattr__(self, name):
+        function = getattr(self.client, name)
+        if name not in MODBUS_FUNCTIONS:
+            return function
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.io += time.perf_counter() - started
+        return timed
+
+
+###############################################################################
+class AsyncTimedClient(TimedClient):
+    # =========================================================================
+    def __getattr__(self, name):
+        function = getattr(self.client, name)
+        if name not in MODBUS_FUNCTIONS:
+            return function
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.io += time.perf_counter() - started
+        return timed
+
+
+###############################################################################
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+###############################################################################
+def labels(**kwargs):
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in kwargs.items()) \
+        + '}'
+
+
+###############################################################################
+class Metrics:
+    """
+    the performance counters of the collector in the prometheus text format.
+    nothing is counted while it is disabled
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._histograms = dict()
+        self._runs = Counter()
+        self._events = Counter()
+
+    # =========================================================================
+    def observe(self, schedule, phase, seconds):
+        with self._lock:
+            histogram = self._histograms.get((schedule, phase))
+            if histogram is None:
+                histogram = self._histograms[(schedule, phase)] = Histogram()
+            histogram.observe(seconds)
+
+    # =========================================================================
+    def count_run(self, schedule, succeeded):
+        with self._lock:
+            self._runs[(schedule, 'success' if succeeded else 'failure')] += 1
+
+    # =========================================================================
+    def on_scheduler_event(self, event):
+        """
+        the listener of the missed and skipped jobs of the scheduler
+        """
+        if not self.enabled:
+            return
+        from apscheduler.events import EVENT_JOB_MISSED
+        kind = 'missed' if event.code == EVENT_JOB_MISSED else 'skipped'
+        with self._lock:
+            self._events[(event.job_id, kind)] += 1
+
+    # =========================================================================
+    def remove(self, schedule):
+        with self._lock:
+            for metric in (self._histograms, self._runs, self._events):
+                for key in [k for k in metric if k[0] == schedule]:
+                    del metric[key]
+
+    # =========================================================================
+    def render(self, gauges=()):
+        """
+        :param gauges: [(name, help, type, [(labels, value), ...]), ...]
+        measured when rendered
+        :return: the metrics in the prometheus text format
+        """
+        lines = list()
+        with self._lock:
+            histograms = sorted((k, (list(h.counts), h.sum, h.count))
+                                for k, h in self._histograms.items())
+            runs = sorted(self._runs.items())
+            events = sorted(self._events.items())
+
+        name = 'restful_modbus_phase_seconds'
+        lines.append(f'# HELP {name} Seconds of the phases of a schedule run')
+        lines.append(f'# TYPE {name} histogram')
+        for (schedule, phase), (counts, total, count) in histograms:
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ('+Inf', ), counts):
+                cumulative += n
+                lines.append(f'{name}_bucket' + labels(
+                    schedule=schedule, phase=phase, le=bound)
+                    + f' {cumulative}')
+            label = labels(schedule=schedule, phase=phase)
+            lines.append(f'{name}_sum{label} {total}')
+            lines.append(f'{name}_count{label} {count}')
+
+        name = 'restful_modbus_runs_total'
+        lines.append(f'# HELP {name} Scheduled runs by the result')
+        lines.append(f'# TYPE {name} counter')
+        for (schedule, result), count in runs:
+            lines.append(name + labels(schedule=schedule, result=result)
+                         + f' {count}')
+
+        name = 'restful_modbus_scheduler_events_total'
+        lines.append(f'# HELP {name} Runs missed or skipped by the scheduler')
+        lines.append(f'# TYPE {name} counter')
+        for (schedule, event), count in events:
+            lines.append(name + labels(schedule=schedule, event=event)
+                         + f' {count}')
+
+        for name, description, metric_type, samples in gauges:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for label, value in samples:
+                lines.append(name + (labels(**label) if label else '')
+                             + f' {value}')
+        return '\n'.join(lines) + '\n'
+
+
+###############################################################################
+def executor_stats(scheduler):
+    """
+    the queue depth and the threads of the default executor of the scheduler
+    """
+    executor = scheduler._lookup_executor('default')
+    running = sum(getattr(executor, '_instances', dict()).values())
+    stats = dict(running_jobs=running)
+    pool = getattr(executor, '_pool', None)
+    if pool is not None and hasattr(pool, '_work_queue'):
+        stats.update(queue_depth=pool._work_queue.qsize(),
+                     threads=len(pool._threads),
+                     max_threads=pool._max_workers)
+    pending = getattr(executor, '_pending_futures', None)
+    if pending is not None:
+        stats.update(queue_depth=len(pending))
+    return stats
+
+
+__all__ = ['Metrics', 'TimedClient', 'AsyncTimedClient', 'executor_stats',
+           'PHASES', 'BUCKETS']
@@ -1,4 +1,6 @@
 import signal
+import argparse
+import threading
 import yaml
 import socket
 import enum
@@ -6,7 +8,6 @@ import struct
 import json
 import datetime
 import functools
-import itertools
 
 from pymodbus.pdu import ModbusExceptions
 from pymodbus.client.sync import ModbusTcpClient as _ModbusClient
@@ -46,20 +47,7 @@ class ModbusClient(_ModbusClient):
     def response_handle(f):
         @functools.wraps(f)
         def func(*args, **kwargs):
-            response = f(*args, **kwargs)
-            if response.isError():
-                if isinstance(response, exceptions.ModbusIOException):
-                    # Probably, disconnected to the Modbus Server.
-                    raise ExceptionResponse(response.message)
-                else:
-                    raise ExceptionResponse(ModbusExceptions.decode(
-                        int.from_bytes(response.encode(), 'big')))
-            data = response.encode()
-
-            if 1 == len(data):
-                raise ExceptionResponse(
-                    ModbusExceptions.decode(int.from_bytes(data, 'big')))
-            return data[1:]
+            return response_to_bytes(f(*args, **kwargs))
 
         return func
 
@@ -88,35 +76,21 @@ class ModbusClient(_ModbusClient):
 
     # =========================================================================
     def bit8_boolean(f):
+        """
+        expand the bits to a byte each.
+        packed=True returns the packed bytes of the response as they are
+        """
         @functools.wraps(f)
-        def func(*args, **kwargs):
-            """
-            bytes to binary in list
-            b'\x15\x11\x11'
-            to
-            b'\x01\x00\x01\x00\x01\x00\x00\x00'
-            b'\x01\x00\x00\x00\x01\x00\x00\x00'
-            b'\x01\x00\x00\x00\x01\x00\x00\x00'
-            """
-            r = f(*args, **kwargs)
-            data = list(r)
-            data = map(lambda x: f'{x:08b}', data)
-            data = map(list, data)
-            data = list([list(map(int, x)) for x in data])
-            data = [list(map(lambda x: int.to_bytes(x, 1, 'big'), x))
-                    for x in data]
-            data = itertools.chain.from_iterable(data)
-            data = list(data)
-            return b''.join(data)
+        def func(*args, packed=False, **kwargs):
+            data = f(*args, **kwargs)
+            return data if packed else expand_bits(data)
         return func
 
     # =========================================================================
     @error_handle
     @response_handle
-    def read_input_registers(self, command):
-        parser = argument_parser()
-        command = 'read_input_register ' + command
-        spec = parser.parse_args(command.split())
+    def read_input_registers(self, command=None, **kwargs):
+        spec = make_command('read_input_register', command, **kwargs)
         response = _ModbusClient.read_input_registers(
             self, spec.address, spec.count, unit=spec.unit_id)
         return response
@@ -124,10 +98,8 @@ class ModbusClient(_ModbusClient):
     # =========================================================================
     @error_handle
     @response_handle
-    def read_holding_registers(self, command):
-        parser = argument_parser()
-        command = 'read_holding_register ' + command
-        spec = parser.parse_args(command.split())
+    def read_holding_registers(self, command=None, **kwargs):
+        spec = make_command('read_holding_register', command, **kwargs)
         response = _ModbusClient.read_holding_registers(
             self, spec.address, spec.count, unit=spec.unit_id)
         return response
@@ -136,10 +108,8 @@ class ModbusClient(_ModbusClient):
     @error_handle
     @bit8_boolean
     @response_handle
-    def read_discrete_inputs(self, command):
-        parser = argument_parser()
-        command = 'read_discrete_inputs ' + command
-        spec = parser.parse_args(command.split())
+    def read_discrete_inputs(self, command=None, **kwargs):
+        spec = make_command('read_discrete_inputs', command, **kwargs)
         response = _ModbusClient.read_discrete_inputs(
             self, spec.address, spec.count, unit=spec.unit_id)
         return response
@@ -148,10 +118,8 @@ class ModbusClient(_ModbusClient):
     @error_handle
     @bit8_boolean
     @response_handle
-    def read_coils(self, command):
-        parser = argument_parser()
-        command = 'read_coils ' + command
-        spec = parser.parse_args(command.split())
+    def read_coils(self, command=None, **kwargs):
+        spec = make_command('read_coils', command, **kwargs)
         response = _ModbusClient.read_coils(
             self, spec.address, spec.count, unit=spec.unit_id)
         return response
@@ -159,10 +127,8 @@ class ModbusClient(_ModbusClient):
     # =========================================================================
     @error_handle
     @response_handle
-    def write_single_coil(self, command):
-        parser = argument_parser()
-        command = 'write_single_coil ' + command
-        spec = parser.parse_args(command.split())
+    def write_single_coil(self, command=None, **kwargs):
+        spec = make_command('write_single_coil', command, **kwargs)
         response = _ModbusClient.write_coil(
             self, spec.address, spec.value, unit=spec.unit_id)
         return response
@@ -170,10 +136,8 @@ class ModbusClient(_ModbusClient):
     # =========================================================================
     @error_handle
     @response_handle
-    def write_multiple_coils(self, command):
-        parser = argument_parser()
-        command = 'write_multiple_coils ' + command
-        spec = parser.parse_args(command.split())
+    def write_multiple_coils(self, command=None, **kwargs):
+        spec = make_command('write_multiple_coils', command, **kwargs)
         response = _ModbusClient.write_coils(
             self, spec.address, list(map(int, spec.values)), unit=spec.unit_id)
         return response
@@ -181,15 +145,9 @@ class ModbusClient(_ModbusClient):
     # =========================================================================
     @error_handle
     @response_handle
-    def write_single_register(self, command):
-        parser = argument_parser()
-        command = 'write_single_register ' + command
-        spec = parser.parse_args(command.split())
-        builder = BinaryPayloadBuilder(byteorder=Endian.Big,
-                                       wordorder=Endian.Big)
-        for func, value in spec.values[:1]:
-            getattr(builder, func)(value)
-        payload = builder.build()
+    def write_single_register(self, command=None, **kwargs):
+        spec = make_command('write_single_register', command, **kwargs)
+        payload = build_payload(spec.values[:1])
 
         response = _ModbusClient.write_register(
             self,
@@ -202,16 +160,9 @@ class ModbusClient(_ModbusClient):
     # =========================================================================
     @error_handle
     @response_handle
-    def write_multiple_registers(self, command):
-        parser = argument_parser()
-        command = 'write_multiple_registers ' + command
-        spec = parser.parse_args(command.split())
-
-        builder = BinaryPayloadBuilder(byteorder=Endian.Big,
-                                       wordorder=Endian.Big)
-        for func, value in spec.values:
-            getattr(builder, func)(value)
-        payload = builder.build()
+    def write_multiple_registers(self, command=None, **kwargs):
+        spec = make_command('write_multiple_registers', command, **kwargs)
+        payload = build_payload(spec.values)
 
         response = _ModbusClient.write_registers(
             self, spec.address, payload, skip_encode=True, unit=spec.unit_id)
@@ -223,6 +174,125 @@ class ExceptionResponse(Exception):
     pass
 
 
+###############################################################################
+# the keywords of the commands and their defaults. REQUIRED must be given
+REQUIRED = object()
+COMMAND_KEYWORDS = {
+    'read_coils': dict(address=1, count=1),
+    'read_discrete_inputs': dict(address=10001, count=1),
+    'read_holding_register': dict(address=40001, count=2),
+    'read_input_register': dict(address=30001, count=2),
+    'write_single_coil': dict(address=REQUIRED, value=REQUIRED),
+    'write_multiple_coils': dict(address=REQUIRED, values=REQUIRED),
+    'write_single_register': dict(address=REQUIRED, values=REQUIRED),
+    'write_multiple_registers': dict(address=REQUIRED, values=REQUIRED),
+}
+
+
+###############################################################################
+@functools.lru_cache(maxsize=None)
+def _argument_parser():
+    return argument_parser()
+
+
+_parse_lock = threading.Lock()
+
+
+###############################################################################
+@functools.lru_cache(maxsize=1024)
+def parse_command(sub_command, command):
+    """
+    parse the command string of the modbus function
+    the parser is built once and the results are memoized,
+    do not modify the returned namespace
+    :param sub_command: 'read_holding_register'
+    :param command: '-a 40001 -c 2'
+    :return: argparse.Namespace
+    """
+    with _parse_lock:
+        return _argument_parser().parse_args(
+            f'{sub_command} {command}'.split())
+
+
+###############################################################################
+def make_command(sub_command, command=None, unit=0, **kwargs):
+    """
+    the command string or the keywords to the namespace of parse_command
+    :param sub_command: 'read_holding_register'
+    :param command: '-a 40001 -c 2'
+    :param unit: unit id for the keywords
+    :param kwargs: address=40001, count=2
+    :return: argparse.Namespace
+    """
+    if command is not None:
+        if kwargs:
+            raise TypeError('the command string and the keywords can not '
+                            'be given together')
+        return parse_command(sub_command, command)
+
+    fields = COMMAND_KEYWORDS[sub_command]
+    unknown = set(kwargs) - set(fields)
+    if unknown:
+        raise TypeError(f'{sub_command}: unknown keywords {sorted(unknown)}')
+    fields = dict(fields, **kwargs)
+    missing = [k for k, v in fields.items() if v is REQUIRED]
+    if missing:
+        raise TypeError(f'{sub_command}: missing keywords {missing}')
+    return argparse.Namespace(sub_parser=sub_command, unit_id=unit, **fields)
+
+
+###############################################################################
+def build_payload(values):
+    """
+    :param values: [('add_16bit_int', 1), ('add_string', 'AB')]
+    :return: list of the register values for writing with skip_encode
+    """
+    builder = BinaryPayloadBuilder(byteorder=Endian.Big,
+                                   wordorder=Endian.Big)
+    for func, value in values:
+        getattr(builder, func)(value)
+    return builder.build()
+
+
+###############################################################################
+def response_to_bytes(response):
+    """
+    strip the byte count from the response pdu
+    raise ExceptionResponse if the response is an error
+    """
+    if response.isError():
+        if isinstance(response, exceptions.ModbusIOException):
+            # Probably, disconnected to the Modbus Server.
+            raise ExceptionResponse(response.message)
+        else:
+            raise ExceptionResponse(ModbusExceptions.decode(
+                int.from_bytes(response.encode(), 'big')))
+    data = response.encode()
+
+    if 1 == len(data):
+        raise ExceptionResponse(
+            ModbusExceptions.decode(int.from_bytes(data, 'big')))
+    return data[1:]
+
+
+###############################################################################
+# the expanded bits of every byte value, the most significant bit first
+_EXPANDED_BITS = tuple(bytes(int(b) for b in f'{i:08b}') for i in range(256))
+
+
+###############################################################################
+def expand_bits(r):
+    """
+    bytes to binary in list
+    b'\x15\x11\x11'
+    to
+    b'\x00\x00\x00\x01\x00\x01\x00\x01'
+    b'\x00\x00\x00\x01\x00\x00\x00\x01'
+    b'\x00\x00\x00\x01\x00\x00\x00\x01'
+    """
+    return b''.join(map(_EXPANDED_BITS.__getitem__, r))
+
+
 ###############################################################################
 class DataType(enum.Enum):
     BIT1_BOOLEAN = {'name': '1b boolean', 'length': 1, 'format': '?'}
@@ -350,11 +420,24 @@ def make_record(index, data, template):
 
 
 ###############################################################################
-def get_json_data_with_template(data: bytes, template):
+def format_datetime(timestamp=None):
+    """
+    :param timestamp: seconds since the epoch. now if None
+    :return: '2021-02-18 11:41:24' in the local time
+    """
+    if timestamp is None:
+        moment = datetime.datetime.now()
+    else:
+        moment = datetime.datetime.fromtimestamp(timestamp)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+###############################################################################
+def decode_with_records(data: bytes, template, timestamp=None):
     n = [DataType[x['type']].value['length'] for x in template]
     data = list(chunks(data, n))
     result = dict()
-    result['datetime'] = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    result['datetime'] = format_datetime(timestamp)
 
     result['data'] = dict()
     key = ['type', 'hex', 'raw', 'note', 'scale', 'value']
@@ -372,6 +455,175 @@ def get_json_data_with_template(data: bytes, template):
     return result
 
 
+###############################################################################
+def _bit1_boolean(value):
+    # the hex string of the byte is read as a decimal number like make_record
+    return bool(int(f'{value:02x}'))
+
+
+###############################################################################
+def _bit8(value):
+    return f'{value:07b}'
+
+
+###############################################################################
+class TemplateDecoder:
+    """
+    the template compiled into one struct format with the offsets, scales
+    and post-processors of the fields. the whole data is unpacked at once.
+    the result is the same as decode_with_records.
+    """
+    KEY = ('type', 'hex', 'raw', 'note', 'scale', 'value')
+    STRINGS = (DataType.B8_STRING, DataType.B16_STRING,
+               DataType.B32_STRING, DataType.B64_STRING)
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = list()
+        # the struct format character of each field
+        self.codes = list()
+        offset = 0
+        for t in template:
+            data_type = DataType[t['type']]
+            length = data_type.value['length']
+            if data_type is DataType.BIT1_BOOLEAN:
+                code = 'B'
+                convert = _bit1_boolean
+            elif data_type is DataType.BIT8:
+                code = 'B'
+                convert = _bit8
+            elif data_type in TemplateDecoder.STRINGS:
+                code = f'{length}s'
+                convert = functools.partial(bytes.decode, encoding='utf-8')
+            else:
+                code = data_type.value['format'].lstrip('>')
+                convert = None
+            self.codes.append(code)
+
+            scale = t['scale']
+            scalable = isinstance(scale, (int, float)) and scale != 0
+            self.fields.append((t['key'], data_type.name, offset,
+                                offset + length, convert, t['note'],
+                                scale, scalable))
+            offset += length
+        self.struct = struct.Struct('>' + ''.join(self.codes))
+        self.size = self.struct.size
+
+    # =========================================================================
+    def decode(self, data: bytes, timestamp=None, keys=None, attrs=None):
+        """
+        :param keys: the keys of the fields decoded. all if None
+        :param attrs: the attributes of the fields like ('value', ) in KEY.
+        all if None. the others, like the hex string, are not computed
+        """
+        if len(data) < self.size:
+            # some of the items have no data
+            result = decode_with_records(data, self.template, timestamp)
+            if keys is not None or attrs is not None:
+                result['data'] = TemplateDecoder.select(
+                    result['data'], keys, attrs)
+            return result
+        if keys is not None or attrs is not None:
+            return self.decode_selected(data, timestamp, keys, attrs)
+
+        result = dict()
+        result['datetime'] = format_datetime(timestamp)
+        records = result['data'] = dict()
+        view = memoryview(data)
+        values = self.struct.unpack_from(view)
+        for (key, name, start, end, convert, note, scale, scalable), raw in \
+                zip(self.fields, values):
+            if convert is not None:
+                raw = convert(raw)
+            if scalable and isinstance(raw, (int, float)):
+                value = raw * scale
+            else:
+                value = raw
+            records[key] = dict(type=name, hex=view[start:end].hex(' ', -2),
+                                raw=raw, note=note, scale=scale, value=value)
+        return result
+
+    # =========================================================================
+    def decode_selected(self, data, timestamp, keys, attrs):
+        attrs = TemplateDecoder.KEY if attrs is None else attrs
+        result = dict()
+        result['datetime'] = format_datetime(timestamp)
+        records = result['data'] = dict()
+        view = memoryview(data)
+        values = self.struct.unpack_from(view)
+        for field, raw in zip(self.fields, values):
+            key, name, start, end, convert, note, scale, scalable = field
+            if keys is not None and key not in keys:
+                continue
+            if convert is not None:
+                raw = convert(raw)
+            record = records[key] = dict()
+            for attr in attrs:
+                if attr == 'value':
+                    record[attr] = raw * scale if scalable \
+                        and isinstance(raw, (int, float)) else raw
+                elif attr == 'hex':
+                    record[attr] = view[start:end].hex(' ', -2)
+                elif attr == 'raw':
+                    record[attr] = raw
+                elif attr == 'type':
+                    record[attr] = name
+                elif attr == 'note':
+                    record[attr] = note
+                else:
+                    record[attr] = scale
+        return result
+
+    # =========================================================================
+    @staticmethod
+    def select(records, keys=None, attrs=None):
+        """
+        the records of the keys with the attributes only
+        """
+        return {key: record if attrs is None
+                else {attr: record[attr] for attr in attrs}
+                for key, record in records.items()
+                if keys is None or key in keys}
+
+
+###############################################################################
+@functools.lru_cache(maxsize=256)
+def _get_template_decoder(fingerprint):
+    return TemplateDecoder([dict(zip(('key', 'type', 'note', 'scale'), f))
+                            for f in fingerprint])
+
+
+###############################################################################
+def get_template_decoder(template):
+    """
+    return the decoder of the template. it is compiled again only when the
+    template is changed. None if the template can not be compiled.
+    """
+    try:
+        fingerprint = tuple((t['key'], t['type'], t['note'], t['scale'])
+                            for t in template)
+        return _get_template_decoder(fingerprint)
+    except (KeyError, TypeError, ValueError, struct.error):
+        return None
+
+
+###############################################################################
+def get_json_data_with_template(data: bytes, template, timestamp=None,
+                                keys=None, attrs=None):
+    """
+    :param keys: the keys of the fields decoded. all if None
+    :param attrs: the attributes of the fields like ('value', ). all if None
+    """
+    decoder = get_template_decoder(template)
+    if decoder is None:
+        result = decode_with_records(data, template, timestamp)
+        if keys is not None or attrs is not None:
+            result['data'] = TemplateDecoder.select(
+                result['data'], keys, attrs)
+        return result
+    return decoder.decode(data, timestamp, keys, attrs)
+
+
 ###############################################################################
 def request_response_messages(command, data: bytes, address=''):
     now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
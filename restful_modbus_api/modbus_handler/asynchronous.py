@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import contextlib
+import functools
+import time
+from collections import deque
+
+from pymodbus import exceptions
+from pymodbus.bit_read_message import ReadCoilsRequest
+from pymodbus.bit_read_message import ReadDiscreteInputsRequest
+from pymodbus.bit_write_message import WriteSingleCoilRequest
+from pymodbus.bit_write_message import WriteMultipleCoilsRequest
+from pymodbus.register_read_message import ReadHoldingRegistersRequest
+from pymodbus.register_read_message import ReadInputRegistersRequest
+from pymodbus.register_write_message import WriteSingleRegisterRequest
+from pymodbus.register_write_message import WriteMultipleRegistersRequest
+from pymodbus.factory import ClientDecoder
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from restful_modbus_api.modbus_handler import (
+    ExceptionResponse,
+    make_command,
+    build_payload,
+    response_to_bytes,
+    expand_bits)
+from restful_modbus_api.modbus_handler.pool import ExceptionPoolTimeout
+
+
+###############################################################################
+class AsyncModbusClient:
+    """
+    non-blocking Modbus TCP and RTU over TCP client on asyncio streams.
+    the read/write methods take the same commands as ModbusClient and return
+    the same bytes, but they are coroutines.
+    """
+    def __init__(self, host, port, mode, timeout=3):
+        if mode == 'tcp':
+            framer = ModbusSocketFramer
+        elif mode == 'rtu-over-tcp':
+            framer = ModbusRtuFramer
+        else:
+            raise ValueError(f"'{mode}' is not supported.")
+
+        self.host = host
+        self.port = port
+        self.mode = mode
+        self.timeout = timeout
+        self.framer = framer(ClientDecoder())
+        self.reader = None
+        self.writer = None
+        self._transaction_id = 0
+
+    # =========================================================================
+    async def connect(self):
+        if self.is_socket_open():
+            return True
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.debug(f'Failed to connect to {self.host}:{self.port} '
+                          f'- {e!r}')
+            self.reader = self.writer = None
+            return False
+        self.framer.resetFrame()
+        return True
+
+    # =========================================================================
+    def is_socket_open(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    # =========================================================================
+    def is_healthy(self):
+        # the connection closed by the server while it was idle is at eof
+        return self.is_socket_open() and not self.reader.at_eof()
+
+    # =========================================================================
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    # =========================================================================
+    async def execute(self, request):
+        if not self.is_socket_open():
+            raise exceptions.ConnectionException(
+                f'{self.host}:{self.port} is not connected')
+        self._transaction_id = (self._transaction_id + 1) & 0xffff
+        request.transaction_id = self._transaction_id
+        self.writer.write(self.framer.buildPacket(request))
+        await self.writer.drain()
+
+        responses = list()
+        try:
+            while not responses:
+                data = await asyncio.wait_for(
+                    self.reader.read(1024), self.timeout)
+                if not data:
+                    raise exceptions.ConnectionException(
+                        f'{self.host}:{self.port} closed the connection')
+                self.framer.processIncomingPacket(
+                    data, responses.append, unit=request.unit_id, single=True)
+                if self.mode == 'tcp':
+                    # drop the late response of a previous transaction
+                    responses = [r for r in responses if r.transaction_id ==
+                                 request.transaction_id]
+        except asyncio.TimeoutError:
+            raise exceptions.ConnectionException(
+                f'{self.host}:{self.port} did not respond '
+                f'in {self.timeout} seconds')
+        return responses[0]
+
+    # =========================================================================
+    def error_handle(f):
+        @functools.wraps(f)
+        async def func(*args, **kwargs):
+            try:
+                return await f(*args, **kwargs)
+            except (exceptions.ConnectionException, ExceptionResponse) as e:
+                print('** Error: ', e)
+                args[0].close()
+            except Exception:
+                import traceback
+                traceback.print_exc()
+                args[0].close()
+                return
+
+        return func
+
+    # =========================================================================
+    @error_handle
+    async def read_input_registers(self, command=None, **kwargs):
+        spec = make_command('read_input_register', command, **kwargs)
+        response = await self.execute(ReadInputRegistersRequest(
+            spec.address, spec.count, unit=spec.unit_id))
+        return response_to_bytes(response)
+
+    # =========================================================================
+    @error_handle
+    async def read_holding_registers(self, command=None, **kwargs):
+        spec = make_command('read_holding_register', command, **kwargs)
+        response = await self.execute(ReadHoldingRegistersRequest(
+            spec.address, spec.count, unit=spec.unit_id))
+        return response_to_bytes(response)
+
+    # =========================================================================
+    @error_handle
+    async def read_discrete_inputs(self, command=None, packed=False, **kwargs):
+        spec = make_command('read_discrete_inputs', command, **kwargs)
+        response = await self.execute(ReadDiscreteInputsRequest(
+            spec.address, spec.count, unit=spec.unit_id))
+        data = response_to_bytes(response)
+        return data if packed else expand_bits(data)
+
+    # =========================================================================
+    @error_handle
+    async def read_coils(self, command=None, packed=False, **kwargs):
+        spec = make_command('read_coils', command, **kwargs)
+        response = await self.execute(ReadCoilsRequest(
+            spec.address, spec.count, unit=spec.unit_id))
+        data = response_to_bytes(response)
+        return data if packed else expand_bits(data)
+
+    # =========================================================================
+    @error_handle
+    async def write_single_coil(self, command=None, **kwargs):
+        spec = make_command('write_single_coil', command, **kwargs)
+        response = await self.execute(WriteSingleCoilRequest(
+            spec.address, spec.value, unit=spec.unit_id))
+        return response_to_bytes(response)
+
+    # =========================================================================
+    @error_handle
+    async def write_multiple_coils(self, command=None, **kwargs):
+        spec = make_command('write_multiple_coils', command, **kwargs)
+        response = await self.execute(WriteMultipleCoilsRequest(
+            spec.address, list(map(int, spec.values)), unit=spec.unit_id))
+        return response_to_bytes(response)
+
+    # =========================================================================
+    @error_handle
+    async def write_single_register(self, command=None, **kwargs):
+        spec = make_command('write_single_register', command, **kwargs)
+        payload = build_payload(spec.values[:1])
+        response = await self.execute(WriteSingleRegisterRequest(
+            spec.address, payload[0], skip_encode=True, unit=spec.unit_id))
+        return response_to_bytes(response)
+
+    # =========================================================================
+    @error_handle
+    async def write_multiple_registers(self, command=None, **kwargs):
+        spec = make_command('write_multiple_registers', command, **kwargs)
+        payload = build_payload(spec.values)
+        response = await self.execute(WriteMultipleRegistersRequest(
+            spec.address, payload, skip_encode=True, unit=spec.unit_id))
+        return response_to_bytes(response)
+
+
+###############################################################################
+class _AsyncEndpoint:
+    def __init__(self, key, max_connections):
+        self.key = key
+        self.semaphore = asyncio.Semaphore(max_connections)
+        # (client, released time), the most recently used one is on the right
+        self.idle = deque()
+        self.size = 0
+        self.in_use = 0
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+###############################################################################
+class AsyncConnectionPool:
+    """
+    the asyncio version of ConnectionPool. it must be used in one event loop.
+    """
+    def __init__(self, max_connections=4, idle_timeout=60.0, wait_timeout=3.0,
+                 backoff=0.5, max_backoff=30.0):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._endpoints = dict()
+        self._evicted_at = time.monotonic()
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    # =========================================================================
+    @contextlib.asynccontextmanager
+    async def connection(self, host, port, mode):
+        client = await self.acquire(host, port, mode)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    # =========================================================================
+    async def acquire(self, host, port, mode):
+        self._evict_idle_periodically()
+        key = (host, port, mode)
+        endpoint = self._endpoints.get(key)
+        if endpoint is None:
+            endpoint = self._endpoints[key] = _AsyncEndpoint(
+                key, self.max_connections)
+
+        try:
+            await asyncio.wait_for(
+                endpoint.semaphore.acquire(), self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise ExceptionPoolTimeout(
+                f'No connection to {host}:{port} is available. '
+                f'{endpoint.size} connections are in use.')
+        endpoint.in_use += 1
+
+        if endpoint.idle:
+            client, _ = endpoint.idle.pop()
+            self.reused += 1
+        else:
+            client = AsyncModbusClient(host, port, mode)
+            endpoint.size += 1
+            self.created += 1
+        try:
+            await self._ensure_connected(endpoint, client)
+        except Exception:
+            client.close()
+            endpoint.size -= 1
+            endpoint.in_use -= 1
+            endpoint.semaphore.release()
+            raise
+        return client
+
+    # =========================================================================
+    def release(self, client):
+        endpoint = self._endpoints[(client.host, client.port, client.mode)]
+        endpoint.in_use -= 1
+        if client.is_socket_open():
+            endpoint.idle.append((client, time.monotonic()))
+        else:
+            endpoint.size -= 1
+        endpoint.semaphore.release()
+
+    # =========================================================================
+    async def _ensure_connected(self, endpoint, client):
+        if client.is_healthy():
+            return
+        client.close()
+
+        now = time.monotonic()
+        if now < endpoint.retry_at:
+            raise exceptions.ConnectionException(
+                f'{client.host}:{client.port} - waiting '
+                f'{endpoint.retry_at - now:.1f}s before reconnecting')
+        if await client.connect():
+            endpoint.failures = 0
+            endpoint.retry_at = 0.0
+            return
+
+        endpoint.failures += 1
+        delay = min(self.backoff * 2 ** (endpoint.failures - 1),
+                    self.max_backoff)
+        endpoint.retry_at = time.monotonic() + delay
+        logging.warning(f'Failed to connect to {client.host}:{client.port}. '
+                        f'Retry after {delay:.1f}s.')
+        raise exceptions.ConnectionException(
+            f'Failed to connect to {client.host}:{client.port}')
+
+    # =========================================================================
+    def _evict_idle_periodically(self):
+        now = time.monotonic()
+        if now - self._evicted_at < self.idle_timeout / 2:
+            return
+        self._evicted_at = now
+        for endpoint in self._endpoints.values():
+            while endpoint.idle and \
+                    now - endpoint.idle[0][1] > self.idle_timeout:
+                client, _ = endpoint.idle.popleft()
+                client.close()
+                endpoint.size -= 1
+                self.evicted += 1
+
+    # =========================================================================
+    def close(self):
+        for endpoint in self._endpoints.values():
+            while endpoint.idle:
+                client, _ = endpoint.idle.popleft()
+                client.close()
+                endpoint.size -= 1
+
+    # =========================================================================
+    def stats(self):
+        endpoints = list()
+        for (host, port, mode), e in list(self._endpoints.items()):
+            endpoints.append(dict(
+                host=host, port=port, mode=mode,
+                size=e.size, idle=len(e.idle), in_use=e.in_use,
+                failures=e.failures))
+        return dict(created=self.created,
+                    reused=self.reused,
+                    evicted=self.evicted,
+                    endpoints=endpoints)
+
+
+__all__ = ['AsyncModbusClient', 'AsyncConnectionPool']
@@ -0,0 +1,219 @@
+import asyncio
+import threading
+import time
+import collections
+
+from restful_modbus_api.modbus_handler import make_command
+from restful_modbus_api.modbus_handler.planner import (
+    READ_FUNCTIONS, Block, ReadPlan)
+
+
+###############################################################################
+class _Entry:
+    __slots__ = ('address', 'count', 'consumers', 'event', 'data', 'done_at')
+
+    def __init__(self, address, count, consumer, event):
+        self.address = address
+        self.count = count
+        self.consumers = {consumer}
+        self.event = event
+        self.data = None
+        self.done_at = None
+
+    # =========================================================================
+    def covers(self, address, count):
+        return self.address <= address \
+            and address + count <= self.address + self.count
+
+
+###############################################################################
+class RequestCoalescer:
+    """
+    share the reads of the schedules polling the same device in the same
+    tick. a read is issued once and the other schedules reading a range in
+    it take their part from the response, while it is in flight or for
+    `window` seconds after. a schedule never takes the same read twice,
+    so every run of a schedule gets a fresh read at least once.
+    """
+    def __init__(self, window=0.5, timeout=5.0):
+        self.window = window
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = collections.defaultdict(list)
+        self.requests = 0
+        self.shared = 0
+
+    # =========================================================================
+    def lookup(self, key, address, count, consumer, event_factory):
+        """
+        :return: (entry, True if the caller must read and complete it)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entries = self._entries[key]
+            entries[:] = [e for e in entries if e.done_at is None
+                          or now - e.done_at <= self.window]
+            for entry in entries:
+                if consumer not in entry.consumers \
+                        and entry.covers(address, count):
+                    entry.consumers.add(consumer)
+                    self.shared += 1
+                    return entry, False
+
+            entry = _Entry(address, count, consumer, event_factory())
+            entries.append(entry)
+            self.requests += 1
+            return entry, True
+
+    # =========================================================================
+    def complete(self, key, entry, data):
+        with self._lock:
+            entry.data = data
+            entry.done_at = time.monotonic()
+            if data is None:
+                # failed. the others read by themselves to report the error
+                self._entries[key].remove(entry)
+        entry.event.set()
+
+    # =========================================================================
+    def invalidate(self, endpoint):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == endpoint]:
+                del self._entries[key]
+
+    # =========================================================================
+    @staticmethod
+    def take(function, unit, entry, address, count):
+        if entry.data is None:
+            return None
+        block = Block(function, unit, entry.address, entry.count)
+        return ReadPlan.slice(
+            block, entry.data, address - entry.address, count)
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            return dict(requests=self.requests, shared=self.shared)
+
+
+###############################################################################
+class CoalescingClient:
+    """
+    the client of one schedule run reading through the RequestCoalescer
+    """
+    def __init__(self, client, coalescer, endpoint, consumer):
+        self.client = client
+        self.coalescer = coalescer
+        self.endpoint = endpoint
+        self.consumer = consumer
+
+    # =========================================================================
+    def __getattr__(self, item):
+        return getattr(self.client, item)
+
+    # =========================================================================
+    def lookup(self, function, command, kwargs, event_factory):
+        try:
+            spec = make_command(READ_FUNCTIONS[function][0], command, **kwargs)
+        except (SystemExit, Exception):
+            return None
+        key = (self.endpoint, function, spec.unit_id)
+        entry, owner = self.coalescer.lookup(
+            key, spec.address, spec.count, self.consumer, event_factory)
+        return key, spec, entry, owner
+
+    # =========================================================================
+    def read(self, function, command=None, **kwargs):
+        found = self.lookup(function, command, kwargs, threading.Event)
+        if found is None:
+            return getattr(self.client, function)(command, **kwargs)
+        key, spec, entry, owner = found
+        if owner:
+            data = None
+            try:
+                data = getattr(self.client, function)(command, **kwargs)
+            finally:
+                self.coalescer.complete(key, entry, data)
+            return data
+
+        data = None
+        if entry.event.wait(self.coalescer.timeout):
+            data = RequestCoalescer.take(
+                function, spec.unit_id, entry, spec.address, spec.count)
+        if data is None:
+            return getattr(self.client, function)(command, **kwargs)
+        return data
+
+    # =========================================================================
+    def write(self, function, command=None, **kwargs):
+        self.coalescer.invalidate(self.endpoint)
+        return getattr(self.client, function)(command, **kwargs)
+
+    # =========================================================================
+    def read_coils(self, command=None, **kwargs):
+        return self.read('read_coils', command, **kwargs)
+
+    # =========================================================================
+    def read_discrete_inputs(self, command=None, **kwargs):
+        return self.read('read_discrete_inputs', command, **kwargs)
+
+    # =========================================================================
+    def read_holding_registers(self, command=None, **kwargs):
+        return self.read('read_holding_registers', command, **kwargs)
+
+    # =========================================================================
+    def read_input_registers(self, command=None, **kwargs):
+        return self.read('read_input_registers', command, **kwargs)
+
+    # =========================================================================
+    def write_single_coil(self, command=None, **kwargs):
+        return self.write('write_single_coil', command, **kwargs)
+
+    # =========================================================================
+    def write_multiple_coils(self, command=None, **kwargs):
+        return self.write('write_multiple_coils', command, **kwargs)
+
+    # =========================================================================
+    def write_single_register(self, command=None, **kwargs):
+        return self.write('write_single_register', command, **kwargs)
+
+    # =========================================================================
+    def write_multiple_registers(self, command=None, **kwargs):
+        return self.write('write_multiple_registers', command, **kwargs)
+
+
+###############################################################################
+class AsyncCoalescingClient(CoalescingClient):
+    # =========================================================================
+    async def read(self, function, command=None, **kwargs):
+        found = self.lookup(function, command, kwargs, asyncio.Event)
+        if found is None:
+            return await getattr(self.client, function)(command, **kwargs)
+        key, spec, entry, owner = found
+        if owner:
+            data = None
+            try:
+                data = await getattr(self.client, function)(command, **kwargs)
+            finally:
+                self.coalescer.complete(key, entry, data)
+            return data
+
+        data = None
+        try:
+            await asyncio.wait_for(
+                entry.event.wait(), self.coalescer.timeout)
+            data = RequestCoalescer.take(
+                function, spec.unit_id, entry, spec.address, spec.count)
+        except asyncio.TimeoutError:
+            pass
+        if data is None:
+            return await getattr(self.client, function)(command, **kwargs)
+        return data
+
+    # =========================================================================
+    async def write(self, function, command=None, **kwargs):
+        self.coalescer.invalidate(self.endpoint)
+        return await getattr(self.client, function)(command, **kwargs)
+
+
+__all__ = ['RequestCoalescer', 'CoalescingClient', 'AsyncCoalescingClient']
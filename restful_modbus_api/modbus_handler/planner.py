@@ -0,0 +1,250 @@
+import ast
+import collections
+
+from restful_modbus_api.modbus_handler import parse_command
+
+# the sub command of the argument parser and the limit of the protocol
+READ_FUNCTIONS = {
+    'read_coils': ('read_coils', 2000),
+    'read_discrete_inputs': ('read_discrete_inputs', 2000),
+    'read_holding_registers': ('read_holding_register', 125),
+    'read_input_registers': ('read_input_register', 125),
+}
+BIT_FUNCTIONS = ('read_coils', 'read_discrete_inputs')
+
+Read = collections.namedtuple(
+    'Read', ('function', 'command', 'unit', 'address', 'count'))
+Block = collections.namedtuple(
+    'Block', ('function', 'unit', 'address', 'count'))
+
+
+###############################################################################
+def find_reads(code):
+    """
+    find the read function calls with a constant command in the script
+    :param code: "a = read_holding_registers('-a 40021 -c 1')"
+    :return: [Read('read_holding_registers', '-a 40021 -c 1', 0, 40021, 1)]
+    """
+    reads = list()
+    for node in ast.walk(ast.parse(code)):
+        if not isinstance(node, ast.Call) \
+                or not isinstance(node.func, ast.Name) \
+                or node.func.id not in READ_FUNCTIONS \
+                or node.keywords or 1 != len(node.args) \
+                or not isinstance(node.args[0], ast.Constant) \
+                or not isinstance(node.args[0].value, str):
+            continue
+        function, command = node.func.id, node.args[0].value
+        try:
+            spec = parse_command(READ_FUNCTIONS[function][0], command)
+        except (SystemExit, Exception):
+            # it fails at the run time too, leave it to the function
+            continue
+        reads.append(Read(function, command, spec.unit_id,
+                          spec.address, spec.count))
+    return reads
+
+
+###############################################################################
+class ReadPlanner:
+    """
+    merge the reads of the same function and unit whose ranges are
+    contiguous, overlapped or apart by max_gap at most into one request.
+    a negative max_gap turns the merging off.
+    """
+    def __init__(self, max_gap=0):
+        self.max_gap = max_gap
+
+    # =========================================================================
+    def make_plan(self, code):
+        if self.max_gap < 0:
+            return ReadPlan(dict())
+        groups = collections.defaultdict(set)
+        for read in find_reads(code):
+            groups[(read.function, read.unit)].add(read)
+
+        plan = dict()
+        for (function, unit), reads in groups.items():
+            limit = READ_FUNCTIONS[function][1]
+            members = list()
+            block_start = block_end = None
+            for read in sorted(reads, key=lambda r: (r.address, r.count)):
+                end = read.address + read.count
+                if members and read.address <= block_end + self.max_gap \
+                        and max(end, block_end) - block_start <= limit:
+                    block_end = max(end, block_end)
+                    members.append(read)
+                    continue
+                self._add_block(plan, function, unit,
+                                block_start, block_end, members)
+                members = [read]
+                block_start, block_end = read.address, end
+            self._add_block(plan, function, unit,
+                            block_start, block_end, members)
+        return ReadPlan(plan)
+
+    # =========================================================================
+    @staticmethod
+    def _add_block(plan, function, unit, start, end, members):
+        if len(members) < 2:
+            return
+        block = Block(function, unit, start, end - start)
+        for read in members:
+            plan[(function, read.command)] = (
+                block, read.address - start, read.count)
+
+
+###############################################################################
+class ReadPlan:
+    def __init__(self, reads):
+        # (function, command) -> (block, offset, count)
+        self.reads = reads
+
+    # =========================================================================
+    def __bool__(self):
+        return bool(self.reads)
+
+    # =========================================================================
+    def get(self, function, command):
+        return self.reads.get((function, command))
+
+    # =========================================================================
+    @staticmethod
+    def block_keywords(block):
+        return dict(address=block.address, count=block.count, unit=block.unit)
+
+    # =========================================================================
+    @staticmethod
+    def slice(block, data, offset, count):
+        """
+        cut the response of the read out of the response of the block
+        the bits are expanded to a byte each, the most significant bit of
+        each packed byte comes first. see expand_bits
+        """
+        if block.function not in BIT_FUNCTIONS:
+            if len(data) < (offset + count) * 2:
+                return None
+            return data[offset * 2:(offset + count) * 2]
+
+        if len(data) < block.count:
+            return None
+        result = bytearray(((count + 7) // 8) * 8)
+        for i in range(count):
+            bit = offset + i
+            result[i - i % 8 + 7 - i % 8] = data[bit - bit % 8 + 7 - bit % 8]
+        return bytes(result)
+
+
+###############################################################################
+class PlannedClient:
+    """
+    serve the planned reads of one script run from the merged block reads.
+    the block is read at the first read in it and forgot after any write.
+    a read served by the block already, e.g. a status polled in a loop,
+    reads the block again. the reads given with the keywords are not
+    planned.
+    """
+    def __init__(self, client, plan):
+        self.client = client
+        self.plan = plan
+        self.blocks = dict()
+        # the reads served by the blocks as they are read now
+        self.served = dict()
+
+    # =========================================================================
+    def stale(self, block, function, command):
+        """
+        :return: if the block is to be read for the read
+        """
+        served = self.served.get(block)
+        if block not in self.blocks or served is None \
+                or (function, command) in served:
+            self.served[block] = {(function, command)}
+            return True
+        served.add((function, command))
+        return False
+
+    # =========================================================================
+    def __getattr__(self, item):
+        return getattr(self.client, item)
+
+    # =========================================================================
+    def read(self, function, command=None, **kwargs):
+        entry = None if kwargs else self.plan.get(function, command)
+        if entry is None:
+            return getattr(self.client, function)(command, **kwargs)
+        block, offset, count = entry
+        if self.stale(block, function, command):
+            self.blocks[block] = getattr(self.client, function)(
+                **ReadPlan.block_keywords(block))
+        data = self.blocks[block]
+        data = data and ReadPlan.slice(block, data, offset, count)
+        if data is None:
+            # the merged read is failed. e.g. unmapped registers in the gap
+            return getattr(self.client, function)(command, **kwargs)
+        return data
+
+    # =========================================================================
+    def write(self, function, command=None, **kwargs):
+        self.blocks.clear()
+        self.served.clear()
+        return getattr(self.client, function)(command, **kwargs)
+
+    # =========================================================================
+    def read_coils(self, command=None, **kwargs):
+        return self.read('read_coils', command, **kwargs)
+
+    # =========================================================================
+    def read_discrete_inputs(self, command=None, **kwargs):
+        return self.read('read_discrete_inputs', command, **kwargs)
+
+    # =========================================================================
+    def read_holding_registers(self, command=None, **kwargs):
+        return self.read('read_holding_registers', command, **kwargs)
+
+    # =========================================================================
+    def read_input_registers(self, command=None, **kwargs):
+        return self.read('read_input_registers', command, **kwargs)
+
+    # =========================================================================
+    def write_single_coil(self, command=None, **kwargs):
+        return self.write('write_single_coil', command, **kwargs)
+
+    # =========================================================================
+    def write_multiple_coils(self, command=None, **kwargs):
+        return self.write('write_multiple_coils', command, **kwargs)
+
+    # =========================================================================
+    def write_single_register(self, command=None, **kwargs):
+        return self.write('write_single_register', command, **kwargs)
+
+    # =========================================================================
+    def write_multiple_registers(self, command=None, **kwargs):
+        return self.write('write_multiple_registers', command, **kwargs)
+
+
+###############################################################################
+class AsyncPlannedClient(PlannedClient):
+    # =========================================================================
+    async def read(self, function, command=None, **kwargs):
+        entry = None if kwargs else self.plan.get(function, command)
+        if entry is None:
+            return await getattr(self.client, function)(command, **kwargs)
+        block, offset, count = entry
+        if self.stale(block, function, command):
+            self.blocks[block] = await getattr(self.client, function)(
+                **ReadPlan.block_keywords(block))
+        data = self.blocks[block]
+        data = data and ReadPlan.slice(block, data, offset, count)
+        if data is None:
+            return await getattr(self.client, function)(command, **kwargs)
+        return data
+
+    # =========================================================================
+    async def write(self, function, command=None, **kwargs):
+        self.blocks.clear()
+        self.served.clear()
+        return await getattr(self.client, function)(command, **kwargs)
+
+
+__all__ = ['ReadPlanner', 'ReadPlan', 'PlannedClient', 'AsyncPlannedClient']
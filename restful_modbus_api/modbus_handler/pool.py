@@ -0,0 +1,207 @@
+import logging
+import select
+import threading
+import time
+import contextlib
+from collections import deque
+
+from pymodbus import exceptions
+from pymodbus.client.sync import ModbusTcpClient as _ModbusClient
+from restful_modbus_api.modbus_handler import ModbusClient
+
+
+###############################################################################
+class ExceptionPoolTimeout(exceptions.ConnectionException):
+    pass
+
+
+###############################################################################
+class _Endpoint:
+    def __init__(self, key, lock):
+        self.key = key
+        self.condition = threading.Condition(lock)
+        # (client, released time), the most recently used one is on the right
+        self.idle = deque()
+        self.size = 0
+        self.in_use = 0
+        self.failures = 0
+        self.retry_at = 0.0
+
+
+###############################################################################
+class ConnectionPool:
+    """
+    long-lived ModbusClient connections keyed by (host, port, mode)
+    the sockets are kept open between the schedule runs and lent to one
+    borrower at a time.
+    """
+    def __init__(self, max_connections=4, idle_timeout=60.0, wait_timeout=3.0,
+                 backoff=0.5, max_backoff=30.0):
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self._endpoints = dict()
+        self._evicted_at = time.monotonic()
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    # =========================================================================
+    @contextlib.contextmanager
+    def connection(self, host, port, mode):
+        client = self.acquire(host, port, mode)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    # =========================================================================
+    def acquire(self, host, port, mode):
+        key = (host, port, mode)
+        deadline = time.monotonic() + self.wait_timeout
+        with self._lock:
+            self._evict_idle_periodically()
+            endpoint = self._endpoints.get(key)
+            if endpoint is None:
+                endpoint = self._endpoints[key] = _Endpoint(key, self._lock)
+
+            while True:
+                if endpoint.idle:
+                    client, _ = endpoint.idle.pop()
+                    self.reused += 1
+                    break
+                if endpoint.size < self.max_connections:
+                    client = None
+                    endpoint.size += 1
+                    self.created += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ExceptionPoolTimeout(
+                        f'No connection to {host}:{port} is available. '
+                        f'{endpoint.size} connections are in use.')
+                endpoint.condition.wait(remaining)
+            endpoint.in_use += 1
+
+        try:
+            if client is None:
+                client = ModbusClient(host, port, mode)
+                client.pool_key = key
+            self._ensure_connected(endpoint, client)
+        except Exception:
+            with self._lock:
+                endpoint.in_use -= 1
+                endpoint.size -= 1
+                endpoint.condition.notify()
+            if client is not None:
+                _ModbusClient.close(client)
+            raise
+        return client
+
+    # =========================================================================
+    def release(self, client):
+        with self._lock:
+            endpoint = self._endpoints[client.pool_key]
+            endpoint.in_use -= 1
+            if client.is_socket_open():
+                endpoint.idle.append((client, time.monotonic()))
+            else:
+                # the socket is closed by the error handler of the client.
+                endpoint.size -= 1
+            endpoint.condition.notify()
+
+    # =========================================================================
+    @staticmethod
+    def is_healthy(client):
+        if not client.is_socket_open():
+            return False
+        try:
+            # an idle socket must have nothing to read. readable means the
+            # server closed the connection or sent a stale response.
+            readable, _, _ = select.select([client.socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    # =========================================================================
+    def _ensure_connected(self, endpoint, client):
+        if ConnectionPool.is_healthy(client):
+            return
+        _ModbusClient.close(client)
+
+        # the backoff is shared by the borrowers. the connecting is out of
+        # the lock
+        with self._lock:
+            now = time.monotonic()
+            if now < endpoint.retry_at:
+                raise exceptions.ConnectionException(
+                    f'{client.host}:{client.port} - waiting '
+                    f'{endpoint.retry_at - now:.1f}s before reconnecting')
+        connected = client.connect()
+        with self._lock:
+            if connected:
+                endpoint.failures = 0
+                endpoint.retry_at = 0.0
+                return
+            endpoint.failures += 1
+            delay = min(self.backoff * 2 ** (endpoint.failures - 1),
+                        self.max_backoff)
+            endpoint.retry_at = time.monotonic() + delay
+        logging.warning(f'Failed to connect to {client.host}:{client.port}. '
+                        f'Retry after {delay:.1f}s.')
+        raise exceptions.ConnectionException(
+            f'Failed to connect to {client.host}:{client.port}')
+
+    # =========================================================================
+    def _evict_idle_periodically(self):
+        now = time.monotonic()
+        if now - self._evicted_at < self.idle_timeout / 2:
+            return
+        self._evicted_at = now
+        self._evict_idle(now)
+
+    # =========================================================================
+    def _evict_idle(self, now):
+        for endpoint in self._endpoints.values():
+            while endpoint.idle and \
+                    now - endpoint.idle[0][1] > self.idle_timeout:
+                client, _ = endpoint.idle.popleft()
+                _ModbusClient.close(client)
+                endpoint.size -= 1
+                self.evicted += 1
+
+    # =========================================================================
+    def evict_idle(self):
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    # =========================================================================
+    def close(self):
+        with self._lock:
+            for endpoint in self._endpoints.values():
+                while endpoint.idle:
+                    client, _ = endpoint.idle.popleft()
+                    _ModbusClient.close(client)
+                    endpoint.size -= 1
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            endpoints = list()
+            for (host, port, mode), e in self._endpoints.items():
+                endpoints.append(dict(
+                    host=host, port=port, mode=mode,
+                    size=e.size, idle=len(e.idle), in_use=e.in_use,
+                    failures=e.failures))
+            return dict(created=self.created,
+                        reused=self.reused,
+                        evicted=self.evicted,
+                        endpoints=endpoints)
+
+
+__all__ = ['ConnectionPool', 'ExceptionPoolTimeout']
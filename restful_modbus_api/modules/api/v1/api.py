@@ -1,18 +1,26 @@
 import flask
 import logging
 import operator
-from flask import request, abort, make_response
+from flask import request, abort, make_response, Response
 from flask import jsonify, redirect, url_for
 from functools import wraps
 from restful_modbus_api.modules.api import CustomBlueprint
+from restful_modbus_api.columnar import ENCODERS
 
 from restful_modbus_api.manager import (
+    Collector,
     ExceptionResponse,
     ExceptionScheduleReduplicated,
+    ExceptionInvalidQuery,
     NotFound)
 
 bp = CustomBlueprint('api', __name__)
 
+# seconds between the comments keeping an idle stream open
+KEEPALIVE = 15
+# the media types of the collected data by the accept header
+DATA_MIMETYPES = ['application/json'] + list(ENCODERS)
+
 
 ###############################################################################
 def custom_error(message, status_code):
@@ -26,8 +34,15 @@ def result(f):
     def func(*args, **kwargs):
         try:
             r = f(*args, **kwargs)
-            return jsonify(r)
-        except ExceptionScheduleReduplicated as e:
+            if isinstance(r, Response):
+                return r
+            response = jsonify(r)
+            if request.method == 'GET':
+                # 304 Not Modified if the client has the same one
+                response.add_etag()
+                response.make_conditional(request)
+            return response
+        except (ExceptionScheduleReduplicated, ExceptionInvalidQuery) as e:
             return custom_error(str(e), 400)
         except NotFound as e:
             return custom_error(str(e), 404)
@@ -149,7 +164,103 @@ def schedule_data(schedule_name):
     if request.method == 'GET':
         collector = bp.gv['collector']
         query = request.args.to_dict()
+        # ?fields=data01,data02&attrs=value or ?compact=1
+        projection = Collector.make_projection(
+            query.get('fields'), query.get('attrs'), query.get('compact'))
         if 'last_fetch' in query:
-            return collector.get_last_fetch_data(schedule_name)
-        return collector.get_all_data(schedule_name)
+            return collector.get_last_fetch_data(schedule_name, projection)
+
+        mimetype = request.accept_mimetypes.best_match(DATA_MIMETYPES) \
+            if request.accept_mimetypes else 'application/json'
+        if mimetype is None:
+            return custom_error(
+                f'Acceptable: {", ".join(DATA_MIMETYPES)}', 406)
+
+        # the etag is taken before the data, so it is never newer than them
+        etag = None
+        if 'wait' not in query:
+            etag = collector.make_etag(
+                schedule_name, request.query_string + mimetype.encode())
+            if etag in request.if_none_match:
+                response = Response(status=304)
+                response.vary.add('Accept')
+                response.set_etag(etag)
+                return response
+
+        if {'since', 'until', 'limit'} & set(query):
+            data = collector.get_data(
+                schedule_name, since=query.get('since'),
+                until=query.get('until'), limit=query.get('limit'),
+                wait=query.get('wait'), encoding=mimetype,
+                projection=projection)
+        else:
+            data = collector.get_all_data(
+                schedule_name, encoding=mimetype, projection=projection)
+        response = Response(data, mimetype=mimetype)
+        response.vary.add('Accept')
+        if etag is not None:
+            response.set_etag(etag)
+        return response
+
+
+###############################################################################
+@bp.route('/snapshot', methods=('GET', ))
+@result
+def snapshot():
+    # the latest data of the schedules in one response
+    # ?schedules=schedule01,schedule02&fields=data01,data02&attrs=value
+    collector = bp.gv['collector']
+    query = request.args.to_dict()
+    schedules = query.get('schedules')
+    projection = Collector.make_projection(
+        query.get('fields'), query.get('attrs'), query.get('compact'))
+    return collector.get_snapshot(
+        schedules.split(',') if schedules else None, projection)
+
+
+###############################################################################
+@bp.route('/metrics', methods=('GET', ))
+def metrics():
+    # the performance of the collector in the prometheus text format
+    text = bp.gv['collector'].get_metrics()
+    if text is None:
+        return custom_error('The metrics are turned off.', 404)
+    return Response(text, content_type='text/plain; version=0.0.4; '
+                                       'charset=utf-8')
+
+
+###############################################################################
+@bp.route('/debug/profile/<string:schedule_name>', methods=('GET', ))
+@result
+def debug_profile(schedule_name):
+    # the timings of the phases and of the modbus calls by the line of the
+    # script in the sampled runs
+    collector = bp.gv['collector']
+    return collector.get_profile(schedule_name)
+
+
+###############################################################################
+@bp.route('/stream', methods=('GET', ))
+def stream():
+    # pushing the collected data as server-sent events
+    # ?schedules=schedule01,schedule02 to choose the schedules
+    collector = bp.gv['collector']
+    schedules = request.args.get('schedules')
+    schedules = schedules.split(',') if schedules else None
+    subscriber = collector.broker.subscribe(schedules)
+
+    def events():
+        dropped = 0
+        try:
+            yield b': connected\n\n'
+            while True:
+                event = subscriber.get(timeout=KEEPALIVE)
+                if subscriber.dropped != dropped:
+                    dropped = subscriber.dropped
+                    yield f'event: dropped\ndata: {dropped}\n\n'.encode()
+                yield event or b': keepalive\n\n'
+        finally:
+            collector.broker.unsubscribe(subscriber)
 
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
@@ -0,0 +1,160 @@
+import sys
+import time
+import random
+import threading
+import collections
+
+from restful_modbus_api.metrics import MODBUS_FUNCTIONS
+
+# prepare: getting the compiled script, connect: taking a connection,
+# io: the modbus functions, script: the script without the io,
+# decode: the json view of the data
+PHASES = ('prepare', 'connect', 'io', 'script', 'decode')
+
+
+###############################################################################
+class Profile:
+    """
+    the timings of one sampled run of a schedule
+    """
+    __slots__ = ('source', 'phases', 'calls')
+
+    def __init__(self):
+        self.source = None
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        # (line number, modbus function, seconds) in the order of the calls
+        self.calls = list()
+
+    # =========================================================================
+    def add(self, phase, seconds):
+        self.phases[phase] += seconds
+
+    # =========================================================================
+    def call(self, line, function, seconds):
+        self.calls.append((line, function, seconds))
+        self.phases['io'] += seconds
+
+
+###############################################################################
+class ProfilingClient:
+    """
+    the client recording the line in the script calling each modbus function
+    """
+    def __init__(self, client, profile):
+        self.client = client
+        self.profile = profile
+
+    # =========================================================================
+    def __getattr__(self, name):
+        function = getattr(self.client, name)
+        if name not in MODBUS_FUNCTIONS:
+            return function
+
+        def profiled(*args, **kwargs):
+            line = sys._getframe(1).f_lineno
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.profile.call(line, name, time.perf_counter() - started)
+        return profiled
+
+
+###############################################################################
+class AsyncProfilingClient(ProfilingClient):
+    # =========================================================================
+    def __getattr__(self, name):
+        function = getattr(self.client, name)
+        if name not in MODBUS_FUNCTIONS:
+            return function
+
+        async def profiled(*args, **kwargs):
+            # the awaiting coroutine of the script
+            line = sys._getframe(1).f_lineno
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.profile.call(line, name, time.perf_counter() - started)
+        return profiled
+
+
+###############################################################################
+def summary(values):
+    values = sorted(values)
+    return dict(count=len(values),
+                mean_ms=sum(values) / len(values) * 1000,
+                p95_ms=values[int(0.95 * (len(values) - 1))] * 1000,
+                max_ms=values[-1] * 1000)
+
+
+###############################################################################
+class Profiler:
+    """
+    the timings of the sampled runs kept in a rolling window per schedule.
+    sample_rate 0 turns the profiling off and 1 profiles every run
+    """
+    def __init__(self, sample_rate=0.0, window=100):
+        self.sample_rate = sample_rate
+        self.window = window
+        self._lock = threading.Lock()
+        self._profiles = dict()
+
+    # =========================================================================
+    def start(self):
+        """
+        :return: the profile of the run if it is sampled. None if not
+        """
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Profile()
+
+    # =========================================================================
+    def record(self, schedule, profile):
+        if profile is None:
+            return
+        with self._lock:
+            profiles = self._profiles.get(schedule)
+            if profiles is None or profiles.maxlen != self.window:
+                profiles = self._profiles[schedule] = collections.deque(
+                    profiles or (), maxlen=self.window)
+            profiles.append(profile)
+
+    # =========================================================================
+    def remove(self, schedule):
+        with self._lock:
+            self._profiles.pop(schedule, None)
+
+    # =========================================================================
+    def report(self, schedule):
+        """
+        :return: the phases and the call sites of the sampled runs.
+        the lines are numbered as insert_number_each_line does.
+        None if no run is sampled
+        """
+        with self._lock:
+            profiles = list(self._profiles.get(schedule, ()))
+        if not profiles:
+            return None
+        phases = {phase: summary([p.phases[phase] for p in profiles])
+                  for phase in PHASES}
+        sites = collections.defaultdict(list)
+        for profile in profiles:
+            for line, function, seconds in profile.calls:
+                sites[(line, function)].append(seconds)
+        lines = (profiles[-1].source or '').split('\n')
+        calls = list()
+        for (line, function), values in sites.items():
+            site = dict(line=line, function=function,
+                        code=lines[line - 1].strip()
+                        if 0 < line <= len(lines) else None,
+                        total_ms=sum(values) * 1000)
+            site.update(summary(values))
+            calls.append(site)
+        calls.sort(key=lambda site: site['total_ms'], reverse=True)
+        return dict(runs=len(profiles), sample_rate=self.sample_rate,
+                    phases=phases, calls=calls)
+
+
+__all__ = ['Profiler', 'Profile', 'ProfilingClient', 'AsyncProfilingClient',
+           'PHASES']
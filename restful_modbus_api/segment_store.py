@@ -0,0 +1,490 @@
+import os
+import json
+import mmap
+import shutil
+import struct
+import logging
+import collections
+import threading
+import urllib.parse
+
+from restful_modbus_api.history import make_sample, DEFAULT_DEPTH
+from restful_modbus_api.modbus_handler import get_template_decoder
+
+# magic, version, width of the data, number of the records,
+# the sequence number of the first record, the first and the last timestamp
+HEADER = struct.Struct('<4sHxxIIQdd')
+# the length of the template json following the header
+TEMPLATE_LENGTH = struct.Struct('<I')
+# timestamp, length of the data. the data follows up to the width
+RECORD = struct.Struct('<dI')
+MAGIC = b'RMAS'
+VERSION = 1
+SUFFIX = '.seg'
+
+SegmentInfo = collections.namedtuple(
+    'SegmentInfo', ('path', 'first', 'last', 'count', 'size', 'first_seq'))
+
+
+###############################################################################
+class Segment:
+    """
+    one file of fixed-width records of a schedule. the template of the
+    records is kept once in the header. the file is memory-mapped, so the
+    records do not take the process heap.
+    """
+    def __init__(self, path, mapped, template, width, capacity, offset):
+        self.path = path
+        self.mapped = mapped
+        self.template = template
+        self.width = width
+        self.capacity = capacity
+        self.offset = offset
+        self.record_size = RECORD.size + width
+        _, _, _, self.count, self.first_seq, self.first, self.last = \
+            HEADER.unpack_from(mapped)
+
+    # =========================================================================
+    @classmethod
+    def create(cls, path, template, width, capacity, first_seq):
+        encoded = json.dumps(template).encode('utf-8')
+        offset = HEADER.size + TEMPLATE_LENGTH.size + len(encoded)
+        offset += -offset % 8
+        size = offset + capacity * (RECORD.size + width)
+        with open(path, 'w+b') as f:
+            f.truncate(size)
+            mapped = mmap.mmap(f.fileno(), size)
+        HEADER.pack_into(
+            mapped, 0, MAGIC, VERSION, width, 0, first_seq, 0.0, 0.0)
+        TEMPLATE_LENGTH.pack_into(mapped, HEADER.size, len(encoded))
+        start = HEADER.size + TEMPLATE_LENGTH.size
+        mapped[start:start + len(encoded)] = encoded
+        return cls(path, mapped, template, width, capacity, offset)
+
+    # =========================================================================
+    @classmethod
+    def open(cls, path, writable=False):
+        with open(path, 'r+b' if writable else 'rb') as f:
+            access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+            mapped = mmap.mmap(f.fileno(), 0, access=access)
+        magic, version, width, _, _, _, _ = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            mapped.close()
+            raise ValueError(f'{path} is not a segment file')
+        start = HEADER.size + TEMPLATE_LENGTH.size
+        length, = TEMPLATE_LENGTH.unpack_from(mapped, HEADER.size)
+        template = json.loads(bytes(mapped[start:start + length]))
+        offset = start + length
+        offset += -offset % 8
+        capacity = (len(mapped) - offset) // (RECORD.size + width)
+        return cls(path, mapped, template, width, capacity, offset)
+
+    # =========================================================================
+    def close(self):
+        if self.mapped is not None:
+            self.mapped.close()
+            self.mapped = None
+
+    # =========================================================================
+    @property
+    def size(self):
+        return self.offset + self.capacity * self.record_size
+
+    # =========================================================================
+    @property
+    def info(self):
+        return SegmentInfo(self.path, self.first, self.last, self.count,
+                           self.size, self.first_seq)
+
+    # =========================================================================
+    def fits(self, template, data):
+        return self.count < self.capacity and len(data) <= self.width \
+            and self.template == template
+
+    # =========================================================================
+    def append(self, timestamp, data):
+        position = self.offset + self.count * self.record_size
+        RECORD.pack_into(self.mapped, position, timestamp, len(data))
+        position += RECORD.size
+        self.mapped[position:position + len(data)] = data
+        # the record is counted after it is written
+        self.count += 1
+        self.last = timestamp
+        if 1 == self.count:
+            self.first = timestamp
+        HEADER.pack_into(self.mapped, 0, MAGIC, VERSION, self.width,
+                         self.count, self.first_seq, self.first, self.last)
+
+    # =========================================================================
+    def timestamp(self, index):
+        return RECORD.unpack_from(
+            self.mapped, self.offset + index * self.record_size)[0]
+
+    # =========================================================================
+    def record(self, index):
+        """
+        :return: (data, timestamp) of the record
+        """
+        position = self.offset + index * self.record_size
+        timestamp, length = RECORD.unpack_from(self.mapped, position)
+        position += RECORD.size
+        return bytes(self.mapped[position:position + length]), timestamp
+
+    # =========================================================================
+    def bisect(self, timestamp):
+        """
+        the index of the first record at or after the timestamp
+        """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+###############################################################################
+class _Schedule:
+    __slots__ = ('directory', 'segments', 'current', 'fetched', 'depth')
+
+    def __init__(self, directory, depth):
+        self.directory = directory
+        # SegmentInfo of the segments, the oldest first
+        self.segments = list()
+        self.current = None
+        self.fetched = True
+        self.depth = depth
+
+    # =========================================================================
+    @property
+    def last_seq(self):
+        if not self.segments:
+            return 0
+        info = self.segments[-1]
+        return info.first_seq + info.count - 1
+
+    # =========================================================================
+    def __bool__(self):
+        return any(info.count for info in self.segments)
+
+
+###############################################################################
+class SegmentStore:
+    """
+    the collected samples of the schedules kept on the disk.
+    a schedule is a directory of append-only segment files of fixed-width
+    records, named by their sequence numbers. the first and the last
+    timestamps of the segments and the timestamps in them make the time
+    index of the range queries.
+    the oldest segments are removed beyond retention_seconds or
+    retention_bytes of a schedule when it is appended.
+    the timestamps are expected to be increasing in a schedule.
+    """
+    def __init__(self, path, records_per_segment=3600,
+                 retention_seconds=None, retention_bytes=None,
+                 depth=DEFAULT_DEPTH):
+        self.path = path
+        self.records_per_segment = records_per_segment
+        self.retention_seconds = retention_seconds
+        self.retention_bytes = retention_bytes
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._schedules = dict()
+        os.makedirs(path, exist_ok=True)
+
+    # =========================================================================
+    def _directory(self, name):
+        name = urllib.parse.quote(name, safe='').replace('.', '%2E')
+        return os.path.join(self.path, name)
+
+    # =========================================================================
+    def _schedule(self, name, create=False):
+        schedule = self._schedules.get(name)
+        if schedule is not None:
+            return schedule
+        directory = self._directory(name)
+        if not os.path.isdir(directory):
+            if not create:
+                return None
+            os.makedirs(directory)
+        schedule = _Schedule(directory, self.depth)
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(SUFFIX):
+                continue
+            path = os.path.join(directory, file_name)
+            try:
+                segment = Segment.open(path)
+            except (OSError, ValueError) as e:
+                logging.warning(f'Skipping the segment {path}: {e}')
+                continue
+            schedule.segments.append(segment.info)
+            segment.close()
+        self._schedules[name] = schedule
+        return schedule
+
+    # =========================================================================
+    def configure(self, name, depth=None):
+        """
+        :param depth: the number of the samples returned by get_all
+        """
+        depth = self.depth if depth is None else int(depth)
+        if depth < 1:
+            raise ValueError(f'{name}: the history depth must be positive')
+        with self._lock:
+            self._schedule(name, create=True).depth = depth
+
+    # =========================================================================
+    def append(self, name, template, data, timestamp):
+        data = bytes(memoryview(data))
+        with self._lock:
+            schedule = self._schedule(name, create=True)
+            current = schedule.current
+            if current is None and schedule.segments:
+                current = schedule.current = Segment.open(
+                    schedule.segments[-1].path, True)
+            if current is None or not current.fits(template, data):
+                current = self._roll(schedule, template, data)
+            current.append(timestamp, data)
+            schedule.segments[-1] = current.info
+            schedule.fetched = False
+            seq = schedule.last_seq
+            expired = self._apply_retention(schedule, timestamp)
+        # the files are removed out of the lock not to stop the collecting
+        for path in expired:
+            self._remove_file(path)
+        return seq
+
+    # =========================================================================
+    def _roll(self, schedule, template, data):
+        if schedule.current is not None:
+            schedule.current.close()
+        decoder = get_template_decoder(template)
+        width = max(decoder.size if decoder else 0, len(data))
+        number = 0
+        if schedule.segments:
+            number = int(os.path.basename(
+                schedule.segments[-1].path)[:-len(SUFFIX)]) + 1
+        path = os.path.join(schedule.directory, f'{number:012d}{SUFFIX}')
+        segment = Segment.create(path, template, width,
+                                 self.records_per_segment,
+                                 schedule.last_seq + 1)
+        schedule.current = segment
+        schedule.segments.append(segment.info)
+        return segment
+
+    # =========================================================================
+    def _apply_retention(self, schedule, now):
+        """
+        take the oldest segments beyond the retention out of the schedule.
+        the segment being written is kept
+        :return: the paths of the segment files to remove
+        """
+        expired = list()
+        while len(schedule.segments) > 1:
+            oldest = schedule.segments[0]
+            too_old = self.retention_seconds is not None \
+                and oldest.last < now - self.retention_seconds
+            oversize = self.retention_bytes is not None \
+                and sum(i.size for i in schedule.segments) \
+                > self.retention_bytes
+            if not too_old and not oversize:
+                break
+            expired.append(oldest.path)
+            del schedule.segments[0]
+        return expired
+
+    # =========================================================================
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning(f'Failed to remove the segment {path}: {e}')
+
+    # =========================================================================
+    @staticmethod
+    def _open(info):
+        """
+        a read-only segment of the records counted in the info. the records
+        appended after the info are not read
+        :return: the segment. None if the file is removed by the retention
+        """
+        try:
+            segment = Segment.open(info.path)
+        except FileNotFoundError:
+            return None
+        segment.count = min(segment.count, info.count)
+        return segment
+
+    # =========================================================================
+    def query(self, name, since=None, until=None, limit=None, after=None,
+              render=None):
+        """
+        :param since: seconds since the epoch. the records at or after it
+        :param until: seconds since the epoch. the records at or before it
+        :param limit: the number of the newest records
+        :param after: sequence number. the records after it
+        :param render: the function making the view of a record from
+        (data, template, timestamp, seq). make_sample if None
+        :return: the views of the records, the newest first
+        :raise KeyError: nothing is collected for the schedule
+        """
+        with self._lock:
+            schedule = self._schedule(name)
+            if not schedule:
+                raise KeyError(name)
+            # the segments are read out of the lock, up to the records
+            # counted now, so the collecting does not wait for the query
+            segments = list(schedule.segments)
+        records = list()
+        for info in reversed(segments):
+            if limit is not None and len(records) >= limit:
+                break
+            if not info.count \
+                    or since is not None and info.last < since \
+                    or until is not None and info.first > until:
+                continue
+            if after is not None \
+                    and info.first_seq + info.count - 1 <= after:
+                break
+            segment = self._open(info)
+            if segment is None:
+                continue
+            try:
+                records.extend(self._read(
+                    segment, since, until, limit and limit - len(records),
+                    after))
+            finally:
+                segment.close()
+        render = render or make_sample
+        return [render(data, template, ts, seq)
+                for data, ts, seq, template in records]
+
+    # =========================================================================
+    @staticmethod
+    def _read(segment, since, until, limit, after):
+        start = 0 if since is None else segment.bisect(since)
+        if after is not None:
+            start = max(start, after - segment.first_seq + 1)
+        end = segment.count if until is None \
+            else segment.bisect(until + 1e-6)
+        records = list()
+        for index in range(end - 1, start - 1, -1):
+            if limit is not None and len(records) >= limit:
+                break
+            data, ts = segment.record(index)
+            records.append((data, ts, segment.first_seq + index,
+                            segment.template))
+        return records
+
+    # =========================================================================
+    def get_all(self, name, render=None):
+        with self._lock:
+            schedule = self._schedule(name)
+            depth = schedule.depth if schedule else self.depth
+        return self.query(name, limit=depth, render=render)
+
+    # =========================================================================
+    def pop_last(self, name, render=None):
+        with self._lock:
+            schedule = self._schedule(name)
+            if not schedule:
+                raise KeyError(name)
+            if schedule.fetched:
+                return None
+            schedule.fetched = True
+        result = self.query(name, limit=1, render=render)
+        return result[0] if result else None
+
+    # =========================================================================
+    def snapshot(self, names, render=None):
+        """
+        the newest records of the schedules at the same moment.
+        it does not change the last fetch
+        :return: {name: the view of the newest record or None}
+        """
+        with self._lock:
+            newest = dict()
+            for name in names:
+                schedule = self._schedule(name)
+                newest[name] = next(
+                    (info for info in reversed(schedule.segments)
+                     if info.count), None) if schedule else None
+        records = dict()
+        for name, info in newest.items():
+            segment = info and self._open(info)
+            records[name] = None
+            if segment is None:
+                continue
+            try:
+                records[name] = self._read(segment, None, None, 1, None)[0]
+            finally:
+                segment.close()
+        render = render or make_sample
+        result = dict()
+        for name, record in records.items():
+            if record is not None:
+                data, ts, seq, template = record
+                record = render(data, template, ts, seq)
+            result[name] = record
+        return result
+
+    # =========================================================================
+    def last_seq(self, name):
+        """
+        :return: the sequence number of the newest record. 0 if nothing
+        """
+        with self._lock:
+            schedule = self._schedule(name)
+            return schedule.last_seq if schedule else 0
+
+    # =========================================================================
+    def remove(self, name, delete=False):
+        """
+        forget the schedule. the segments are kept on the disk and read
+        again if the schedule is added back
+        :param delete: remove the segments from the disk too
+        :return: if anything is kept for the schedule
+        """
+        with self._lock:
+            schedule = self._schedules.pop(name, None)
+            if schedule is not None and schedule.current is not None:
+                schedule.current.close()
+        directory = self._directory(name)
+        found = schedule is not None or os.path.isdir(directory)
+        if delete and os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        return found
+
+    # =========================================================================
+    def stats(self):
+        """
+        the mapped bytes of the segments being written and the bytes of the
+        segments on the disk
+        """
+        with self._lock:
+            schedules = list(self._schedules.values())
+            return dict(
+                memory_bytes=sum(s.current.size for s in schedules
+                                 if s.current is not None),
+                disk_bytes=sum(i.size for s in schedules for i in s.segments),
+                samples=sum(i.count for s in schedules for i in s.segments))
+
+    # =========================================================================
+    def close(self):
+        with self._lock:
+            for schedule in self._schedules.values():
+                if schedule.current is not None:
+                    schedule.current.mapped.flush()
+                    schedule.current.close()
+                    schedule.current = None
+
+    # =========================================================================
+    def __contains__(self, name):
+        with self._lock:
+            return bool(self._schedule(name))
+
+
+__all__ = ['SegmentStore', 'Segment', 'SegmentInfo']
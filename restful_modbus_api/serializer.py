@@ -0,0 +1,92 @@
+import json
+import threading
+
+from restful_modbus_api.history import DEFAULT_DEPTH
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_ENCODER = json.JSONEncoder(separators=(',', ':'), sort_keys=True,
+                            check_circular=False)
+
+
+###############################################################################
+def dumps(value):
+    """
+    the compact json bytes of the value with the keys sorted as jsonify does.
+    orjson is used if it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+    return _ENCODER.encode(value).encode('utf-8')
+
+
+###############################################################################
+def join(fragments):
+    """
+    the json array of the json bytes
+    """
+    return b'[' + b','.join(fragments) + b']'
+
+
+###############################################################################
+class FragmentCache:
+    """
+    the json bytes of the newest samples of each schedule keyed by the
+    sequence number. the samples are serialized once when they are collected
+    and the responses are joined from the bytes
+    """
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self._lock = threading.Lock()
+        self._fragments = dict()
+        self._depths = dict()
+        self.hits = 0
+        self.misses = 0
+
+    # =========================================================================
+    def configure(self, name, depth=None):
+        with self._lock:
+            self._depths[name] = self.depth if depth is None else int(depth)
+
+    # =========================================================================
+    def put(self, name, seq, fragment):
+        with self._lock:
+            fragments = self._fragments.setdefault(name, dict())
+            fragments[seq] = fragment
+            depth = self._depths.get(name, self.depth)
+            while len(fragments) > depth:
+                del fragments[next(iter(fragments))]
+
+    # =========================================================================
+    def get(self, name, seq):
+        """
+        :return: the json bytes of the sample. None if not cached
+        """
+        with self._lock:
+            fragment = self._fragments.get(name, dict()).get(seq)
+            if fragment is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return fragment
+
+    # =========================================================================
+    def remove(self, name):
+        with self._lock:
+            self._depths.pop(name, None)
+            self._fragments.pop(name, None)
+
+    # =========================================================================
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        size=sum(map(len, self._fragments.values())),
+                        bytes=sum(len(f) for fragments in
+                                  self._fragments.values()
+                                  for f in fragments.values()))
+
+
+__all__ = ['FragmentCache', 'dumps', 'join']
@@ -0,0 +1,215 @@
+import os
+import signal
+import time
+import socket
+import logging
+import threading
+import multiprocessing
+from multiprocessing.managers import BaseManager, BaseProxy, MakeProxyType
+from werkzeug.serving import make_server
+
+# the methods of the collector called by the api workers
+COLLECTOR_METHODS = (
+    'add_job_schedules',
+    'get_schedule_jobs',
+    'get_schedule_job',
+    'remove_job_schedule',
+    'modify_job_schedule',
+    'get_templates_in_schedule',
+    'get_the_template_in_schedule',
+    'execute_script_after_finishing',
+    'make_etag',
+    'get_all_data',
+    'get_data',
+    'get_snapshot',
+    'get_last_fetch_data',
+    'get_metrics',
+    'get_profile',
+)
+
+
+# the proxy sending the calls of the api to the collector
+CollectorProxy = MakeProxyType('CollectorProxy', COLLECTOR_METHODS)
+
+
+###############################################################################
+class BrokerProxy(BaseProxy):
+    _exposed_ = ('subscribe', 'has_subscribers', 'stats')
+    _method_to_typeid_ = {'subscribe': 'Subscriber'}
+
+    # =========================================================================
+    def subscribe(self, schedules=None):
+        return self._callmethod('subscribe', (schedules, ))
+
+    # =========================================================================
+    def unsubscribe(self, subscriber):
+        # the subscriber sent back would be another proxy of it
+        subscriber.close()
+
+    # =========================================================================
+    def has_subscribers(self, name):
+        return self._callmethod('has_subscribers', (name, ))
+
+    # =========================================================================
+    def stats(self):
+        return self._callmethod('stats')
+
+
+###############################################################################
+class SubscriberProxy(BaseProxy):
+    _exposed_ = ('get', 'close', '__getattribute__')
+
+    # =========================================================================
+    def get(self, timeout=None):
+        return self._callmethod('get', (timeout, ))
+
+    # =========================================================================
+    def close(self):
+        return self._callmethod('close')
+
+    # =========================================================================
+    @property
+    def dropped(self):
+        return self._callmethod('__getattribute__', ('dropped', ))
+
+
+###############################################################################
+class CollectorManager(BaseManager):
+    """
+    the local channel between the collector process and the api workers
+    """
+
+
+CollectorManager.register('collector', proxytype=CollectorProxy)
+CollectorManager.register('broker', proxytype=BrokerProxy)
+CollectorManager.register('Subscriber', proxytype=SubscriberProxy,
+                          create_method=False)
+
+
+###############################################################################
+class RemoteCollector:
+    """
+    the collector of the collector process seen by an api worker.
+    the calls are sent to the collector process
+    """
+    def __init__(self, manager):
+        self._collector = manager.collector()
+        self.broker = manager.broker()
+
+    # =========================================================================
+    def __getattr__(self, name):
+        return getattr(self._collector, name)
+
+
+###############################################################################
+def start_collector_server(collector, address=None):
+    """
+    share the collector with the api workers in a thread of this process
+    :param address: the unix socket path. a temporary one if None
+    :return: (address, authkey) for connect_collector
+    """
+    class Manager(CollectorManager):
+        # the registry of the subclass keeps the callables to itself
+        pass
+
+    Manager.register('collector', callable=lambda: collector,
+                     proxytype=CollectorProxy)
+    Manager.register('broker', callable=lambda: collector.broker,
+                     proxytype=BrokerProxy)
+    authkey = os.urandom(32)
+    server = Manager(address=address, authkey=authkey).get_server()
+    threading.Thread(target=server.serve_forever, name='collector-server',
+                     daemon=True).start()
+    return server.address, authkey
+
+
+###############################################################################
+def connect_collector(address, authkey):
+    manager = CollectorManager(address=address, authkey=authkey)
+    manager.connect()
+    return RemoteCollector(manager)
+
+
+###############################################################################
+def run_worker(address, authkey, listener):
+    """
+    serve the api on the shared listening socket with the collector of the
+    collector process
+    """
+    from restful_modbus_api.app import create_app
+    app = create_app(connect_collector(address, authkey))
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, app, threaded=True,
+                         fd=listener.fileno())
+    # stopping serve_forever between the requests. an exception raised in
+    # the middle of a call to the collector may leave a lock held forever
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(
+        target=server.shutdown, daemon=True).start())
+    logging.info(f'API worker {os.getpid()} serving on {host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+###############################################################################
+def start_workers(address, authkey, listener, workers):
+    """
+    :return: the processes of the api workers
+    """
+    # not forked from the threads of the collector
+    context = multiprocessing.get_context('spawn')
+    processes = list()
+    for i in range(workers):
+        process = context.Process(
+            target=run_worker, args=(address, authkey, listener),
+            name=f'api-worker-{i}', daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+###############################################################################
+def stop_workers(processes, timeout=10):
+    """
+    terminate the api workers. the ones not stopped in timeout seconds are
+    killed
+    """
+    for process in processes:
+        process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(deadline - time.monotonic(), 0))
+        if process.is_alive():
+            logging.warning(f'{process.name} is killed')
+            process.kill()
+            process.join()
+
+
+###############################################################################
+def serve(collector, host='localhost', port=5000, workers=2, backlog=128,
+          ipc_address=None):
+    """
+    run the api in the worker processes sharing one listening socket.
+    this process keeps the collector, so there is one scheduler whatever
+    the number of the workers
+    """
+    listener = socket.create_server((host, port), backlog=backlog)
+    address, authkey = start_collector_server(collector, ipc_address)
+    processes = start_workers(address, authkey, listener, workers)
+    logging.info(f'Serving on {host}:{port} with {workers} API workers')
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(processes)
+        listener.close()
+        collector.shutdown()
+
+
+__all__ = ['serve', 'start_collector_server', 'connect_collector',
+           'start_workers', 'stop_workers', 'RemoteCollector']
@@ -0,0 +1,82 @@
+import threading
+import pytest
+from pymodbus.server.sync import ModbusTcpServer
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+from pymodbus.datastore import ModbusSequentialDataBlock
+from pymodbus.datastore import ModbusSlaveContext, ModbusServerContext
+from restful_modbus_api.manager import Collector
+from restful_modbus_api.async_manager import AsyncCollector
+
+# the script of the schedules made by schedule(). it calls the modbus
+# functions directly, by a function of its own and by the client
+CODE = '''def read(address):
+    return read_holding_registers(address=address, count=1)
+
+def main():
+    if kwargs.get('fail'):
+        raise ValueError('failed')
+    a = read_holding_registers('-a 40002 -c 2')
+    b = read(40010)
+    c = client.read_input_registers('-a 40004 -c 1')
+    return a + b + c + (kwargs.get('abc', 7)).to_bytes(2, 'big')
+'''
+
+TEMPLATE = [
+    {'key': 'data01', 'note': None, 'type': 'B32_UINT', 'scale': None},
+    {'key': 'data02', 'note': None, 'type': 'B16_UINT', 'scale': None},
+    {'key': 'data03', 'note': None, 'type': 'B16_UINT', 'scale': None},
+    {'key': 'data04', 'note': None, 'type': 'B16_UINT', 'scale': None},
+]
+
+
+###############################################################################
+def schedule(name, address, mode='tcp', code=CODE):
+    host, port = address
+    return dict(
+        schedule_name=name,
+        description='',
+        comm=dict(type=mode, setting=dict(host=host, port=port)),
+        trigger=dict(type='interval', setting=dict(hours=1)),
+        default_template='test',
+        templates=dict(test=dict(code=code, template=TEMPLATE)))
+
+
+###############################################################################
+def start_modbus_server(framer):
+    block = ModbusSequentialDataBlock(40001, list(range(100)))
+    bits = ModbusSequentialDataBlock(1, [i % 3 == 0 for i in range(100)])
+    store = ModbusSlaveContext(hr=block, ir=block, co=bits, di=bits,
+                               zero_mode=True)
+    context = ModbusServerContext(slaves=store, single=True)
+    server = ModbusTcpServer(context, framer=framer,
+                             address=('127.0.0.1', 0))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+###############################################################################
+@pytest.fixture(scope='session')
+def modbus_server():
+    server = start_modbus_server(ModbusSocketFramer)
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+###############################################################################
+@pytest.fixture(scope='session')
+def modbus_rtu_server():
+    server = start_modbus_server(ModbusRtuFramer)
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+###############################################################################
+@pytest.fixture(params=[Collector, AsyncCollector])
+def collector(request):
+    collector = request.param()
+    yield collector
+    collector.shutdown()
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+import pytest
+from restful_modbus_api.manager import Collector
+from restful_modbus_api.async_manager import AsyncCollector
+from restful_modbus_api.database import SQLiteStore
+from restful_modbus_api.tests.conftest import schedule, TEMPLATE
+
+
+###############################################################################
+@pytest.fixture
+def collectors():
+    collectors = Collector(), AsyncCollector()
+    yield collectors
+    for collector in collectors:
+        collector.shutdown()
+
+
+###############################################################################
+@pytest.mark.parametrize('mode, server', [
+    ('tcp', 'modbus_server'),
+    ('rtu-over-tcp', 'modbus_rtu_server')])
+def test_0100_same_result(collectors, request, mode, server):
+    address = request.getfixturevalue(server)
+    results = list()
+    for collector in collectors:
+        collector.add_job_schedules([schedule('test', address, mode)])
+        results.append(collector.execute_script('test', 'test', abc=2))
+    assert results[0]['hex'] == results[1]['hex']
+    assert results[1]['hex'] == '00 01 00 02 00 09 00 03 00 02'
+
+
+###############################################################################
+def test_0110_request_data(collectors, modbus_server):
+    collector = collectors[1]
+    collector.add_job_schedules([schedule('test', modbus_server, 'tcp')])
+    collector.request_data('test')
+    result = collector.request_data('test')
+    data = collector.get_all_data('test')
+    assert 2 == len(data)
+    assert result == data[0]
+    assert data[0]['data']['data04']['value'] == 7
+    assert collector.connection_pool.stats()['created'] == 1
+
+
+###############################################################################
+def test_0120_store_off_the_loop(collectors, modbus_server, mocker):
+    collector = collectors[1]
+    assert collector.scheduler.running
+    collector.add_job_schedules([schedule('test', modbus_server, 'tcp')])
+    append = collector.history.append
+    threads = list()
+
+    def record(*args):
+        threads.append(threading.current_thread())
+        return append(*args)
+    mocker.patch.object(collector.history, 'append', record)
+    collector.request_data('test')
+    # the event loop does not wait for the history
+    assert threads and threads[0] is not collector._loop_thread
+
+
+###############################################################################
+def test_0130_shutdown_closes_history(tmp_path):
+    path = str(tmp_path / 'history.db')
+    history = SQLiteStore(path, flush_interval=60)
+    collector = AsyncCollector(history=history)
+    collector.store_data('test', 'test', b'\x00' * 10, TEMPLATE, 0)
+    collector.shutdown()
+    # the queued sample is written and the writer is stopped
+    assert not history._writer.is_alive()
+    connection = sqlite3.connect(path)
+    assert (1, ) == connection.execute(
+        'SELECT COUNT(*) FROM samples').fetchone()
+    connection.close()
@@ -0,0 +1,126 @@
+from benchmarks import collector as bench
+from benchmarks.devices import load_register_data, DeviceProcess
+
+OPTIONS = dict(schedules=4, interval=0.5, duration=1.5, warmup=0.5,
+               max_connections=2, coalesce_window=0)
+
+
+###############################################################################
+def test_0100_register_data():
+    register_data = load_register_data()
+    assert len(register_data) == 30
+    assert register_data[0] == 0x7765
+
+
+###############################################################################
+def test_0200_percentiles():
+    assert bench.percentiles([]) == dict(p50=None, p90=None, p99=None,
+                                         max=None)
+    result = bench.percentiles(list(range(1, 101)))
+    assert result == dict(p50=51, p90=91, p99=100, max=100)
+
+
+###############################################################################
+def test_0300_run_case(modbus_server, modbus_rtu_server):
+    for comm, address in (('tcp', modbus_server),
+                          ('rtu-over-tcp', modbus_rtu_server)):
+        result = bench.run_case(comm, 'thread', [address], OPTIONS)
+        assert result['errors'] == 0
+        assert result['samples'] > 0
+        assert result['latency_ms']['p50'] > 0
+        assert result['cpu_percent'] >= 0
+
+
+###############################################################################
+def test_0400_devices_and_compare():
+    with DeviceProcess(('tcp', ), 2) as devices:
+        assert len(devices.addresses['tcp']) == 2
+        result = bench.run_case('tcp', 'asyncio', devices.addresses['tcp'],
+                                OPTIONS)
+    assert result['errors'] == 0 and result['samples'] > 0
+    baseline = dict(results=[dict(result, samples_per_sec=1000.0)])
+    rows = bench.compare(baseline, dict(results=[result]))
+    regressed = {row[2]: row[-1] for row in rows}
+    assert regressed['samples_per_sec'] is True
+    assert regressed['errors'] is False
+
+
+###############################################################################
+def test_0500_micro_cases():
+    from benchmarks import micro
+    from restful_modbus_api.modbus_handler import DataType
+    names = [case.name for case in micro.all_cases()]
+    assert len(names) == len(set(names))
+    for data_type in DataType:
+        assert f'decode.{data_type.name}' in names
+    for sub_command, _ in micro.COMMANDS:
+        assert f'parse_args.{sub_command}' in names
+    for case in micro.all_cases():
+        assert case.function() is not None
+
+
+###############################################################################
+def test_0510_micro_regressions():
+    from benchmarks import micro
+    results = micro.run('^(space|chunks)$', min_time=0.001, repeat=1)
+    assert set(results['results']) == {'space', 'chunks'}
+    result = results['results']['space']
+    assert result['ns_per_op'] > 0 and result['peak_bytes'] > 0
+
+    baseline = dict(results={
+        'space': dict(result, ns_per_op=result['ns_per_op'] / 2),
+        'chunks': dict(results['results']['chunks'], ns_per_op=1e12)})
+    slower = micro.regressions(baseline, results, threshold=0.5)
+    assert [row[0] for row in slower] == ['space']
+    assert micro.regressions(baseline, results, threshold=1.5) == []
+
+
+###############################################################################
+def test_0600_load_mix():
+    import argparse
+    import pytest
+    from benchmarks import load
+    assert load.parse_mix('data=3,list') == dict(data=3.0, list=1.0)
+    with pytest.raises(argparse.ArgumentTypeError):
+        load.parse_mix('read=1')
+    with pytest.raises(argparse.ArgumentTypeError):
+        load.parse_mix('data=0')
+
+
+###############################################################################
+def test_0700_load(modbus_server):
+    import threading
+    from werkzeug.serving import make_server
+    from benchmarks import load
+    from restful_modbus_api.app import create_app
+    from restful_modbus_api.manager import Collector
+
+    collector = Collector()
+    schedules = bench.make_schedules(2, [modbus_server], 'tcp', 3600)
+    for schedule in schedules:
+        # the operation of the mix running the template `farm`
+        schedule['templates']['farm'] = schedule['templates']['bench']
+    collector.add_job_schedules(schedules)
+    server = make_server('127.0.0.1', 0, create_app(collector), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+    try:
+        names = load.get_schedules(url)
+        assert sorted(names) == [s['schedule_name'] for s in schedules]
+        collector.request_data(names[0])
+        results = load.measure(url, names, dict(data=1, list=1, run=1),
+                               clients=4, duration=1, idle=0.5, seed=1)
+    finally:
+        server.shutdown()
+        collector.shutdown()
+    endpoints = results['endpoints']
+    assert set(endpoints) == {'data', 'list', 'run'}
+    assert endpoints['list']['error_rate'] == 0
+    assert endpoints['run']['error_rate'] == 0
+    # the other schedule has no data until it is run
+    assert set(endpoints['data']['errors']) <= {'404'}
+    assert endpoints['list']['latency_ms']['p50'] > 0
+    loaded = results['collection']['loaded']
+    assert loaded['failures'] == 0
+    assert loaded['phases']['io']['count'] > 0
+    assert loaded['phases']['io']['p99_ms'] is not None
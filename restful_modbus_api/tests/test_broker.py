@@ -0,0 +1,58 @@
+import json
+from restful_modbus_api.broker import SampleBroker
+
+
+###############################################################################
+def test_0100_serialize_once():
+    broker = SampleBroker()
+    first = broker.subscribe()
+    second = broker.subscribe(['test'])
+    other = broker.subscribe(['other'])
+    calls = list()
+
+    def make_sample():
+        calls.append(1)
+        return dict(seq=1)
+
+    broker.publish('test', make_sample)
+    assert 1 == len(calls)
+    event = first.get(timeout=0)
+    assert event is second.get(timeout=0)
+    assert other.get(timeout=0) is None
+    data = event.decode().split('data: ')[1]
+    assert json.loads(data) == dict(schedule='test', sample=dict(seq=1))
+
+    broker.unsubscribe(first)
+    broker.unsubscribe(second)
+    broker.publish('test', make_sample)
+    assert 1 == len(calls)
+    assert not broker.has_subscribers('test')
+
+
+###############################################################################
+def test_0110_drop_oldest():
+    broker = SampleBroker(queue_size=2)
+    subscriber = broker.subscribe()
+    for i in range(5):
+        broker.publish('test', lambda: dict(seq=i))
+    assert 3 == subscriber.dropped
+    assert b'"seq":3' in subscriber.get(timeout=0)
+    assert broker.stats() == dict(subscribers=1, published=5, dropped=3)
+
+
+###############################################################################
+def test_0200_stream_endpoint():
+    from restful_modbus_api.app import app
+    from restful_modbus_api.modules.api.v1.api import bp
+    broker = bp.gv['collector'].broker
+    with app.test_client() as client:
+        response = client.get('/api/v1/stream?schedules=test',
+                              buffered=False)
+        assert response.mimetype == 'text/event-stream'
+        events = iter(response.response)
+        assert next(events) == b': connected\n\n'
+        broker.publish('other', lambda: dict(seq=1))
+        broker.publish('test', lambda: dict(seq=2))
+        assert b'"seq":2' in next(events)
+        response.close()
+    assert not broker.has_subscribers('test')
@@ -0,0 +1,80 @@
+import threading
+from restful_modbus_api.modbus_handler import parse_command
+from restful_modbus_api.modbus_handler.coalescer import (
+    RequestCoalescer, CoalescingClient)
+
+ENDPOINT = ('localhost', 502, 'tcp')
+
+
+###############################################################################
+class FakeClient:
+    def __init__(self):
+        self.requests = list()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def read_holding_registers(self, command):
+        self.requests.append(command)
+        self.started.set()
+        self.release.wait()
+        spec = parse_command('read_holding_register', command)
+        return b''.join(x.to_bytes(2, 'big') for x in
+                        range(spec.address, spec.address + spec.count))
+
+    def write_single_register(self, command):
+        return b''
+
+
+###############################################################################
+def test_0100_share_completed_read():
+    client = FakeClient()
+    coalescer = RequestCoalescer(window=60)
+    first = CoalescingClient(client, coalescer, ENDPOINT, 'test-1')
+    second = CoalescingClient(client, coalescer, ENDPOINT, 'test-2')
+
+    assert first.read_holding_registers('-a 10 -c 4') == \
+        b'\x00\x0a\x00\x0b\x00\x0c\x00\x0d'
+    assert second.read_holding_registers('-a 11 -c 2') == \
+        b'\x00\x0b\x00\x0c'
+    # the other unit and the range out of the read
+    second.read_holding_registers('-a 11 -c 2 -i 1')
+    second.read_holding_registers('-a 12 -c 4')
+    assert 3 == len(client.requests)
+    assert coalescer.stats() == dict(requests=3, shared=1)
+
+    # the same schedule reads again at the next tick
+    first.read_holding_registers('-a 10 -c 4')
+    assert 4 == len(client.requests)
+
+
+###############################################################################
+def test_0110_share_in_flight_read():
+    client = FakeClient()
+    client.release.clear()
+    coalescer = RequestCoalescer(window=60)
+    first = CoalescingClient(client, coalescer, ENDPOINT, 'test-1')
+    second = CoalescingClient(client, coalescer, ENDPOINT, 'test-2')
+
+    result = dict()
+    thread = threading.Thread(target=lambda: result.setdefault(
+        'first', first.read_holding_registers('-a 10 -c 4')))
+    thread.start()
+    client.started.wait()
+    threading.Timer(0.1, client.release.set).start()
+    result['second'] = second.read_holding_registers('-a 12 -c 1')
+    thread.join()
+    assert result['second'] == b'\x00\x0c'
+    assert 1 == len(client.requests)
+
+
+###############################################################################
+def test_0120_write_invalidates():
+    client = FakeClient()
+    coalescer = RequestCoalescer(window=60)
+    first = CoalescingClient(client, coalescer, ENDPOINT, 'test-1')
+    second = CoalescingClient(client, coalescer, ENDPOINT, 'test-2')
+    first.read_holding_registers('-a 10 -c 4')
+    second.write_single_register('10 --b16int 1')
+    second.read_holding_registers('-a 10 -c 4')
+    assert 2 == len(client.requests)
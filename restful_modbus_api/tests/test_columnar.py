@@ -0,0 +1,97 @@
+import ast
+import math
+import struct
+import pytest
+from restful_modbus_api.columnar import (
+    Columns, packb, record, to_msgpack, to_npy)
+from restful_modbus_api.history import HistoryStore
+
+TEMPLATE = [
+    dict(note='unsigned', type='B16_UINT', key='data01', scale=1),
+    dict(note='scaled', type='B16_INT', key='data02', scale=0.5),
+    dict(note='flag', type='BIT1_BOOLEAN', key='data03', scale=None),
+    dict(note='string', type='B16_STRING', key='data04', scale=None),
+]
+TIMESTAMP = 1613616084.0
+
+
+###############################################################################
+def records():
+    store = HistoryStore()
+    for i in range(3):
+        data = i.to_bytes(2, 'big') + (-i).to_bytes(2, 'big', signed=True) \
+            + bytes([i % 2]) + b'AB'
+        store.append('test', TEMPLATE, data, TIMESTAMP + i)
+    # short data has no values
+    store.append('test', TEMPLATE, b'\x00', TIMESTAMP + 3)
+    return store.get_all('test', render=record)
+
+
+###############################################################################
+@pytest.mark.parametrize('value, packed', [
+    (None, b'\xc0'), (True, b'\xc3'), (1, b'\x01'), (-1, b'\xff'),
+    (200, b'\xcc\xc8'), (-200, b'\xd1\xff\x38'), (70000, b'\xce\x00\x01\x11p'),
+    (2 ** 40, b'\xcf' + struct.pack('>Q', 2 ** 40)),
+    (0.5, b'\xcb?\xe0\x00\x00\x00\x00\x00\x00'), ('ab', b'\xa2ab'),
+    (b'ab', b'\xc4\x02ab'), ([1, 2], b'\x92\x01\x02'),
+    (dict(a=1), b'\x81\xa1a\x01'), ('a' * 40, b'\xd9\x28' + b'a' * 40),
+    (list(range(16)), b'\xdc\x00\x10' + bytes(range(16))),
+])
+def test_0100_packb(value, packed):
+    assert packb(value) == packed
+
+
+###############################################################################
+def test_0200_columns():
+    columns = Columns(records())
+    assert columns.sequences == [4, 3, 2, 1]
+    assert columns.values['data01'] == [None, 2, 1, 0]
+    assert columns.values['data02'] == [None, -1.0, -0.5, 0]
+    assert columns.values['data03'] == [None, False, True, False]
+    assert columns.values['data04'] == [None, b'AB', b'AB', b'AB']
+    assert len(Columns([])) == 0
+
+
+###############################################################################
+def test_0210_msgpack():
+    assert to_msgpack(records()) == packb(dict(
+        timestamp=[TIMESTAMP + i for i in range(3, -1, -1)],
+        seq=[4, 3, 2, 1],
+        data=dict(data01=[None, 2, 1, 0], data02=[None, -1.0, -0.5, 0.0],
+                  data03=[None, False, True, False],
+                  data04=[None, 'AB', 'AB', 'AB'])))
+
+
+###############################################################################
+def test_0220_npy():
+    npy = to_npy(records())
+    assert npy[:8] == b'\x93NUMPY\x01\x00'
+    length, = struct.unpack_from('<H', npy, 8)
+    assert (10 + length) % 64 == 0
+    header = ast.literal_eval(npy[10:10 + length].decode('latin1'))
+    assert header == dict(
+        descr=[('timestamp', '<f8'), ('seq', '<i8'), ('data01', '<i8'),
+               ('data02', '<f8'), ('data03', '|b1'), ('data04', '|S2')],
+        fortran_order=False, shape=(4, ))
+    rows = list(struct.iter_unpack('<dqqd?2s', npy[10 + length:]))
+    assert rows[1] == (TIMESTAMP + 2, 3, 2, -1.0, False, b'AB')
+    assert rows[0][:3] == (TIMESTAMP + 3, 4, 0)
+    assert math.isnan(rows[0][3])
+
+
+###############################################################################
+def test_0230_scaled_out_of_64_bits():
+    template = [dict(note='big', type='B64_UINT', key='data01', scale=1000)]
+    store = HistoryStore()
+    store.append('test', template, b'\xff' * 8, TIMESTAMP)
+    store.append('test', template, b'\x00' * 7 + b'\x01', TIMESTAMP + 1)
+    records = store.get_all('test', render=record)
+    npy = to_npy(records)
+    length, = struct.unpack_from('<H', npy, 8)
+    header = ast.literal_eval(npy[10:10 + length].decode('latin1'))
+    assert header['descr'][2] == ('data01', '<f8')
+    rows = list(struct.iter_unpack('<dqd', npy[10 + length:]))
+    assert rows[0][2] == 1000.0
+    assert rows[1][2] == float((2 ** 64 - 1) * 1000)
+    assert to_msgpack(records).endswith(
+        b'\xcd\x03\xe8\xcb' + struct.pack('>d', (2 ** 64 - 1) * 1000))
@@ -0,0 +1,69 @@
+import pytest
+from restful_modbus_api.modbus_handler import (
+    make_command, parse_command, expand_bits)
+from restful_modbus_api.modbus_handler.pool import ConnectionPool
+
+
+###############################################################################
+def test_0100_parse_cache():
+    parse_command.cache_clear()
+    spec = parse_command('read_holding_register', '-a 40021 -c 1 -i 1')
+    assert (spec.address, spec.count, spec.unit_id) == (40021, 1, 1)
+    assert parse_command('read_holding_register', '-a 40021 -c 1 -i 1') \
+        is spec
+    assert parse_command.cache_info().hits == 1
+
+
+###############################################################################
+@pytest.mark.parametrize('sub_command, command, kwargs', [
+    ('read_coils', '', dict()),
+    ('read_discrete_inputs', '-a 3 -c 9', dict(address=3, count=9)),
+    ('read_holding_register', '-c 3 -i 2', dict(count=3, unit=2)),
+    ('read_input_register', '-a 30003', dict(address=30003)),
+    ('write_single_coil', '3 1', dict(address=3, value=1)),
+    ('write_multiple_coils', '3 0110', dict(address=3, values='0110')),
+    ('write_single_register', '40001 --b16int -3',
+     dict(address=40001, values=[('add_16bit_int', -3)])),
+    ('write_multiple_registers', '40001 --b16uint 3 --string AB',
+     dict(address=40001,
+          values=[('add_16bit_uint', 3), ('add_string', 'AB')])),
+])
+def test_0110_keywords(sub_command, command, kwargs):
+    expected = vars(parse_command(sub_command, command))
+    result = vars(make_command(sub_command, **kwargs))
+    assert {k: v for k, v in expected.items() if k in result} == result
+
+
+###############################################################################
+def test_0120_keyword_errors():
+    with pytest.raises(TypeError):
+        make_command('write_single_coil', address=1)
+    with pytest.raises(TypeError):
+        make_command('read_coils', adress=1)
+    with pytest.raises(TypeError):
+        make_command('read_coils', '-a 1', count=1)
+
+
+###############################################################################
+def test_0200_client_keywords(modbus_server):
+    host, port = modbus_server
+    pool = ConnectionPool()
+    with pool.connection(host, port, 'tcp') as client:
+        assert client.read_holding_registers(address=40002, count=2) == \
+            client.read_holding_registers('-a 40002 -c 2')
+        assert client.read_coils(address=3, count=5) == \
+            client.read_coils('-a 3 -c 5')
+    pool.close()
+
+
+###############################################################################
+def test_0210_packed_bits(modbus_server):
+    host, port = modbus_server
+    pool = ConnectionPool()
+    with pool.connection(host, port, 'tcp') as client:
+        packed = client.read_coils('-a 3 -c 12', packed=True)
+        assert 2 == len(packed)
+        assert expand_bits(packed) == client.read_coils('-a 3 -c 12')
+    pool.close()
+    assert expand_bits(b'\x15\x80') == \
+        b'\x00\x00\x00\x01\x00\x01\x00\x01\x01\x00\x00\x00\x00\x00\x00\x00'
@@ -0,0 +1,82 @@
+import socket
+import threading
+import pytest
+from pymodbus import exceptions
+from restful_modbus_api.modbus_handler.pool import (
+    ConnectionPool, ExceptionPoolTimeout)
+
+
+###############################################################################
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+###############################################################################
+def test_0100_reuse_connection(modbus_server):
+    host, port = modbus_server
+    pool = ConnectionPool()
+    with pool.connection(host, port, 'tcp') as client:
+        first_socket = client.socket
+        assert client.read_holding_registers('-a 40002 -c 1') == b'\x00\x01'
+    with pool.connection(host, port, 'tcp') as client:
+        assert client.socket is first_socket
+    stats = pool.stats()
+    assert stats['created'] == 1 and stats['reused'] == 1
+    pool.close()
+
+
+###############################################################################
+def test_0110_max_connections(modbus_server):
+    host, port = modbus_server
+    pool = ConnectionPool(max_connections=1, wait_timeout=0.1)
+    client = pool.acquire(host, port, 'tcp')
+    with pytest.raises(ExceptionPoolTimeout):
+        pool.acquire(host, port, 'tcp')
+    pool.release(client)
+    pool.release(pool.acquire(host, port, 'tcp'))
+    pool.close()
+
+
+###############################################################################
+def test_0120_idle_eviction(modbus_server):
+    host, port = modbus_server
+    pool = ConnectionPool(idle_timeout=0)
+    pool.release(pool.acquire(host, port, 'tcp'))
+    pool.evict_idle()
+    stats = pool.stats()
+    assert stats['evicted'] == 1
+    assert stats['endpoints'][0]['size'] == 0
+
+
+###############################################################################
+def test_0130_reconnect_backoff():
+    port = unused_port()
+    pool = ConnectionPool(backoff=60)
+    with pytest.raises(exceptions.ConnectionException):
+        pool.acquire('127.0.0.1', port, 'tcp')
+    # the second try does not touch the network until the backoff is over
+    with pytest.raises(exceptions.ConnectionException, match='waiting'):
+        pool.acquire('127.0.0.1', port, 'tcp')
+    assert pool.stats()['endpoints'][0]['failures'] == 1
+
+
+###############################################################################
+def test_0140_concurrent_failures(mocker):
+    port = unused_port()
+    pool = ConnectionPool(max_connections=4, backoff=0)
+    barrier = threading.Barrier(4)
+    mocker.patch('restful_modbus_api.modbus_handler.ModbusClient.connect',
+                 side_effect=lambda: barrier.wait() and False)
+
+    def borrow():
+        with pytest.raises(exceptions.ConnectionException):
+            pool.acquire('127.0.0.1', port, 'tcp')
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every failure of the borrowers connecting at once is counted
+    assert pool.stats()['endpoints'][0]['failures'] == 4
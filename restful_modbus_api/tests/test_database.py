@@ -0,0 +1,101 @@
+import sqlite3
+import pytest
+from restful_modbus_api.history import make_sample
+from restful_modbus_api.database import SQLiteStore
+
+TEMPLATE = [
+    {'key': 'data01', 'note': None, 'type': 'B16_UINT', 'scale': 0.1},
+]
+TIMESTAMP = 1613616084.0
+
+
+###############################################################################
+@pytest.fixture
+def store(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'history.db'), flush_interval=0.01)
+    yield store
+    store.close()
+
+
+###############################################################################
+def test_0100_write_behind(store):
+    with pytest.raises(KeyError):
+        store.get_all('test')
+    for i in range(5):
+        store.append('test', TEMPLATE, i.to_bytes(2, 'big'), TIMESTAMP + i)
+    assert store.pop_last('test') == \
+        make_sample(b'\x00\x04', TEMPLATE, TIMESTAMP + 4, seq=5)
+    assert store.pop_last('test') is None
+
+    store.flush()
+    result = store.query('test', since=TIMESTAMP + 1, until=TIMESTAMP + 3)
+    assert [r['data']['data01']['raw'] for r in result] == [3, 2, 1]
+    assert 2 == len(store.query('test', limit=2))
+    store.configure('test', 4)
+    assert 4 == len(store.get_all('test'))
+
+
+###############################################################################
+def test_0110_remove_and_reopen(tmp_path):
+    path = str(tmp_path / 'history.db')
+    store = SQLiteStore(path)
+    store.append('test', TEMPLATE, b'\x00\x01', TIMESTAMP)
+    store.append('other', TEMPLATE, b'\x00\x02', TIMESTAMP)
+    assert store.remove('test')
+    store.close()
+
+    store = SQLiteStore(path)
+    assert 'test' not in store
+    assert store.get_all('other')[0]['hex'] == '00 02'
+    store.close()
+
+
+###############################################################################
+def test_0120_snapshot(tmp_path):
+    path = str(tmp_path / 'history.db')
+    store = SQLiteStore(path)
+    store.append('test', TEMPLATE, b'\x00\x01', TIMESTAMP)
+    assert store.snapshot(['test'])['test']['seq'] == 1
+    store.close()
+
+    store = SQLiteStore(path)
+    assert store.snapshot(['test', 'other']) == dict(
+        test=make_sample(b'\x00\x01', TEMPLATE, TIMESTAMP, seq=1), other=None)
+    store.close()
+
+
+###############################################################################
+def test_0130_query_while_written(store):
+    for i in range(6):
+        store.append('test', TEMPLATE, i.to_bytes(2, 'big'), TIMESTAMP + i)
+    pending = store._pending['test'][-1]
+    store.append('test', TEMPLATE, b'\x00\x06', TIMESTAMP + 6)
+    store.flush()
+    # the 6th sample is taken as pending and the 7th is written before
+    # the select
+    store._pending['test'].append(pending)
+    result = store.query('test', limit=3)
+    assert [r['seq'] for r in result] == [7, 6, 5]
+    assert [r['seq'] for r in store.query('test')] == list(range(7, 0, -1))
+
+
+###############################################################################
+def test_0140_failed_batch(tmp_path, mocker):
+    path = str(tmp_path / 'history.db')
+    store = SQLiteStore(path, flush_interval=0.01, retries=1)
+    store.append('test', TEMPLATE, b'\x00\x01', TIMESTAMP)
+    store.flush()
+    mocker.patch.object(store, '_write',
+                        side_effect=sqlite3.OperationalError('disk I/O'))
+    store.append('test', TEMPLATE, b'\x00\x02', TIMESTAMP + 1)
+    store.flush()
+    assert 2 == store._write.call_count
+    assert 1 == store.stats()['dropped']
+    store.close()
+
+    # the sequence numbers are read once when it is opened
+    store = SQLiteStore(path)
+    assert 'test' in store
+    assert 1 == store.last_seq('test')
+    assert store.pop_last('test') is None
+    store.close()
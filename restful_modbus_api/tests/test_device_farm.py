@@ -0,0 +1,106 @@
+import time
+import importlib
+import pytest
+from pymodbus.client.sync import ModbusTcpClient
+from pymodbus.exceptions import ConnectionException
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+from restful_modbus_api.manager import Collector
+from restful_modbus_api.async_manager import AsyncCollector
+
+farm = importlib.import_module('dummy-modbus-device-farm')
+FRAMERS = {'tcp': ModbusSocketFramer, 'rtu-over-tcp': ModbusRtuFramer}
+
+
+###############################################################################
+def read(address, framer, unit, register=40001, count=2):
+    host, port = address
+    client = ModbusTcpClient(host, port, framer=FRAMERS[framer], timeout=1)
+    try:
+        return client.read_holding_registers(register, count, unit=unit)
+    finally:
+        client.close()
+
+
+###############################################################################
+def failed(address):
+    # the client raises or answers an error by when the socket is closed
+    try:
+        return read(address, 'tcp', 1).isError()
+    except ConnectionException:
+        return True
+
+
+###############################################################################
+@pytest.mark.parametrize('framer', ['tcp', 'rtu-over-tcp'])
+def test_0100_units_and_live_registers(framer):
+    devices = farm.make_devices(3, framer=framer, units=2)
+    with farm.DeviceFarm(devices, update_interval=0.1) as device_farm:
+        for host, port, _, units in device_farm.addresses:
+            assert units == (1, 2)
+            response = read((host, port), framer, 2)
+            assert response.registers == farm.register_data[:2]
+        address = device_farm.addresses[0][:2]
+        first = read(address, framer, 1, farm.LIVE_ADDRESS, 3).registers
+        time.sleep(0.3)
+        second = read(address, framer, 1, farm.LIVE_ADDRESS, 3).registers
+        assert second[0] > first[0]
+        assert second[1:] != first[1:]
+        # no such unit behind the gateway
+        assert read(address, framer, 9).isError()
+        stats = device_farm.stats()
+        assert (stats['requests'], stats['responses']) == (6, 5)
+
+
+###############################################################################
+def test_0200_faults():
+    devices = farm.make_devices(1, exception_rate=1) \
+        + farm.make_devices(1, start=1, drop_rate=1) \
+        + farm.make_devices(1, start=2, latency=0.2, jitter=0.05)
+    with farm.DeviceFarm(devices, seed=1) as device_farm:
+        addresses = [a[:2] for a in device_farm.addresses]
+        response = read(addresses[0], 'tcp', 1)
+        assert response.isError() and response.exception_code == 4
+        assert failed(addresses[1])
+        started = time.time()
+        assert not read(addresses[2], 'tcp', 1).isError()
+        assert 0.15 <= time.time() - started < 1
+        stats = device_farm.stats()
+    assert (stats['exceptions'], stats['drops'], stats['responses']) == \
+        (1, 1, 2)
+
+
+###############################################################################
+def test_0300_max_connections():
+    devices = farm.make_devices(1, max_connections=1, latency=0.3)
+    with farm.DeviceFarm(devices) as device_farm:
+        address = device_farm.addresses[0][:2]
+        busy = ModbusTcpClient(*address)
+        busy.connect()
+        time.sleep(0.1)
+        assert failed(address)
+        busy.close()
+        assert device_farm.stats()['refused'] == 1
+
+
+###############################################################################
+@pytest.mark.parametrize('engine', [Collector, AsyncCollector])
+def test_0400_collector(engine):
+    devices = farm.make_devices(2, units=2) \
+        + farm.make_devices(1, framer='rtu-over-tcp', start=2)
+    with farm.DeviceFarm(devices) as device_farm:
+        collector = engine()
+        try:
+            schedules = farm.make_schedules(device_farm, interval=3600)
+            assert len(schedules) == 5
+            collector.add_job_schedules(schedules)
+            for schedule in schedules:
+                name = schedule['schedule_name']
+                data = collector.execute_script(name, 'farm')['data']
+                assert data['data01']['value'] == 'welcome!'
+                assert data['data16']['type'] == 'B16_FLOAT'
+            data = collector.execute_script_after_finishing(
+                schedules[1]['schedule_name'], 'write', dict())['data']
+            assert data['counter']['value'] == 0
+        finally:
+            collector.shutdown()
@@ -0,0 +1,141 @@
+import threading
+import time
+import pytest
+from restful_modbus_api.history import HistoryStore, Projection, make_sample
+from restful_modbus_api.manager import (
+    Collector, ExceptionInvalidQuery, NotFound)
+from restful_modbus_api.modbus_handler import format_datetime
+
+TEMPLATE = [
+    {'key': 'data01', 'note': None, 'type': 'B16_UINT', 'scale': 0.1},
+    {'key': 'data02', 'note': 'bits', 'type': 'BIT8', 'scale': None},
+    {'key': 'data03', 'note': None, 'type': 'B8_STRING', 'scale': None},
+]
+TIMESTAMP = 1613616084.0
+
+
+###############################################################################
+def sample(i):
+    return i.to_bytes(2, 'big') + b'\x05A'
+
+
+###############################################################################
+def test_0100_newest_first():
+    store = HistoryStore(depth=3)
+    with pytest.raises(KeyError):
+        store.get_all('test')
+    for i in range(5):
+        store.append('test', TEMPLATE, sample(i), TIMESTAMP + i)
+    result = store.get_all('test')
+    assert [r['data']['data01']['raw'] for r in result] == [4, 3, 2]
+    assert result[0] == make_sample(
+        sample(4), TEMPLATE, TIMESTAMP + 4, seq=5)
+    assert store._buffers['test'].column('data01') == [4, 3, 2]
+
+
+###############################################################################
+def test_0110_last_fetch():
+    store = HistoryStore()
+    store.append('test', TEMPLATE, sample(1), TIMESTAMP)
+    assert store.pop_last('test')['hex'] == '00 01 05 41'
+    assert store.pop_last('test') is None
+    # not of the width of the template
+    store.append('test', TEMPLATE, b'\x00\x02', TIMESTAMP)
+    last = store.pop_last('test')
+    assert last == make_sample(b'\x00\x02', TEMPLATE, TIMESTAMP, seq=2)
+    assert last['data']['data02']['note'] == 'item exists but no data'
+
+
+###############################################################################
+def test_0120_depth_and_template():
+    store = HistoryStore()
+    store.configure('test', 4)
+    for i in range(6):
+        store.append('test', TEMPLATE, sample(i), TIMESTAMP + i)
+    store.configure('test', 2)
+    assert [r['hex'] for r in store.get_all('test')] == \
+        ['00 05 05 41', '00 04 05 41']
+    with pytest.raises(ValueError):
+        store.configure('test', 0)
+
+    # the history starts again with the changed template
+    template = [dict(TEMPLATE[0], scale=1)]
+    store.append('test', template, b'\x00\x07', TIMESTAMP)
+    assert 1 == len(store.get_all('test'))
+    assert store.remove('test') and not store.remove('test')
+
+
+###############################################################################
+def test_0200_collector_get_data():
+    collector = Collector()
+    for i in range(3):
+        collector.history.append('test', TEMPLATE, sample(i), TIMESTAMP + i)
+    since = format_datetime(TIMESTAMP + 1)
+    result = collector.get_data('test', since=since, limit='5')
+    assert [r['datetime'] for r in result] == \
+        [format_datetime(TIMESTAMP + 2), since]
+    with pytest.raises(ExceptionInvalidQuery):
+        collector.get_data('test', since='yesterday')
+    with pytest.raises(NotFound):
+        collector.get_data('other', limit=1)
+    collector.shutdown()
+
+
+###############################################################################
+def test_0210_collector_cursor_and_wait():
+    collector = Collector()
+    for i in range(3):
+        collector.store_data('test', 'test', sample(i), TEMPLATE, 0)
+    result = collector.get_data('test', since='1')
+    assert [r['seq'] for r in result] == [3, 2]
+    assert [] == collector.get_data('test', since='3', wait='0')
+
+    timer = threading.Timer(0.2, collector.store_data,
+                            ('test', 'test', sample(3), TEMPLATE, 0))
+    timer.start()
+    started = time.time()
+    result = collector.get_data('test', since='3', wait='10')
+    assert [r['seq'] for r in result] == [4]
+    assert time.time() - started < 5
+    timer.join()
+    collector.shutdown()
+
+
+###############################################################################
+def test_0220_collector_snapshot():
+    collector = Collector()
+    collector.templates.update(test=dict(), other=dict())
+    for i in range(3):
+        collector.store_data('test', 'test', sample(i), TEMPLATE, 0)
+    snapshot = collector.get_snapshot(
+        projection=Projection(fields=['data01']))
+    assert snapshot['other'] is None
+    assert snapshot['test']['seq'] == 3
+    assert list(snapshot['test']['data']) == ['data01']
+    # not destructive
+    assert collector.get_snapshot(['test']) == collector.get_snapshot(['test'])
+    assert collector.get_last_fetch_data('test')['seq'] == 3
+    collector.templates.clear()
+    collector.shutdown()
+
+
+###############################################################################
+def test_0230_projection():
+    collector = Collector()
+    collector.store_data('test', 'test', sample(3), TEMPLATE, 0)
+    projection = Collector.make_projection('data01,data03', 'value,type')
+    assert collector.get_all_data('test', projection=projection)[0]['data'] \
+        == dict(data01=dict(value=0.30000000000000004, type='B16_UINT'),
+                data03=dict(value='A', type='B8_STRING'))
+    compact = Collector.make_projection(compact='1')
+    result = collector.get_data('test', since='0', projection=compact)[0]
+    assert set(result) == {'datetime', 'seq', 'data'}
+    assert result['data'] == dict(
+        data01=0.30000000000000004, data02='0000101', data03='A')
+    assert Collector.make_projection(compact='0') is None
+    with pytest.raises(ExceptionInvalidQuery):
+        Collector.make_projection(attrs='value,colour')
+    encoded = collector.get_all_data(
+        'test', encoding='application/json', projection=compact)
+    assert encoded.startswith(b'[{"data":{"data01":0.3')
+    collector.shutdown()
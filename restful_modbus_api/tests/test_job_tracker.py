@@ -0,0 +1,92 @@
+import threading
+import time
+import datetime
+import pytest
+from apscheduler.events import JobSubmissionEvent, JobExecutionEvent
+from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_EXECUTED
+from apscheduler.events import EVENT_JOB_MISSED
+from restful_modbus_api.manager import Collector, JobTracker
+
+CODE = '''def main():
+    import time
+    time.sleep(kwargs.get('sleep', 0.5))
+    return read_holding_registers('-a 40002 -c 1')
+'''
+TEMPLATE = [
+    {'key': 'data01', 'note': None, 'type': 'B16_UINT', 'scale': None},
+]
+
+
+###############################################################################
+def test_0100_wait_idle():
+    tracker = JobTracker()
+    assert tracker.wait_idle('test', timeout=0)
+
+    entered = threading.Event()
+
+    def run():
+        with tracker.track('test'):
+            entered.set()
+            time.sleep(0.3)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    entered.wait()
+    assert tracker.is_running('test')
+    assert not tracker.wait_idle('test', timeout=0.01)
+    assert tracker.wait_idle('test', timeout=3)
+    assert not tracker.is_running('test')
+    thread.join()
+
+
+###############################################################################
+def test_0110_submitted_jobs():
+    tracker = JobTracker()
+    now = datetime.datetime.now()
+    submitted = JobSubmissionEvent(EVENT_JOB_SUBMITTED, 'test', 'default',
+                                   [now, now])
+    # running from the submission, before the job starts
+    tracker.on_scheduler_event(submitted)
+    assert tracker.is_running('test')
+    tracker.on_scheduler_event(JobExecutionEvent(
+        EVENT_JOB_MISSED, 'test', 'default', now))
+    assert not tracker.wait_idle('test', timeout=0.01)
+    tracker.on_scheduler_event(JobExecutionEvent(
+        EVENT_JOB_EXECUTED, 'test', 'default', now))
+    assert tracker.wait_idle('test', timeout=0)
+
+    # the end dispatched before the submission
+    tracker.on_scheduler_event(JobExecutionEvent(
+        EVENT_JOB_EXECUTED, 'test', 'default', now))
+    assert not tracker.is_running('test')
+    tracker.on_scheduler_event(JobSubmissionEvent(
+        EVENT_JOB_SUBMITTED, 'test', 'default', [now]))
+    assert not tracker.is_running('test')
+
+
+###############################################################################
+def test_0200_on_demand_run_after_finishing(modbus_server):
+    host, port = modbus_server
+    collector = Collector()
+    collector.add_job_schedules([dict(
+        schedule_name='test',
+        description='',
+        comm=dict(type='tcp', setting=dict(host=host, port=port)),
+        trigger=dict(type='interval', setting=dict(hours=1)),
+        default_template='test',
+        templates=dict(test=dict(code=CODE, template=TEMPLATE)))])
+
+    thread = threading.Thread(target=collector.request_data, args=('test',))
+    thread.start()
+    time.sleep(0.1)
+    with pytest.raises(TimeoutError):
+        collector.execute_script_after_finishing(
+            'test', 'test', dict(sleep=0), timeout=0.01)
+
+    result = collector.execute_script_after_finishing(
+        'test', 'test', dict(sleep=0))
+    # the scheduled run has stored its data before the on-demand run
+    assert 1 == len(collector.get_all_data('test'))
+    assert result['data']['data01']['value'] == 1
+    thread.join()
+    collector.shutdown()
@@ -0,0 +1,81 @@
+import pytest
+from apscheduler.events import (
+    JobExecutionEvent, EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES)
+from restful_modbus_api.metrics import Metrics, BUCKETS
+from restful_modbus_api.tests.conftest import CODE, schedule
+
+
+###############################################################################
+def test_0100_render():
+    metrics = Metrics()
+    metrics.observe('a"b', 'io', 0.003)
+    metrics.observe('a"b', 'io', 100)
+    metrics.count_run('a"b', False)
+    metrics.on_scheduler_event(
+        JobExecutionEvent(EVENT_JOB_MISSED, 'a"b', None, None))
+    metrics.on_scheduler_event(
+        JobExecutionEvent(EVENT_JOB_MAX_INSTANCES, 'a"b', None, None))
+    text = metrics.render([('x', 'gauge x', 'gauge', [(None, 1)])])
+    label = 'schedule="a\\"b",phase="io"'
+    assert f'restful_modbus_phase_seconds_bucket{{{label},le="0.0025"}} 0' \
+        in text
+    assert f'restful_modbus_phase_seconds_bucket{{{label},le="0.005"}} 1' \
+        in text
+    assert f'restful_modbus_phase_seconds_bucket{{{label},le="+Inf"}} 2' \
+        in text
+    assert f'restful_modbus_phase_seconds_count{{{label}}} 2' in text
+    assert 'restful_modbus_runs_total{schedule="a\\"b",result="failure"} 1' \
+        in text
+    assert 'event="missed"} 1' in text and 'event="skipped"} 1' in text
+    assert text.endswith('# TYPE x gauge\nx 1\n')
+    assert len(BUCKETS) + 3 == text.count('phase="io"')
+
+
+###############################################################################
+def test_0200_collector(collector, modbus_server):
+    collector.add_job_schedules([schedule('test', modbus_server)])
+    collector.request_data('test')
+    collector.request_data('test')
+    collector.templates['test']['templates']['test']['code'] = \
+        CODE.replace("kwargs.get('fail')", 'True')
+    with pytest.raises(ValueError):
+        collector.request_data('test')
+    text = collector.get_metrics()
+    for phase in ('connect', 'io', 'script', 'decode'):
+        assert f'restful_modbus_phase_seconds_count{{schedule="test",' \
+               f'phase="{phase}"}} 2' in text
+    assert 'restful_modbus_runs_total{schedule="test",result="success"} 2' \
+        in text
+    assert 'restful_modbus_runs_total{schedule="test",result="failure"} 1' \
+        in text
+    assert 'restful_modbus_pool_connections_total{event="created"} 1' in text
+    assert 'restful_modbus_history_bytes{storage="memory"}' in text
+    assert 'restful_modbus_executor_jobs{state="running"} 0' in text
+
+
+###############################################################################
+def test_0210_turned_off(collector, modbus_server):
+    collector.metrics.enabled = False
+    collector.add_job_schedules([schedule('test', modbus_server)])
+    collector.request_data('test')
+    assert collector.get_metrics() is None
+    collector.metrics.enabled = True
+    assert 'schedule="test"' not in collector.get_metrics()
+
+
+###############################################################################
+def test_0300_endpoint():
+    from restful_modbus_api.app import app
+    from restful_modbus_api.modules.api.v1.api import bp
+    collector = bp.gv['collector']
+    with app.test_client() as client:
+        response = client.get('/api/v1/metrics')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/plain'
+        assert b'# TYPE restful_modbus_phase_seconds histogram' \
+            in response.data
+        collector.metrics.enabled = False
+        try:
+            assert client.get('/api/v1/metrics').status_code == 404
+        finally:
+            collector.metrics.enabled = True
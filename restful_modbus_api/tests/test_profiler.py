@@ -0,0 +1,68 @@
+import pytest
+from restful_modbus_api.manager import Collector, NotFound
+from restful_modbus_api.profiler import Profiler, Profile, PHASES
+from restful_modbus_api.tests.conftest import CODE, schedule
+
+
+###############################################################################
+def test_0100_sampling_and_window():
+    profiler = Profiler(sample_rate=0, window=2)
+    assert profiler.start() is None
+    assert profiler.report('test') is None
+    profiler.sample_rate = 1
+    for i in range(3):
+        profile = profiler.start()
+        profile.call(2, 'read_coils', 0.001 * (i + 1))
+        profiler.record('test', profile)
+    report = profiler.report('test')
+    assert report['runs'] == 2
+    assert report['phases']['io']['max_ms'] == pytest.approx(3)
+    assert report['calls'][0]['count'] == 2
+    assert report['calls'][0]['code'] is None
+    profiler.record('test', None)
+    profiler.remove('test')
+    assert profiler.report('test') is None
+
+
+###############################################################################
+def test_0200_call_sites(collector, modbus_server):
+    collector.add_job_schedules([schedule('test', modbus_server)])
+    with pytest.raises(NotFound):
+        collector.get_profile('test')
+    collector.profiler.sample_rate = 1
+    collector.request_data('test')
+    collector.execute_script('test', 'test')
+
+    report = collector.get_profile('test')
+    assert report['runs'] == 2
+    assert set(report['phases']) == set(PHASES)
+    assert all(p['count'] == 2 for p in report['phases'].values())
+    source = collector.script_cache.get(
+        'test', 'test', collector.templates['test']['comm'], CODE).source
+    numbered = Collector.insert_number_each_line(source).split('\n')
+    calls = {c['code']: c for c in report['calls']}
+    assert set(calls) == {
+        "return read_holding_registers(address=address, count=1)",
+        "a = read_holding_registers('-a 40002 -c 2')",
+        "c = client.read_input_registers('-a 40004 -c 1')"}
+    for code, call in calls.items():
+        assert call['count'] == 2
+        assert f'{call["function"]}(' in code
+        assert numbered[call['line'] - 1].startswith(f'{call["line"]:04} ')
+        assert numbered[call['line'] - 1].endswith(code)
+
+
+###############################################################################
+def test_0300_endpoint():
+    from restful_modbus_api.app import app
+    from restful_modbus_api.modules.api.v1.api import bp
+    profiler = bp.gv['collector'].profiler
+    profile = Profile()
+    profile.add('decode', 0.001)
+    profiler.record('profile-test', profile)
+    with app.test_client() as client:
+        response = client.get('/api/v1/debug/profile/profile-test')
+        assert response.status_code == 200
+        assert response.json['runs'] == 1
+        assert client.get('/api/v1/debug/profile/none').status_code == 404
+    profiler.remove('profile-test')
@@ -0,0 +1,125 @@
+import asyncio
+import pytest
+from restful_modbus_api.modbus_handler.pool import ConnectionPool
+from restful_modbus_api.modbus_handler.planner import (
+    ReadPlanner, PlannedClient, AsyncPlannedClient)
+
+CODE = '''def main():
+    a = read_holding_registers('-a 40021 -c 1')
+    b = read_holding_registers('-a 40022 -c 1')
+    c = read_holding_registers('-a 40025 -c 2')
+    d = read_holding_registers('-a 40022 -c 2 -i 1')
+    e = read_coils('-a 3 -c 5')
+    f = read_coils('-a 6 -c 12')
+    g = read_input_registers(f'-a {40001} -c 1')
+    return a + b + c + d + e + f + g
+'''
+
+
+###############################################################################
+class CountingClient:
+    def __init__(self, client):
+        self.client = client
+        self.requests = list()
+
+    def __getattr__(self, item):
+        def func(command=None, **kwargs):
+            self.requests.append((item, command or kwargs))
+            return getattr(self.client, item)(command, **kwargs)
+        return func
+
+
+###############################################################################
+def test_0100_plan_contiguous():
+    plan = ReadPlanner().make_plan(CODE)
+    block, offset, count = plan.get('read_holding_registers', '-a 40022 -c 1')
+    assert (block.address, block.count, offset, count) == (40021, 2, 1, 1)
+    # apart from the block, the other unit and not constant commands
+    assert plan.get('read_holding_registers', '-a 40025 -c 2') is None
+    assert plan.get('read_holding_registers', '-a 40022 -c 2 -i 1') is None
+    assert plan.get('read_input_registers', '-a 40001 -c 1') is None
+
+    block, offset, count = plan.get('read_coils', '-a 6 -c 12')
+    assert (block.address, block.count, offset, count) == (3, 15, 3, 12)
+
+
+###############################################################################
+def test_0110_plan_gap_and_limit():
+    plan = ReadPlanner(max_gap=2).make_plan(CODE)
+    block, _, _ = plan.get('read_holding_registers', '-a 40025 -c 2')
+    assert (block.address, block.count) == (40021, 6)
+
+    code = ("read_holding_registers('-a 0 -c 100')\n"
+            "read_holding_registers('-a 100 -c 26')\n")
+    assert not ReadPlanner().make_plan(code)
+    assert not ReadPlanner(max_gap=-1).make_plan(CODE)
+
+
+###############################################################################
+@pytest.mark.parametrize('gap', [0, 2])
+def test_0200_planned_client(modbus_server, gap):
+    host, port = modbus_server
+    pool = ConnectionPool()
+    plan = ReadPlanner(max_gap=gap).make_plan(CODE)
+    reads = [('read_holding_registers', '-a 40021 -c 1'),
+             ('read_holding_registers', '-a 40022 -c 1'),
+             ('read_holding_registers', '-a 40025 -c 2'),
+             ('read_coils', '-a 3 -c 5'),
+             ('read_coils', '-a 6 -c 12')]
+    with pool.connection(host, port, 'tcp') as client:
+        expected = [getattr(client, f)(c) for f, c in reads]
+        counting = CountingClient(client)
+        planned = PlannedClient(counting, plan)
+        assert [getattr(planned, f)(c) for f, c in reads] == expected
+    assert len(counting.requests) == (3 if gap == 0 else 2)
+    pool.close()
+
+
+###############################################################################
+class ChangingClient:
+    """
+    the registers counting the reads of the device
+    """
+    def __init__(self):
+        self.reads = 0
+
+    def read_holding_registers(self, command=None, address=None, count=None,
+                               unit=0):
+        self.reads += 1
+        return self.reads.to_bytes(2, 'big') * count
+
+
+###############################################################################
+def test_0210_polled_again():
+    # a status polled until it changes
+    code = ("def main():\n"
+            "    while read_holding_registers('-a 40001 -c 1') != b'\\0\\3':\n"
+            "        time.sleep(1)\n"
+            "    return read_holding_registers('-a 40002 -c 1')\n")
+    plan = ReadPlanner().make_plan(code)
+    planned = PlannedClient(ChangingClient(), plan)
+    values = [planned.read_holding_registers('-a 40001 -c 1')
+              for _ in range(3)]
+    # the same read returns the new value of the device each time
+    assert values == [b'\0\1', b'\0\2', b'\0\3']
+    # the other read of the block is served by the last block read
+    assert planned.read_holding_registers('-a 40002 -c 1') == b'\0\3'
+    assert planned.client.reads == 3
+
+
+###############################################################################
+def test_0220_async_polled_again():
+    class AsyncChangingClient(ChangingClient):
+        async def read_holding_registers(self, command=None, **kwargs):
+            return ChangingClient.read_holding_registers(
+                self, command, **kwargs)
+
+    plan = ReadPlanner().make_plan(
+        "a = read_holding_registers('-a 40001 -c 1')\n"
+        "b = read_holding_registers('-a 40002 -c 1')\n")
+    planned = AsyncPlannedClient(AsyncChangingClient(), plan)
+
+    async def poll():
+        return [await planned.read_holding_registers('-a 40001 -c 1')
+                for _ in range(2)]
+    assert asyncio.run(poll()) == [b'\0\1', b'\0\2']
@@ -0,0 +1,42 @@
+from restful_modbus_api.manager import ScriptCache
+
+COMM = {'type': 'tcp', 'setting': {'host': 'localhost', 'port': 502}}
+CODE = '''def main():
+    return (kwargs.get('abc', 1)).to_bytes(2, 'big')
+'''
+
+
+###############################################################################
+def test_0100_script_cache_hit():
+    cache = ScriptCache()
+    first = cache.get('test-1', 'template', COMM, CODE)
+    second = cache.get('test-1', 'template', COMM, CODE)
+    assert first is second
+    assert cache.stats() == dict(hits=1, misses=1, size=1)
+
+
+###############################################################################
+def test_0110_script_cache_key():
+    cache = ScriptCache()
+    cache.get('test-1', 'template', COMM, CODE)
+    cache.get('test-1', 'other', COMM, CODE)
+    comm = {'type': 'rtu-over-tcp',
+            'setting': {'host': 'localhost', 'port': 1502}}
+    cache.get('test-1', 'template', comm, CODE)
+    # the code is changed under the same key
+    cache.get('test-1', 'template', COMM, CODE + '\n')
+    assert cache.stats() == dict(hits=0, misses=4, size=3)
+
+
+###############################################################################
+def test_0120_script_cache_invalidate():
+    cache = ScriptCache()
+    cache.get('test-1', 'template', COMM, CODE)
+    cache.get('test-2', 'template', COMM, CODE)
+    cache.invalidate('test-1')
+    assert cache.stats()['size'] == 1
+
+    cache.get('test-1', 'template', COMM, CODE)
+    assert cache.stats()['misses'] == 3
+    cache.invalidate()
+    assert cache.stats()['size'] == 0
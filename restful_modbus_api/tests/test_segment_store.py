@@ -0,0 +1,133 @@
+import os
+import pytest
+from restful_modbus_api.history import HistoryStore, make_sample
+from restful_modbus_api.segment_store import SegmentStore
+
+TEMPLATE = [
+    {'key': 'data01', 'note': None, 'type': 'B16_UINT', 'scale': 0.1},
+    {'key': 'data02', 'note': None, 'type': 'B8_STRING', 'scale': None},
+]
+TIMESTAMP = 1613616084.0
+
+
+###############################################################################
+def fill(store, count, name='test'):
+    for i in range(count):
+        store.append(name, TEMPLATE, i.to_bytes(2, 'big') + b'A',
+                     TIMESTAMP + i)
+
+
+###############################################################################
+@pytest.fixture(params=['memory', 'disk'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        yield HistoryStore(depth=10)
+        return
+    store = SegmentStore(str(tmp_path), records_per_segment=3, depth=10)
+    yield store
+    store.close()
+
+
+###############################################################################
+def test_0100_same_api(store):
+    with pytest.raises(KeyError):
+        store.get_all('test')
+    fill(store, 8)
+    assert 'test' in store
+    result = store.get_all('test')
+    assert [r['data']['data01']['raw'] for r in result] == \
+        list(range(7, -1, -1))
+    assert result[0] == make_sample(
+        b'\x00\x07A', TEMPLATE, TIMESTAMP + 7, seq=8)
+
+    result = store.query('test', since=TIMESTAMP + 2, until=TIMESTAMP + 5)
+    assert [r['data']['data01']['raw'] for r in result] == [5, 4, 3, 2]
+    result = store.query('test', since=TIMESTAMP + 2, limit=2)
+    assert [r['data']['data01']['raw'] for r in result] == [7, 6]
+    assert [] == store.query('test', since=TIMESTAMP + 100)
+
+    assert store.pop_last('test')['data']['data01']['raw'] == 7
+    assert store.pop_last('test') is None
+    assert store.remove('test')
+    if isinstance(store, SegmentStore):
+        # kept on the disk unless it is deleted
+        assert 'test' in store
+        assert store.remove('test', delete=True)
+    assert 'test' not in store
+
+
+###############################################################################
+def test_0200_reopen_and_template(tmp_path):
+    store = SegmentStore(str(tmp_path), records_per_segment=3)
+    fill(store, 4)
+    store.append('test', TEMPLATE[:1], b'\x00\x09', TIMESTAMP + 10)
+    # a longer data than the template
+    store.append('test', TEMPLATE[:1], b'\x00\x0a\xff', TIMESTAMP + 11)
+    store.close()
+
+    store = SegmentStore(str(tmp_path), records_per_segment=3)
+    result = store.get_all('test')
+    assert [r['hex'] for r in result[:3]] == \
+        ['00 0a ff', '00 09', '00 03 41']
+    assert 'data02' not in result[0]['data']
+    assert result[2] == make_sample(
+        b'\x00\x03A', TEMPLATE, TIMESTAMP + 3, seq=4)
+    fill(store, 1)
+    assert 7 == len(store.get_all('test'))
+    store.close()
+
+
+###############################################################################
+def test_0210_retention(tmp_path):
+    store = SegmentStore(str(tmp_path), records_per_segment=2,
+                         retention_seconds=3)
+    fill(store, 9)
+    # the segments of 8, 6-7 and 4-5 are kept
+    result = store.get_all('test')
+    assert [r['data']['data01']['raw'] for r in result] == \
+        [8, 7, 6, 5, 4]
+    directory = store._directory('test')
+    assert 3 == len(os.listdir(directory))
+
+    # expired while the schedule is appended without rolling
+    store = SegmentStore(str(tmp_path), records_per_segment=2,
+                         retention_seconds=3)
+    fill(store, 3, name='slow')
+    assert 2 == len(os.listdir(store._directory('slow')))
+    store.append('slow', TEMPLATE, b'\x00\x09A', TIMESTAMP + 10)
+    assert 1 == len(os.listdir(store._directory('slow')))
+    assert [9, 2] == [r['data']['data01']['raw']
+                      for r in store.get_all('slow')]
+    store.close()
+
+    store = SegmentStore(str(tmp_path), records_per_segment=2,
+                         retention_bytes=1)
+    fill(store, 5, name='other')
+    assert 1 == len(store.get_all('other'))
+    store.close()
+
+
+###############################################################################
+def test_0300_snapshot(store):
+    fill(store, 4)
+    fill(store, 1, name='other')
+    snapshot = store.snapshot(['test', 'other', 'none'])
+    assert snapshot['test'] == make_sample(
+        b'\x00\x03A', TEMPLATE, TIMESTAMP + 3, seq=4)
+    assert snapshot['other']['seq'] == 1
+    assert snapshot['none'] is None
+    assert store.pop_last('test')['seq'] == 4
+
+
+###############################################################################
+def test_0400_read_while_appended(tmp_path):
+    store = SegmentStore(str(tmp_path), records_per_segment=4)
+    fill(store, 6)
+    segments = list(store._schedules['test'].segments)
+    fill(store, 3)
+    # the records appended after the segments are taken are not read
+    segment = store._open(segments[-1])
+    assert 2 == segment.count
+    segment.close()
+    assert 9 == len(store.query('test'))
+    store.close()
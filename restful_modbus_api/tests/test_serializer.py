@@ -0,0 +1,95 @@
+import json
+from restful_modbus_api.manager import Collector
+from restful_modbus_api.serializer import FragmentCache, dumps, join
+
+TEMPLATE = [
+    dict(note='unsigned', type='B16_UINT', key='data01', scale=1),
+    dict(note='string', type='B8_STRING', key='data02', scale=None),
+]
+
+
+###############################################################################
+def sample(i):
+    return i.to_bytes(2, 'big') + b'A'
+
+
+###############################################################################
+def test_0100_dumps():
+    value = dict(b=[1, 0.5, None], a='가')
+    assert json.loads(dumps(value)) == value
+    assert dumps(value).startswith(b'{"a":')
+    assert join([b'1', b'{}']) == b'[1,{}]'
+    assert join([]) == b'[]'
+
+
+###############################################################################
+def test_0110_fragment_cache():
+    cache = FragmentCache(depth=2)
+    for seq in range(1, 4):
+        cache.put('test', seq, str(seq).encode())
+    assert cache.get('test', 1) is None
+    assert cache.get('test', 3) == b'3'
+    assert cache.stats() == dict(hits=1, misses=1, size=2, bytes=2)
+    cache.remove('test')
+    assert cache.get('test', 3) is None
+
+
+###############################################################################
+def test_0200_collector_encoded():
+    collector = Collector()
+    for i in range(3):
+        collector.store_data('test', 'test', sample(i), TEMPLATE, 0)
+    assert json.loads(collector.get_all_data(
+        'test', encoding='application/json')) == collector.get_all_data('test')
+    assert json.loads(collector.get_data(
+        'test', since='1', encoding='application/json')) == collector.get_data(
+        'test', since='1')
+    assert collector.fragments.stats()['hits'] == 5
+    collector.shutdown()
+
+
+###############################################################################
+def test_0210_etag():
+    from restful_modbus_api.app import app
+    from restful_modbus_api.modules.api.v1.api import bp
+    collector = bp.gv['collector']
+    url = '/api/v1/schedules/etag-test/data'
+    collector.store_data('etag-test', 'test', sample(1), TEMPLATE, 0)
+    with app.test_client() as client:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json == collector.get_all_data('etag-test')
+        etag = response.headers['ETag']
+
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert not response.data
+        response = client.get(f'{url}?limit=1',
+                              headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+        collector.store_data('etag-test', 'test', sample(2), TEMPLATE, 0)
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json[0]['seq'] == 2
+    collector.history.remove('etag-test')
+
+
+###############################################################################
+def test_0220_accept():
+    from restful_modbus_api.app import app
+    from restful_modbus_api.modules.api.v1.api import bp
+    collector = bp.gv['collector']
+    url = '/api/v1/schedules/accept-test/data'
+    collector.store_data('accept-test', 'test', sample(1), TEMPLATE, 0)
+    with app.test_client() as client:
+        response = client.get(url, headers={'Accept': 'application/x-npy'})
+        assert response.mimetype == 'application/x-npy'
+        assert response.data.startswith(b'\x93NUMPY')
+        response = client.get(
+            url, headers={'Accept': 'application/msgpack, */*;q=0.1'})
+        assert response.mimetype == 'application/msgpack'
+        assert response.headers['Vary'] == 'Accept'
+        response = client.get(url, headers={'Accept': 'text/csv'})
+        assert response.status_code == 406
+    collector.history.remove('accept-test')
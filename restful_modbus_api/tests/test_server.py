@@ -0,0 +1,69 @@
+import json
+import signal
+import socket
+import time
+import urllib.request
+import pytest
+from restful_modbus_api.manager import Collector, NotFound
+from restful_modbus_api.server import (
+    connect_collector, start_collector_server, start_workers, stop_workers)
+
+TEMPLATE = [
+    dict(note='unsigned', type='B16_UINT', key='data01', scale=1),
+]
+
+
+###############################################################################
+@pytest.fixture
+def collector():
+    collector = Collector()
+    yield collector
+    collector.shutdown()
+
+
+###############################################################################
+def test_0100_remote_collector(collector):
+    remote = connect_collector(*start_collector_server(collector))
+    with pytest.raises(NotFound):
+        remote.get_all_data('test')
+    collector.store_data('test', 'test', b'\x00\x01', TEMPLATE, 0)
+    assert remote.get_all_data('test') == collector.get_all_data('test')
+    assert json.loads(remote.get_data(
+        'test', since='0', encoding='application/json'))[0]['seq'] == 1
+
+    subscriber = remote.broker.subscribe(['test'])
+    assert collector.broker.has_subscribers('test')
+    collector.store_data('test', 'test', b'\x00\x02', TEMPLATE, 0)
+    assert b'"seq":2' in subscriber.get(timeout=1)
+    assert subscriber.dropped == 0
+    remote.broker.unsubscribe(subscriber)
+    assert not collector.broker.has_subscribers('test')
+
+
+###############################################################################
+def test_0200_workers(collector):
+    collector.store_data('test', 'test', b'\x00\x01', TEMPLATE, 0)
+    listener = socket.create_server(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    address, authkey = start_collector_server(collector)
+    processes = start_workers(address, authkey, listener, 2)
+    url = f'http://127.0.0.1:{port}/api/v1/schedules/test/data'
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    data = json.loads(response.read())
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.2)
+        assert data == json.loads(json.dumps(collector.get_all_data('test')))
+        # only the collector process schedules the jobs
+        assert all(p.is_alive() for p in processes)
+    finally:
+        stop_workers(processes)
+        listener.close()
+    # stopped by SIGTERM, not killed
+    assert all(p.exitcode != -signal.SIGKILL for p in processes)
@@ -0,0 +1,83 @@
+import struct
+import pytest
+from restful_modbus_api.modbus_handler import (
+    DataType, decode_with_records, get_json_data_with_template,
+    get_template_decoder)
+
+TEMPLATE = [
+    {'key': 'boolean', 'note': None, 'type': 'BIT1_BOOLEAN', 'scale': None},
+    {'key': 'bits', 'note': 'bits', 'type': 'BIT8', 'scale': None},
+    {'key': 'u8', 'note': None, 'type': 'B8_UINT', 'scale': 2},
+    {'key': 'i8', 'note': None, 'type': 'B8_INT', 'scale': None},
+    {'key': 'u16', 'note': None, 'type': 'B16_UINT', 'scale': 0.1},
+    {'key': 'i16', 'note': None, 'type': 'B16_INT', 'scale': 0},
+    {'key': 'u32', 'note': None, 'type': 'B32_UINT', 'scale': None},
+    {'key': 'i32', 'note': None, 'type': 'B32_INT', 'scale': 'x'},
+    {'key': 'u64', 'note': None, 'type': 'B64_UINT', 'scale': None},
+    {'key': 'i64', 'note': None, 'type': 'B64_INT', 'scale': -1},
+    {'key': 'f16', 'note': None, 'type': 'B16_FLOAT', 'scale': None},
+    {'key': 'f32', 'note': None, 'type': 'B32_FLOAT', 'scale': 10},
+    {'key': 'f64', 'note': None, 'type': 'B64_FLOAT', 'scale': None},
+    {'key': 's8', 'note': None, 'type': 'B8_STRING', 'scale': None},
+    {'key': 's16', 'note': None, 'type': 'B16_STRING', 'scale': None},
+    {'key': 's32', 'note': None, 'type': 'B32_STRING', 'scale': 3},
+    {'key': 's64', 'note': None, 'type': 'B64_STRING', 'scale': None},
+]
+
+DATA = (b'\x01\x05\xff\x80\x12\x34\xfe\xdc\x00\x01\x02\x03\xff\xff\xff\xfe'
+        b'\x00\x00\x00\x00\x00\x00\x01\x00\xff\xff\xff\xff\xff\xff\xff\xf0'
+        + struct.pack('>e', 1.5) + struct.pack('>f', 2.25)
+        + struct.pack('>d', -3.5) + b'AbcUnit23-ABCDE')
+
+
+###############################################################################
+def strip_datetime(result):
+    result.pop('datetime')
+    return result
+
+
+###############################################################################
+def test_0100_same_as_records():
+    assert sum(DataType[t['type']].value['length'] for t in TEMPLATE) \
+        == len(DATA)
+    expected = strip_datetime(decode_with_records(DATA, TEMPLATE))
+    result = strip_datetime(get_json_data_with_template(DATA, TEMPLATE))
+    assert result == expected
+    assert list(result['data']) == list(expected['data'])
+    assert result['data']['u64']['hex'] == '0000 0000 0000 0100'
+
+
+###############################################################################
+@pytest.mark.parametrize('size', [0, 5, len(DATA) - 1])
+def test_0110_short_data(size):
+    template = TEMPLATE[1:]
+    data = DATA[1:size]
+    expected = strip_datetime(decode_with_records(data, template))
+    result = strip_datetime(get_json_data_with_template(data, template))
+    assert result == expected
+
+
+###############################################################################
+def test_0120_cached_per_template():
+    decoder = get_template_decoder(TEMPLATE)
+    assert get_template_decoder([dict(t) for t in TEMPLATE]) is decoder
+    changed = [dict(t) for t in TEMPLATE]
+    changed[2]['type'] = 'B8_INT'
+    assert get_template_decoder(changed) is not decoder
+    assert get_template_decoder([{'key': 'a', 'type': 'NONE',
+                                  'note': None, 'scale': None}]) is None
+
+
+###############################################################################
+@pytest.mark.parametrize('size', [len(DATA), 10])
+def test_0200_selected(size):
+    data = DATA[:size]
+    full = get_json_data_with_template(data, TEMPLATE, 0)['data']
+    keys, attrs = frozenset(['u8', 'f32', 's64']), ('value', 'hex')
+    selected = get_json_data_with_template(data, TEMPLATE, 0, keys, attrs)
+    assert selected['data'] == {
+        key: {attr: full[key][attr] for attr in attrs}
+        for key in full if key in keys}
+    assert list(selected['data']) == ['u8', 'f32', 's64']
+    records = get_json_data_with_template(data, TEMPLATE, 0, None, None)
+    assert records['data'] == full